@@ -1,37 +1,45 @@
 # app/api/v1/routes/minuta_routes.py
-from fastapi import APIRouter, UploadFile, File, Form, Depends, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, Form, Depends, BackgroundTasks, Query, Header, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-import httpx
-import logging
-
-logger = logging.getLogger(__name__)
 
 from app.db.session import get_db
-from app.controllers.minuta_controller import extract_minuta
+from app.controllers.minuta_controller import extract_minuta, get_minuta_job, submit_minuta_job
 from app.schemas.minuta_schema import MinutaExtractResponse
+from app.services.minuta_idempotency import EJECUTADA
+from app.services.orchestrator_client import notify_orchestrator
 
 router = APIRouter(prefix="/api/v1/minutas", tags=["Minutas"])
 
-async def notify_orchestrator(id_consulta: int):
-    url = f"http://161.132.68.187:8003/api/orchestrator/start/{id_consulta}"
-    try:
-        async with httpx.AsyncClient() as client:
-            await client.post(url, timeout=5.0)
-            logger.info(f"Orquestador notificado con id_consulta={id_consulta}")
-    except Exception as e:
-        logger.error(f"Error al notificar al Orquestador: {e}")
-
 @router.post("", response_model=MinutaExtractResponse)
 @router.post("/", response_model=MinutaExtractResponse)
 async def extract_endpoint(
     background_tasks: BackgroundTasks,
+    response: Response,
     co_cnl: str = Form(...),              # ejemplo: "0101"
     token: str = Form(None),              # Token de seguridad para el API
     file: UploadFile = File(...),
+    async_mode: bool = Query(False, alias="async"),  # true = 202 + job_id, ver /jobs/{job_id}
+    idempotency_key: str = Header(None),  # Idempotency-Key (opcional; por defecto archivo + co_cnl)
     db: Session = Depends(get_db),
 ):
-    payload = await extract_minuta(db=db, file=file, co_cnl=co_cnl, token=token)
-    
+    if async_mode:
+        job, origen = await submit_minuta_job(
+            db=db, file=file, co_cnl=co_cnl, token=token, idempotency_key=idempotency_key
+        )
+        headers = {"Location": job["status_url"]}
+        if origen != EJECUTADA:
+            headers["Idempotency-Replayed"] = "true"
+        return JSONResponse(status_code=202, content=job, headers=headers)
+
+    payload, origen = await extract_minuta(
+        db=db, file=file, co_cnl=co_cnl, token=token, idempotency_key=idempotency_key
+    )
+    if origen != EJECUTADA:
+        # Reintento: mismo id_consulta, el orquestador ya fue avisado por la ejecución original
+        response.headers["Idempotency-Replayed"] = "true"
+        return payload
+
     # Extraemos id_consulta para avisarle al orquestador en background
     if isinstance(payload, dict):
         try:
@@ -42,4 +50,11 @@ async def extract_endpoint(
             pass
 
     return payload
-    
+
+@router.get("/jobs/{job_id}")
+async def job_status_endpoint(
+    job_id: str,
+    token: str = Query(None, description="Token de seguridad con el que se envió la minuta"),
+    db: Session = Depends(get_db),
+):
+    return await get_minuta_job(db=db, job_id=job_id, token=token)
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, Query
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Query, Request
 from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.controllers.scan_controller import ScanController
@@ -18,20 +18,59 @@ async def scan_medio_pago(
     """
     return await ScanController.scan_medio_pago(token=token, file=file, referencia=referencia, db=db)
 
+@router.post("/multi")
+async def scan_multi(
+    token: str = Form(...),
+    files: list[UploadFile] = File(..., description="Vouchers de la misma operación"),
+    referencia: str = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Escanea varios vouchers enviando hasta SCAN_MULTI_IMAGES_PER_REQUEST imágenes
+    por llamada de visión (el prompt de instrucciones se paga una vez por grupo).
+    Cada imagen se guarda como su propio escaneo con su parte de los tokens;
+    data trae un resultado por archivo, en el mismo orden (con "error" si falló).
+    """
+    return await ScanController.scan_multi(token=token, files=files, referencia=referencia, db=db)
+
+@router.post("/batch")
+async def scan_batch(
+    token: str = Form(...),
+    files: list[UploadFile] = File(..., description="Vouchers a escanear"),
+    referencia: str = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Escanea N vouchers con una llamada de visión por imagen, hasta
+    SCAN_BATCH_CONCURRENCY en paralelo. Respuesta NDJSON: una línea por imagen
+    apenas está lista ("indice" = posición del archivo) y una línea final
+    {"resumen": {..., "id_escaneos": [...]}} cuando el lote quedó guardado
+    (todas las filas en una sola transacción).
+    """
+    return await ScanController.scan_batch(token=token, files=files, referencia=referencia, db=db)
+
 @router.get("/historial")
 def get_historial(
     limit: int = Query(10, ge=1, le=100, description="Cantidad de registros por página"),
     offset: int = Query(0, ge=0, description="Cantidad de registros a saltar"),
-    notaria: str = Query(None, description="Filtro parcial por notaría"),
-    referencia: str = Query(None, description="Filtro parcial por referencia"),
+    notaria: str = Query(None, description="Búsqueda por notaría (ignora tildes y mayúsculas; por palabras/prefijo, ver HISTORIAL_SEARCH_MODE)"),
+    referencia: str = Query(None, description="Búsqueda por referencia (ignora tildes y mayúsculas; por palabras/prefijo)"),
     medio_pago: str = Query(None, description="Filtro exacto por medio de pago"),
     banco: str = Query(None, description="Filtro exacto por banco"),
     fecha_desde: str = Query(None, description="Fecha de inicio (YYYY-MM-DD)"),
     fecha_hasta: str = Query(None, description="Fecha de fin (YYYY-MM-DD)"),
+    cursor: int = Query(None, ge=1, description="Paginación por cursor: id_escaneo de meta.next_cursor (ignora offset)"),
+    include_raw: bool = Query(False, description="Incluir raw_ai_response (JSON crudo de la IA) en cada fila"),
+    token: str = Query(None, description="Token de la notaría: firma url_imagen_firmada/url_miniatura de sus imágenes"),
     db: Session = Depends(get_db)
 ):
     """
     Obtiene el historial de TODOS los escaneos paginado con filtros dinámicos (Solo para Administrador).
+    Paginación por offset (compatibilidad) o por cursor: primera página sin cursor,
+    siguientes con cursor=meta.next_cursor (null cuando no hay más filas).
+    meta.total se cachea unos segundos (HISTORIAL_COUNT_TTL_S).
+    url_imagen_firmada / url_miniatura solo vienen con token y solo para las
+    imágenes de esa notaría (null en las demás).
     """
     return ScanController.get_historial(
         limit=limit, 
@@ -42,18 +81,71 @@ def get_historial(
         banco=banco,
         fecha_desde=fecha_desde,
         fecha_hasta=fecha_hasta,
-        db=db
+        db=db,
+        include_raw=include_raw,
+        cursor=cursor,
+        token=token
+    )
+
+@router.get("/historial/export")
+def export_historial(
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Formato de salida: ndjson o csv"),
+    notaria: str = Query(None, description="Búsqueda por notaría (igual que /historial)"),
+    referencia: str = Query(None, description="Búsqueda por referencia (igual que /historial)"),
+    medio_pago: str = Query(None, description="Filtro exacto por medio de pago"),
+    banco: str = Query(None, description="Filtro exacto por banco"),
+    fecha_desde: str = Query(None, description="Fecha de inicio (YYYY-MM-DD)"),
+    fecha_hasta: str = Query(None, description="Fecha de fin (YYYY-MM-DD)"),
+    include_raw: bool = Query(False, description="Incluir raw_ai_response (JSON crudo de la IA)"),
+    token: str = Query(None, description="Token de la notaría: firma las URLs de sus imágenes (igual que /historial)"),
+):
+    """
+    Exporta el historial completo de escaneos (Solo para Administrador) como stream
+    NDJSON o CSV, más recientes primero. Reemplaza paginar /historial de 100 en 100:
+    una sola lectura con cursor del lado del servidor y memoria constante.
+    """
+    return ScanController.export_historial(
+        formato=formato,
+        notaria=notaria,
+        referencia=referencia,
+        medio_pago=medio_pago,
+        banco=banco,
+        fecha_desde=fecha_desde,
+        fecha_hasta=fecha_hasta,
+        include_raw=include_raw,
+        token=token
     )
 
 @router.get("/image/{filename}")
 def get_image(
     filename: str,
-    token: str = Query(..., description="Token de seguridad de la notaría dueña de la imagen"),
+    request: Request,
+    token: str = Query(None, description="Token de seguridad de la notaría dueña de la imagen"),
+    exp: int = Query(None, description="Expiración (epoch) de la URL firmada"),
+    sig: str = Query(None, description="Firma de la URL (url_imagen_firmada del historial)"),
     db: Session = Depends(get_db)
 ):
     """
     Despacha la imagen física si y solo si el token provisto pertenece a la notaría
     que subió la imagen. Protege contra accesos no autorizados.
+    Alternativa sin BD: la URL firmada (exp + sig) que entrega el historial.
+    Soporta ETag / Last-Modified (304) y Range.
     """
-    return ScanController.get_image(filename=filename, token=token, db=db)
+    return ScanController.get_image(filename=filename, token=token, db=db, request=request, exp=exp, sig=sig)
 
+@router.get("/thumb/{size}/{filename}")
+def get_thumbnail(
+    size: str,
+    filename: str,
+    request: Request,
+    token: str = Query(None, description="Token de seguridad de la notaría dueña de la imagen"),
+    exp: int = Query(None, description="Expiración (epoch) de la URL firmada"),
+    sig: str = Query(None, description="Firma de la URL (url_miniatura del historial)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Miniatura WebP de una imagen de escaneo (size: sm=160px, md=480px de lado mayor).
+    Misma autorización que /image/{filename}; la firma de la imagen vale para sus miniaturas.
+    Se genera en la primera petición y queda en disco (assets/escaneos/thumbs).
+    """
+    return ScanController.get_thumbnail(filename=filename, size=size, token=token, db=db, request=request, exp=exp, sig=sig)
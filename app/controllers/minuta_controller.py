@@ -1,8 +1,60 @@
 # app/controllers/minuta_controller.py
-from fastapi import UploadFile
+from fastapi import UploadFile, HTTPException
 from sqlalchemy.orm import Session
+from app.core.security import get_token_authenticator
 from app.services.minuta_service import MinutaService
+from app.services.minuta_idempotency import EJECUTADA, build_idempotency_key, get_minuta_single_flight
+from app.services.minuta_jobs import ERROR, PENDIENTE, get_minuta_jobs
+from app.services.service_config import get_service_configs
 
-async def extract_minuta(db: Session, file: UploadFile, co_cnl: str, token: str = None) -> dict:
+async def extract_minuta(
+    db: Session, file: UploadFile, co_cnl: str, token: str = None, idempotency_key: str = None
+) -> tuple[dict, str]:
+    """Devuelve (respuesta, origen); origen != EJECUTADA si fue un reintento idempotente."""
     service = MinutaService(db)
-    return await service.extract(file=file, co_cnl=co_cnl, token=token)
+    return await service.extract_idempotent(
+        file=file, co_cnl=co_cnl, token=token, idempotency_key=idempotency_key
+    )
+
+async def submit_minuta_job(
+    db: Session, file: UploadFile, co_cnl: str, token: str = None, idempotency_key: str = None
+) -> tuple[dict, str]:
+    """
+    Valida token, archivo y co_cnl y encola la extracción (modo asíncrono).
+    Un reintento con la misma clave devuelve el job ya encolado, salvo que
+    haya fallado o expirado.
+    """
+    service = MinutaService(db)
+    credencial, documento = await service.receive(file, token)
+    get_service_configs().get(db, co_cnl)  # 400/404 ahora y no dentro del job
+
+    jobs = get_minuta_jobs()
+    single_flight = get_minuta_single_flight()
+    key = "job|" + build_idempotency_key(token, documento.sha256, co_cnl, idempotency_key)
+    fingerprint = f"{documento.sha256}|{co_cnl}"
+
+    async def submit() -> str:
+        return (await jobs.submit(documento, co_cnl, credencial)).job_id
+
+    job_id, origen = await single_flight.run(key, submit, fingerprint=fingerprint)
+    job = await jobs.get(job_id)
+    if origen != EJECUTADA and (job is None or job.estado == ERROR):
+        single_flight.forget(key)
+        job_id, origen = await single_flight.run(key, submit, fingerprint=fingerprint)
+        job = await jobs.get(job_id)
+
+    return {
+        "job_id": job_id,
+        "status": job.estado if job else PENDIENTE,
+        "status_url": f"/api/v1/minutas/jobs/{job_id}",
+    }, origen
+
+async def get_minuta_job(db: Session, job_id: str, token: str = None) -> dict:
+    """Estado del job, solo para la credencial que lo envió (404 para cualquier otra)."""
+    if not token:
+        raise HTTPException(status_code=400, detail="falta token")
+    credencial = get_token_authenticator().authenticate(db, token)
+    job = await get_minuta_jobs().get(job_id)
+    if job is None or job.credencial.co_credencial_seguridad != credencial.co_credencial_seguridad:
+        raise HTTPException(status_code=404, detail="Job no encontrado o expirado")
+    return job.to_status()
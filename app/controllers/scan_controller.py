@@ -1,5 +1,10 @@
 from sqlalchemy.orm import Session
-from fastapi import UploadFile
+from fastapi import UploadFile, HTTPException, Request
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
+import os
+import time
 from app.services.scan_service import ScanService
 
 class ScanController:
@@ -8,7 +13,17 @@ class ScanController:
         return await ScanService.scan_medio_pago(token=token, file=file, referencia=referencia, db=db)
 
     @staticmethod
-    def get_historial(limit: int, offset: int, notaria: str, referencia: str, medio_pago: str, banco: str, fecha_desde: str, fecha_hasta: str, db: Session):
+    async def scan_multi(token: str, files: list[UploadFile], referencia: str, db: Session):
+        return await ScanService.scan_multi(token=token, files=files, referencia=referencia, db=db)
+
+    @staticmethod
+    async def scan_batch(token: str, files: list[UploadFile], referencia: str, db: Session):
+        from fastapi.responses import StreamingResponse
+        lines = await ScanService.scan_batch(token=token, files=files, referencia=referencia, db=db)
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    @staticmethod
+    def get_historial(limit: int, offset: int, notaria: str, referencia: str, medio_pago: str, banco: str, fecha_desde: str, fecha_hasta: str, db: Session, include_raw: bool = False, cursor: int = None, token: str = None):
         return ScanService.get_historial(
             limit=limit, 
             offset=offset, 
@@ -18,11 +33,88 @@ class ScanController:
             banco=banco,
             fecha_desde=fecha_desde,
             fecha_hasta=fecha_hasta,
-            db=db
+            db=db,
+            include_raw=include_raw,
+            cursor=cursor,
+            token=token
+        )
+
+    @staticmethod
+    def export_historial(formato: str, notaria: str, referencia: str, medio_pago: str, banco: str, fecha_desde: str, fecha_hasta: str, include_raw: bool, token: str = None):
+        from fastapi.responses import StreamingResponse
+        lines = ScanService.export_historial(
+            formato=formato,
+            notaria=notaria,
+            referencia=referencia,
+            medio_pago=medio_pago,
+            banco=banco,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            include_raw=include_raw,
+            token=token
+        )
+        media_type = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+        filename = f"historial_escaneos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+        return StreamingResponse(
+            lines,
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
         )
 
     @staticmethod
-    def get_image(filename: str, token: str, db: Session):
-        from fastapi.responses import FileResponse
-        file_path = ScanService.get_image(filename=filename, token=token, db=db)
-        return FileResponse(file_path)
+    def get_image(filename: str, token: str, db: Session, request: Request = None, exp: int = None, sig: str = None):
+        file_path, cache_control = _authorize_image(filename, token, db, exp, sig)
+        return _cached_file_response(request, file_path, cache_control)
+
+    @staticmethod
+    def get_thumbnail(filename: str, size: str, token: str, db: Session, request: Request = None, exp: int = None, sig: str = None):
+        # misma autorización que la imagen original (token o URL firmada del archivo)
+        file_path, cache_control = _authorize_image(filename, token, db, exp, sig)
+        thumb_path = ScanService.get_thumbnail(file_path, size)
+        return _cached_file_response(request, thumb_path, cache_control)
+
+
+def _authorize_image(filename: str, token: str, db: Session, exp: int = None, sig: str = None):
+    """Ruta física de la imagen autorizada y el Cache-Control con que se sirve."""
+    if sig:
+        # URL firmada: se verifica sin BD y el navegador puede cachearla hasta exp
+        # (private: comprobantes financieros, nunca en caches compartidos)
+        file_path = ScanService.get_signed_image(filename=filename, exp=exp, sig=sig)
+        max_age = max(0, int(exp - time.time()))
+        return file_path, f"private, max-age={max_age}"
+    if not token:
+        raise HTTPException(status_code=401, detail="Token incorrecto o inactivo")
+    file_path = ScanService.get_image(filename=filename, token=token, db=db)
+    return file_path, "private, max-age=300"
+
+def _cached_file_response(request: Request | None, file_path: str, cache_control: str):
+    """
+    FileResponse con validadores (ETag de nombre + tamaño + mtime del archivo, sin
+    leerlo; Last-Modified) y 304 para If-None-Match / If-Modified-Since. Range lo
+    resuelve FileResponse. Basta porque los archivos de escaneo no se reescriben
+    (nombre único por subida).
+    """
+    from fastapi.responses import FileResponse, Response
+
+    stat = os.stat(file_path)
+    etag = '"' + hashlib.sha256(
+        f"{os.path.basename(file_path)}:{stat.st_size}:{int(stat.st_mtime)}".encode()
+    ).hexdigest()[:32] + '"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    headers = {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": cache_control}
+
+    if request is not None:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            if etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+                return Response(status_code=304, headers=headers)
+        else:
+            if_modified_since = request.headers.get("if-modified-since")
+            if if_modified_since:
+                try:
+                    if int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp():
+                        return Response(status_code=304, headers=headers)
+                except (TypeError, ValueError):
+                    pass
+
+    return FileResponse(file_path, headers=headers)
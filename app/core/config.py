@@ -9,6 +9,10 @@ class Settings(BaseSettings):
     # --- OpenAI ---
     openai_api_key: str | None = Field(default=None, validation_alias="OPENAI_API_KEY")
     openai_model: str = Field(default="gpt-4o-mini", validation_alias="OPENAI_MODEL")
+    # máximo de llamadas LLM simultáneas por worker (minutas + escaneos)
+    openai_max_concurrency: int = Field(default=32, validation_alias="OPENAI_MAX_CONCURRENCY")
+    openai_timeout_s: float = Field(default=120.0, validation_alias="OPENAI_TIMEOUT_S")
+    openai_max_retries: int = Field(default=2, validation_alias="OPENAI_MAX_RETRIES")
 
     # --- Database (MySQL) ---
     db_host: str = Field(default="localhost", validation_alias="DB_HOST")
@@ -19,6 +23,88 @@ class Settings(BaseSettings):
 
     # mysql driver: pymysql (sync) recomendado para empezar
     db_driver: str = Field(default="pymysql", validation_alias="DB_DRIVER")
+    # filas/bytes cargados por endpoint (ver /health/metrics). Diagnóstico: tiene
+    # costo por fila cargada, activarlo solo para medir
+    query_audit_enabled: bool = Field(default=False, validation_alias="QUERY_AUDIT_ENABLED")
+
+    # --- Cache de texto extraído (PDF/DOCX) ---
+    text_cache_max_items: int = Field(default=256, validation_alias="TEXT_CACHE_MAX_ITEMS")
+    # directorio opcional para el nivel en disco (vacío = solo memoria)
+    text_cache_dir: str | None = Field(default=None, validation_alias="TEXT_CACHE_DIR")
+    text_cache_max_disk_mb: int = Field(default=512, validation_alias="TEXT_CACHE_MAX_DISK_MB")
+
+    # --- Cache de respuestas del LLM (match exacto, SQLite local) ---
+    llm_cache_enabled: bool = Field(default=True, validation_alias="LLM_CACHE_ENABLED")
+    llm_cache_path: str = Field(default="cache/llm_responses.sqlite3", validation_alias="LLM_CACHE_PATH")
+    llm_cache_ttl_s: int = Field(default=7 * 24 * 3600, validation_alias="LLM_CACHE_TTL_S")
+    llm_cache_max_entries: int = Field(default=5000, validation_alias="LLM_CACHE_MAX_ENTRIES")
+
+    # --- Snapshot de catálogos (país, ocupación, CIIU, ...) ---
+    catalog_refresh_s: int = Field(default=600, validation_alias="CATALOG_REFRESH_S")
+    # confianza mínima (coseno de n-gramas) para el match difuso de Ocupación/CIIU
+    catalog_match_threshold: float = Field(default=0.45, validation_alias="CATALOG_MATCH_THRESHOLD")
+
+    # --- Configuración de servicios (prompt compilado + reglas por co_cnl) ---
+    service_config_ttl_s: int = Field(default=300, validation_alias="SERVICE_CONFIG_TTL_S")
+
+    # --- Autenticación por token (cache de credenciales resueltas) ---
+    # una revocación hecha fuera de la app (o en otro worker) tarda hasta esto en aplicarse
+    auth_cache_ttl_s: int = Field(default=60, validation_alias="AUTH_CACHE_TTL_S")
+    # tokens inválidos cacheados (0 = no cachear)
+    auth_negative_ttl_s: int = Field(default=30, validation_alias="AUTH_NEGATIVE_TTL_S")
+    # URLs firmadas de imágenes (vacío = desactivadas: las imágenes solo se sirven con token)
+    image_url_secret: str | None = Field(default=None, validation_alias="IMAGE_URL_SECRET")
+    image_url_ttl_s: int = Field(default=3600, validation_alias="IMAGE_URL_TTL_S")
+
+    # --- Blob store de binarios de minutas ("db" = tabla a_minuta_blob, "fs" = disco local) ---
+    blob_store_backend: str = Field(default="db", validation_alias="BLOB_STORE_BACKEND")
+    blob_store_dir: str = Field(default="storage/blobs", validation_alias="BLOB_STORE_DIR")
+
+    # --- Reintentos idempotentes de POST /api/v1/minutas (single-flight + respuesta guardada) ---
+    minuta_idempotency_enabled: bool = Field(default=True, validation_alias="MINUTA_IDEMPOTENCY_ENABLED")
+    minuta_idempotency_ttl_s: int = Field(default=600, validation_alias="MINUTA_IDEMPOTENCY_TTL_S")
+    minuta_idempotency_max_items: int = Field(default=1000, validation_alias="MINUTA_IDEMPOTENCY_MAX_ITEMS")
+
+    # --- Extracción asíncrona de minutas (POST /api/v1/minutas?async=true) ---
+    # "sql" = tabla a_minuta_job (varios nodos y workers); "memory" = cola en el proceso (un solo worker)
+    minuta_jobs_backend: str = Field(default="sql", validation_alias="MINUTA_JOBS_BACKEND")
+    minuta_jobs_workers: int = Field(default=4, validation_alias="MINUTA_JOBS_WORKERS")
+    minuta_jobs_max_pending: int = Field(default=100, validation_alias="MINUTA_JOBS_MAX_PENDING")
+    minuta_jobs_ttl_s: int = Field(default=3600, validation_alias="MINUTA_JOBS_TTL_S")
+    minuta_jobs_poll_s: float = Field(default=1.0, validation_alias="MINUTA_JOBS_POLL_S")
+    # avisar al orquestador al terminar un job con éxito
+    minuta_jobs_callback: bool = Field(default=True, validation_alias="MINUTA_JOBS_CALLBACK")
+
+    # --- Preprocesado de imágenes antes de la llamada de visión ---
+    scan_max_upload_mb: int = Field(default=15, validation_alias="SCAN_MAX_UPLOAD_MB")
+    scan_image_max_side: int = Field(default=1600, validation_alias="SCAN_IMAGE_MAX_SIDE")
+    scan_image_format: str = Field(default="JPEG", validation_alias="SCAN_IMAGE_FORMAT")  # JPEG | WEBP
+    scan_image_quality: int = Field(default=80, validation_alias="SCAN_IMAGE_QUALITY")
+    # auto = "low" si la imagen entra en 512x512, "high" si no
+    scan_image_detail: str = Field(default="auto", validation_alias="SCAN_IMAGE_DETAIL")
+
+    # --- Escaneo de varios vouchers (/scan/multi: varias imágenes por llamada de visión) ---
+    scan_multi_max_files: int = Field(default=20, validation_alias="SCAN_MULTI_MAX_FILES")
+    scan_multi_images_per_request: int = Field(default=4, validation_alias="SCAN_MULTI_IMAGES_PER_REQUEST")
+
+    # --- Lote de escaneos (/scan/batch: una llamada por imagen, en paralelo) ---
+    scan_batch_max_files: int = Field(default=50, validation_alias="SCAN_BATCH_MAX_FILES")
+    scan_batch_concurrency: int = Field(default=4, validation_alias="SCAN_BATCH_CONCURRENCY")
+
+    # --- Escaneos repetidos (misma notaría, copia exacta por SHA-256): se reutiliza la lectura ---
+    scan_dedup_enabled: bool = Field(default=True, validation_alias="SCAN_DEDUP_ENABLED")
+
+    # --- Persistencia de escaneos ---
+    # precios por token (p_parametro_sistema) cacheados en proceso
+    scan_pricing_ttl_s: int = Field(default=300, validation_alias="SCAN_PRICING_TTL_S")
+    # write-behind: responder sin esperar el INSERT (la respuesta no trae id_escaneo)
+    scan_write_behind: bool = Field(default=False, validation_alias="SCAN_WRITE_BEHIND")
+    scan_write_behind_max_pending: int = Field(default=1000, validation_alias="SCAN_WRITE_BEHIND_MAX_PENDING")
+
+    # --- Historial de escaneos ---
+    historial_count_ttl_s: int = Field(default=30, validation_alias="HISTORIAL_COUNT_TTL_S")
+    # búsqueda notaria/referencia: auto | fulltext | prefix | contains (LIKE '%x%', sin índice)
+    historial_search_mode: str = Field(default="auto", validation_alias="HISTORIAL_SEARCH_MODE")
 
     class Config:
         env_file = ".env"
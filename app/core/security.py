@@ -0,0 +1,211 @@
+# app/core/security.py
+"""
+Autenticación por token de API (h_credencial_seguridad).
+
+- Los tokens se buscan por no_token_hash (SHA-256 hex, columna generada e
+  indexada) en lugar de comparar el Text completo sin índice. La calcula
+  MySQL, también para altas y rotaciones hechas fuera de la aplicación.
+- Las credenciales resueltas (co_seguridad, nombre de notaría) quedan en un
+  cache TTL por hash: en el camino caliente la autenticación no toca la BD.
+- Los tokens inválidos también se cachean, con un TTL corto
+  (AUTH_NEGATIVE_TTL_S): un token erróneo o adivinado repetido no vuelve a
+  consultar la BD.
+- Altas y cambios de in_estado / no_token_api hechos vía ORM invalidan la
+  entrada (eventos de mapper), pero solo en el proceso que hizo el cambio.
+  Los hechos por SQL directo, o desde otro worker, no se ven hasta que vence
+  la entrada: una credencial revocada sigue autenticando hasta
+  AUTH_CACHE_TTL_S segundos, y un token recién dado de alta puede tardar
+  hasta AUTH_NEGATIVE_TTL_S si alguien lo probó antes.
+
+También firma (HMAC) las URLs de imágenes de escaneos que entrega el historial.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import time
+from dataclasses import dataclass
+from urllib.parse import quote
+
+from fastapi import HTTPException
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from app.models.minuta import HCredencialSeguridad, PSeguridad
+from app.utils.cache.lru import LRUCache
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256((token or "").encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class ResolvedCredential:
+    co_credencial_seguridad: int
+    co_seguridad: int
+    no_notaria: str | None
+
+
+class TokenAuthenticator:
+    def __init__(self, ttl_s: float = 60, max_items: int = 1024, negative_ttl_s: float = 30):
+        self._cache = LRUCache(max_items=max_items, ttl_s=ttl_s)
+        self._invalid = LRUCache(max_items=max_items, ttl_s=negative_ttl_s) if negative_ttl_s > 0 else None
+        self.db_lookups = 0
+
+    def _lookup(self, db: Session, token_hash: str) -> ResolvedCredential | None:
+        self.db_lookups += 1
+        stmt = (
+            select(
+                HCredencialSeguridad.co_credencial_seguridad,
+                HCredencialSeguridad.co_seguridad,
+                PSeguridad.name,
+            )
+            .join(PSeguridad, HCredencialSeguridad.co_seguridad == PSeguridad.co_seguridad)
+            .where(HCredencialSeguridad.in_estado == 1, HCredencialSeguridad.no_token_hash == token_hash)
+            .limit(1)
+        )
+        row = db.execute(stmt).first()
+        if row is None:
+            return None
+        return ResolvedCredential(
+            co_credencial_seguridad=row[0],
+            co_seguridad=row[1],
+            no_notaria=row[2],
+        )
+
+    def resolve(self, db: Session, token: str) -> ResolvedCredential | None:
+        """Credencial activa del token, o None (también cacheado, con TTL corto)."""
+        if not token:
+            return None
+        token_hash = hash_token(token)
+        cred = self._cache.get(token_hash)
+        if cred is not None:
+            return cred
+        if self._invalid is not None and token_hash in self._invalid:
+            return None
+        cred = self._lookup(db, token_hash)
+        if cred is not None:
+            self._cache.set(token_hash, cred)
+        elif self._invalid is not None:
+            self._invalid.set(token_hash, True)
+        return cred
+
+    def authenticate(
+        self,
+        db: Session,
+        token: str,
+        status_code: int = 400,
+        detail: str = "token incorrecto",
+    ) -> ResolvedCredential:
+        cred = self.resolve(db, token)
+        if cred is None:
+            raise HTTPException(status_code=status_code, detail=detail)
+        return cred
+
+    def invalidate(self, token_hash: str | None = None) -> None:
+        caches = [self._cache] + ([self._invalid] if self._invalid is not None else [])
+        for cache in caches:
+            if token_hash is None:
+                cache.clear()
+            else:
+                cache.pop(token_hash)
+
+    def stats(self) -> dict:
+        return {
+            **self._cache.stats(),
+            "invalid": self._invalid.stats() if self._invalid is not None else None,
+            "db_lookups": self.db_lookups,
+        }
+
+
+_authenticator: TokenAuthenticator | None = None
+
+
+def get_token_authenticator() -> TokenAuthenticator:
+    """Autenticador único por proceso."""
+    global _authenticator
+    if _authenticator is None:
+        from app.core.config import settings
+
+        _authenticator = TokenAuthenticator(
+            ttl_s=settings.auth_cache_ttl_s, negative_ttl_s=settings.auth_negative_ttl_s
+        )
+    return _authenticator
+
+
+# ── URLs firmadas de imágenes de escaneos ─────────────────────────────────────
+#
+# El historial entrega cada imagen como /api/v1/scan/image/<archivo>?exp=..&sig=..
+# La firma (HMAC-SHA256 de archivo + exp) se verifica sin BD. exp se redondea
+# a ventanas de IMAGE_URL_TTL_S para que la misma imagen tenga la misma URL
+# durante un rato y el navegador reutilice su cache. Requiere IMAGE_URL_SECRET:
+# sin él las URLs firmadas quedan desactivadas (no hay clave adivinable).
+
+IMAGE_URL_PREFIX = "/api/v1/scan/image/"
+THUMB_URL_PREFIX = "/api/v1/scan/thumb/"
+
+
+def signed_image_urls_enabled() -> bool:
+    """Sin IMAGE_URL_SECRET no se emiten ni aceptan URLs firmadas (solo acceso con token)."""
+    from app.core.config import settings
+
+    return bool(settings.image_url_secret)
+
+
+def _image_url_key() -> bytes:
+    from app.core.config import settings
+
+    if not settings.image_url_secret:
+        raise RuntimeError("IMAGE_URL_SECRET no configurado: URLs firmadas desactivadas")
+    return hashlib.sha256(settings.image_url_secret.encode("utf-8")).digest()
+
+
+def sign_image(filename: str, exp: int) -> str:
+    mac = hmac.new(_image_url_key(), f"{filename}\n{int(exp)}".encode("utf-8"), hashlib.sha256)
+    return base64.urlsafe_b64encode(mac.digest()).rstrip(b"=").decode("ascii")
+
+
+def image_url_expiry(now: float | None = None, ttl_s: int | None = None) -> int:
+    """Expiración entre ttl y 2*ttl desde ahora, estable dentro de cada ventana de ttl."""
+    from app.core.config import settings
+
+    ttl_s = ttl_s or settings.image_url_ttl_s
+    now = time.time() if now is None else now
+    return (int(now) // ttl_s + 2) * ttl_s
+
+
+def build_signed_image_url(filename: str, now: float | None = None, prefix: str = IMAGE_URL_PREFIX) -> str | None:
+    """
+    La firma cubre el archivo, no la ruta: sirve igual para la imagen y sus
+    miniaturas. None si las URLs firmadas están desactivadas.
+    """
+    if not signed_image_urls_enabled():
+        return None
+    exp = image_url_expiry(now)
+    return f"{prefix}{quote(filename)}?exp={exp}&sig={sign_image(filename, exp)}"
+
+
+def verify_image_signature(filename: str, exp: int | None, sig: str | None, now: float | None = None) -> bool:
+    if not filename or exp is None or not sig or not signed_image_urls_enabled():
+        return False
+    now = time.time() if now is None else now
+    if int(exp) < now:
+        return False
+    return hmac.compare_digest(sign_image(filename, exp), sig)
+
+
+# ── Invalidación del cache (altas/cambios vía ORM, solo en este proceso) ─────
+
+@event.listens_for(HCredencialSeguridad, "after_insert")
+@event.listens_for(HCredencialSeguridad, "after_update")
+@event.listens_for(HCredencialSeguridad, "after_delete")
+def _invalidate_credential(mapper, connection, target):
+    if _authenticator is None:
+        return
+    # no_token_hash la calcula la BD (expirada tras el flush): se deriva del token
+    history = inspect(target).attrs.no_token_api.history
+    tokens = {target.no_token_api, *(history.deleted or ())}
+    for token in tokens:
+        if token:
+            _authenticator.invalidate(hash_token(token))
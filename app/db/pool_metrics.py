@@ -0,0 +1,78 @@
+# app/db/pool_metrics.py
+"""
+Métricas del pool de conexiones de SQLAlchemy.
+
+Mide cuánto tiempo permanece cada conexión fuera del pool (checkout -> checkin).
+Sirve para verificar que ningún pipeline retiene la conexión mientras espera al LLM.
+"""
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# límites (ms) del histograma de tiempo retenido
+_BUCKETS_MS = (10, 50, 100, 500, 1000, 5000, 10000)
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engine: Engine | None = None
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.total_held_ms = 0.0
+            self.max_held_ms = 0.0
+            self.buckets = {f"<={b}ms": 0 for b in _BUCKETS_MS}
+            self.buckets[f">{_BUCKETS_MS[-1]}ms"] = 0
+
+    def attach(self, engine: Engine) -> "PoolMetrics":
+        self._engine = engine
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        return self
+
+    def _on_checkout(self, dbapi_conn, conn_record, conn_proxy) -> None:
+        conn_record.info["checkout_t0"] = time.perf_counter()
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_conn, conn_record) -> None:
+        t0 = conn_record.info.pop("checkout_t0", None)
+        if t0 is None:
+            return
+        held_ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self.checkins += 1
+            self.checked_out = max(0, self.checked_out - 1)
+            self.total_held_ms += held_ms
+            self.max_held_ms = max(self.max_held_ms, held_ms)
+            for b in _BUCKETS_MS:
+                if held_ms <= b:
+                    self.buckets[f"<={b}ms"] += 1
+                    break
+            else:
+                self.buckets[f">{_BUCKETS_MS[-1]}ms"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            out = {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "avg_held_ms": round(self.total_held_ms / self.checkins, 2) if self.checkins else 0.0,
+                "max_held_ms": round(self.max_held_ms, 2),
+                "held_ms_histogram": dict(self.buckets),
+            }
+        if self._engine is not None:
+            out["pool_status"] = self._engine.pool.status()
+        return out
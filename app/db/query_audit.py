@@ -0,0 +1,116 @@
+# app/db/query_audit.py
+"""
+Auditoría de lecturas ORM por endpoint: filas cargadas y bytes aproximados
+de sus columnas (str/bytes por longitud, JSON serializado, escalares 8 B).
+
+Sirve para comparar cuánto trae cada endpoint desde la BD, p.ej. antes y
+después de diferir columnas pesadas (LONGBLOB, LONGTEXT, JSON). Cuenta la
+carga inicial de cada instancia y las columnas diferidas que se cargan
+después. Las queries de solo columnas (sin entidades) no se cuentan.
+
+Es una herramienta de diagnóstico (QUERY_AUDIT_ENABLED, apagada por
+defecto): mide cada fila cargada, JSON incluido. La medición cierra al
+salir la respuesta del middleware, así que lo que leen las respuestas en
+streaming (NDJSON/CSV) después de ese punto no se cuenta.
+"""
+from __future__ import annotations
+
+import json
+import threading
+from contextvars import ContextVar
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import event
+from sqlalchemy.orm import Mapper
+
+
+def value_size(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (dict, list)):
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+    if isinstance(value, (int, float, Decimal, date, datetime)):
+        return 8
+    return len(str(value))
+
+
+class RequestAudit:
+    __slots__ = ("rows", "bytes")
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+
+
+class QueryAudit:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints: dict[str, dict] = {}
+        # acumulador de la petición en curso (propio de cada instancia)
+        self._current: ContextVar[RequestAudit | None] = ContextVar(f"query_audit_{id(self)}", default=None)
+
+    def attach(self, base) -> "QueryAudit":
+        event.listen(base, "load", self._on_load, propagate=True)
+        event.listen(base, "refresh", self._on_refresh, propagate=True)
+        return self
+
+    # ── eventos ORM ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _column_keys(state) -> list[str]:
+        mapper: Mapper = state.mapper
+        return [p.key for p in mapper.column_attrs]
+
+    def _on_load(self, target, context) -> None:
+        current = self._current.get()
+        if current is None:
+            return
+        state = target._sa_instance_state
+        loaded = state.dict
+        current.rows += 1
+        current.bytes += sum(value_size(loaded.get(k)) for k in self._column_keys(state) if k in loaded)
+
+    def _on_refresh(self, target, context, attrs) -> None:
+        current = self._current.get()
+        if current is None or not attrs:
+            return
+        loaded = target._sa_instance_state.dict
+        current.bytes += sum(value_size(loaded.get(k)) for k in attrs)
+
+    # ── ciclo de la petición ──────────────────────────────────────────────────
+
+    def begin(self):
+        """Abre la medición de una petición; devuelve el token para end()."""
+        return self._current.set(RequestAudit())
+
+    def end(self, token, endpoint: str) -> None:
+        current = self._current.get()
+        self._current.reset(token)
+        if current is None:
+            return
+        with self._lock:
+            s = self.endpoints.setdefault(endpoint, {"requests": 0, "rows": 0, "bytes": 0, "max_bytes": 0})
+            s["requests"] += 1
+            s["rows"] += current.rows
+            s["bytes"] += current.bytes
+            s["max_bytes"] = max(s["max_bytes"], current.bytes)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.endpoints.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                endpoint: {
+                    **s,
+                    "avg_rows": round(s["rows"] / s["requests"], 1) if s["requests"] else 0,
+                    "avg_bytes": round(s["bytes"] / s["requests"]) if s["requests"] else 0,
+                }
+                for endpoint, s in sorted(self.endpoints.items())
+            }
@@ -1,6 +1,9 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from app.core.config import settings
+from app.db.base import Base
+from app.db.pool_metrics import PoolMetrics
+from app.db.query_audit import QueryAudit
 
 engine = create_engine(
     settings.database_url,
@@ -8,6 +11,9 @@ engine = create_engine(
     future=True,
 )
 
+pool_metrics = PoolMetrics().attach(engine)
+query_audit = QueryAudit().attach(Base) if settings.query_audit_enabled else None
+
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
@@ -21,3 +27,17 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def release_connection(db: Session) -> None:
+    """
+    Termina la transacción de lectura y devuelve la conexión al pool
+    antes de una etapa larga sin BD (p.ej. la llamada al LLM).
+
+    Se usa close() y no commit(): close() deja los objetos ya cargados
+    como detached con sus columnas accesibles, mientras que commit() los
+    expiraría y el siguiente acceso volvería a pedir una conexión.
+    La Session sigue siendo usable: el siguiente query abre una unidad
+    de trabajo nueva (y corta) con otra conexión del pool.
+    """
+    db.close()
@@ -1,12 +1,24 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, Numeric, Text, ForeignKey, Float, JSON, func
+from sqlalchemy import Column, Computed, Integer, String, DateTime, Date, Numeric, Text, ForeignKey, Float, JSON, Index, func
 from sqlalchemy.dialects.mysql import LONGBLOB, LONGTEXT
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from datetime import datetime
 from app.db.base import Base
 
 class ConsultaMinuta(Base):
     """
     Tabla principal histórica de consultas de minutas procesadas.
+
+    Los binarios (DOCX subido y DOCX inteligente) viven en el blob store
+    (app/repositories/blob_repository.py); la fila solo guarda referencia y
+    tamaño. Las columnas LONGBLOB quedan como legado, diferidas: solo se leen
+    al acceder explícitamente (MinutaRepository.get_archivo / get_legasys).
+
+    DDL:
+      ALTER TABLE p_consulta_minuta
+        ADD COLUMN minuta_archivo_ref VARCHAR(80) NULL,
+        ADD COLUMN nu_archivo_bytes INT NULL,
+        ADD COLUMN minuta_legasys_ref VARCHAR(80) NULL,
+        ADD COLUMN nu_legasys_bytes INT NULL;
     """
     __tablename__ = "p_consulta_minuta"
 
@@ -14,11 +26,15 @@ class ConsultaMinuta(Base):
     co_cnl = Column(String(4), nullable=True)
     no_servicio = Column(String(255), nullable=True) # Acto.nombre_servicio
     fe_minuta = Column(Date, nullable=True)         # Acto.fecha_minuta
-    minuta_archivo = Column(LONGBLOB, nullable=True) # Archivo DOCX en binario
+    minuta_archivo = deferred(Column(LONGBLOB, nullable=True)) # Legado: DOCX en binario
+    minuta_archivo_ref = Column(String(80), nullable=True)     # Blob store: "<backend>:<sha256>"
+    nu_archivo_bytes = Column(Integer, nullable=True)
     estado_minuta = Column(String(50), nullable=True) # EXITO / ERROR / PROCESANDO
     co_seguridad = Column(Integer, nullable=True)
     no_notaria = Column(String(255), nullable=True)
-    minuta_legasys = Column(LONGBLOB, nullable=True) # Archivo DOCX Inteligente final
+    minuta_legasys = deferred(Column(LONGBLOB, nullable=True)) # Legado: DOCX Inteligente final
+    minuta_legasys_ref = Column(String(80), nullable=True)
+    nu_legasys_bytes = Column(Integer, nullable=True)
     estado_minuta_inteligente = Column(String(50), default="NO_INICIADO") # NO_INICIADO / PROCESANDO / EXITO / ERROR
     fe_creacion = Column(DateTime, default=datetime.now)
 
@@ -149,7 +165,7 @@ class MinutaAuditoria(Base):
     id_auditoria = Column(Integer, primary_key=True, autoincrement=True)
     id_consulta = Column(Integer, ForeignKey("p_consulta_minuta.id_consulta", ondelete="CASCADE"), nullable=False)
     
-    raw_json = Column(LONGTEXT)
+    raw_json = deferred(Column(LONGTEXT))  # pesado: solo se lee al acceder
     prompt_tokens = Column(Integer)
     completion_tokens = Column(Integer)
     model = Column(String(50))
@@ -196,6 +212,85 @@ class BienMinuta(Base):
     # Relación back
     consulta = relationship("ConsultaMinuta", back_populates="bienes")
 
+class MinutaBlob(Base):
+    """
+    Blob store en BD: contenido direccionado por SHA-256 (un mismo archivo
+    se guarda una sola vez), comprimido con zlib cuando reduce el tamaño.
+
+    DDL:
+      CREATE TABLE a_minuta_blob (
+        co_hash CHAR(64) PRIMARY KEY,
+        nu_bytes INT NOT NULL,
+        nu_bytes_almacenados INT NOT NULL,
+        tx_codec VARCHAR(10) NOT NULL,
+        contenido LONGBLOB NOT NULL,
+        fe_creacion DATETIME DEFAULT CURRENT_TIMESTAMP
+      );
+    """
+    __tablename__ = "a_minuta_blob"
+
+    co_hash = Column(String(64), primary_key=True)
+    nu_bytes = Column(Integer, nullable=False)              # tamaño original
+    nu_bytes_almacenados = Column(Integer, nullable=False)  # tamaño tras compresión
+    tx_codec = Column(String(10), nullable=False)           # "zlib" / "raw"
+    contenido = deferred(Column(LONGBLOB, nullable=False))
+    fe_creacion = Column(DateTime, default=datetime.now)
+
+class MinutaJob(Base):
+    """
+    Cola de jobs de extracción asíncrona (MINUTA_JOBS_BACKEND=sql): cualquier
+    nodo encola y cualquier nodo procesa. El archivo subido vive en el blob
+    store (documento_ref); el texto ya extraído se guarda para no re-parsear.
+    Un worker toma un job con UPDATE ... WHERE tx_estado='PENDIENTE' (si otro
+    nodo lo tomó antes, rowcount = 0 y pasa al siguiente).
+    id_consulta se anota apenas se guarda p_consulta_minuta: un job re-encolado
+    por vencido que ya lo tiene se cierra sin volver a llamar al LLM.
+
+    DDL:
+      CREATE TABLE a_minuta_job (
+        co_job CHAR(32) PRIMARY KEY,
+        co_cnl VARCHAR(4) NOT NULL,
+        co_credencial_seguridad INT NOT NULL,
+        co_seguridad INT NOT NULL,
+        no_notaria VARCHAR(255) NULL,
+        fe_minuta_hint VARCHAR(20) NULL,
+        tx_estado VARCHAR(20) NOT NULL,
+        documento_ref VARCHAR(80) NOT NULL,
+        co_sha256 CHAR(64) NOT NULL,
+        tx_content_type VARCHAR(120) NULL,
+        contenido LONGTEXT NULL,
+        resultado JSON NULL,
+        error JSON NULL,
+        fe_creacion DATETIME NOT NULL,
+        fe_inicio DATETIME NULL,
+        fe_fin DATETIME NULL,
+        id_consulta INT NULL,
+        INDEX ix_minuta_job_estado (tx_estado, fe_creacion)
+      );
+    Si la tabla ya existía:
+      ALTER TABLE a_minuta_job ADD COLUMN id_consulta INT NULL;
+    """
+    __tablename__ = "a_minuta_job"
+    __table_args__ = (Index("ix_minuta_job_estado", "tx_estado", "fe_creacion"),)
+
+    co_job = Column(String(32), primary_key=True)
+    co_cnl = Column(String(4), nullable=False)
+    co_credencial_seguridad = Column(Integer, nullable=False)
+    co_seguridad = Column(Integer, nullable=False)
+    no_notaria = Column(String(255), nullable=True)
+    fe_minuta_hint = Column(String(20), nullable=True)
+    tx_estado = Column(String(20), nullable=False)  # PENDIENTE / PROCESANDO / EXITO / ERROR
+    documento_ref = Column(String(80), nullable=False)
+    co_sha256 = Column(String(64), nullable=False)
+    tx_content_type = Column(String(120), nullable=True)
+    contenido = deferred(Column(LONGTEXT, nullable=True))
+    resultado = Column(JSON, nullable=True)
+    error = Column(JSON, nullable=True)
+    fe_creacion = Column(DateTime, nullable=False, default=datetime.now)
+    fe_inicio = Column(DateTime, nullable=True)
+    fe_fin = Column(DateTime, nullable=True)
+    id_consulta = Column(Integer, nullable=True)
+
 class PSeguridad(Base):
     __tablename__ = "p_seguridad"
 
@@ -206,11 +301,28 @@ class PSeguridad(Base):
     credenciales = relationship("HCredencialSeguridad", back_populates="seguridad")
 
 class HCredencialSeguridad(Base):
+    """
+    Tokens de API por notaría. La autenticación busca por no_token_hash
+    (SHA-256 hex del token, indexado); no_token_api se mantiene como origen.
+
+    no_token_hash es una columna generada por MySQL: las credenciales se dan
+    de alta y se rotan fuera de la aplicación, así que el hash no puede
+    depender de que la fila pase por el ORM.
+
+    DDL:
+      ALTER TABLE h_credencial_seguridad
+        ADD COLUMN no_token_hash CHAR(64) AS (SHA2(no_token_api, 256)) STORED,
+        ADD INDEX ix_h_credencial_seguridad_no_token_hash (no_token_hash);
+    Si la columna ya existía como CHAR(64) normal:
+      ALTER TABLE h_credencial_seguridad
+        MODIFY COLUMN no_token_hash CHAR(64) AS (SHA2(no_token_api, 256)) STORED;
+    """
     __tablename__ = "h_credencial_seguridad"
 
     co_credencial_seguridad = Column(Integer, primary_key=True, autoincrement=True)
     co_seguridad = Column(Integer, ForeignKey("p_seguridad.co_seguridad"), nullable=False)
     no_token_api = Column(Text, nullable=True)
+    no_token_hash = Column(String(64), Computed("SHA2(no_token_api, 256)", persisted=True), index=True)
     in_estado = Column(Integer, nullable=True)
     
     seguridad = relationship("PSeguridad", back_populates="credenciales")
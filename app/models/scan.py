@@ -1,6 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, Numeric, Text, ForeignKey, JSON, text
+from sqlalchemy import Column, Integer, String, DateTime, Date, Numeric, Text, ForeignKey, JSON, Index, event, text
+from sqlalchemy.orm import deferred, relationship
 from datetime import datetime
 from app.db.base import Base
+from app.utils.parsing.text import fold_upper
 
 class ParametroSistema(Base):
     __tablename__ = 'p_parametro_sistema'
@@ -17,13 +19,61 @@ class TipoDocumentoEscaneo(Base):
     in_estado = Column(Integer, default=1)
 
 class EscaneoMedioPago(Base):
+    """
+    Histórico de escaneos. notaria_busqueda / referencia_busqueda son copias
+    normalizadas (fold_upper: mayúsculas, sin tildes) que usa el buscador del
+    historial con índices (ver app/repositories/scan_search.py); se completan
+    solas al insertar/actualizar vía ORM.
+
+    DDL:
+      ALTER TABLE h_escaneo_medio_pago
+        ADD COLUMN notaria_busqueda VARCHAR(255) NULL,
+        ADD COLUMN referencia_busqueda VARCHAR(200) NULL,
+        ADD INDEX ix_escaneo_notaria_id (notaria, id_escaneo),
+        ADD INDEX ix_escaneo_bancos_id (bancos, id_escaneo),
+        ADD INDEX ix_escaneo_ts_creacion (ts_creacion),
+        ADD INDEX ix_escaneo_notaria_busq_id (notaria_busqueda, id_escaneo),
+        ADD INDEX ix_escaneo_referencia_busq_id (referencia_busqueda, id_escaneo),
+        ADD FULLTEXT INDEX ft_escaneo_busqueda (notaria_busqueda, referencia_busqueda);
+      Filas existentes: scan_search.backfill_busqueda(db).
+
+    Duplicados (app/repositories/scan_dedup.py): hash_contenido es el SHA-256
+    de los bytes subidos. Una copia exacta de la misma notaría reutiliza la
+    lectura del original y apunta a él con id_escaneo_origen.
+
+      ALTER TABLE h_escaneo_medio_pago
+        ADD COLUMN hash_contenido CHAR(64) NULL,
+        ADD COLUMN id_escaneo_origen INT NULL,
+        ADD CONSTRAINT fk_escaneo_origen FOREIGN KEY (id_escaneo_origen)
+          REFERENCES h_escaneo_medio_pago (id_escaneo),
+        ADD INDEX ix_escaneo_notaria_hash (notaria, hash_contenido);
+
+      Si se creó la columna del hash perceptual (ya no se usa):
+      ALTER TABLE h_escaneo_medio_pago
+        DROP INDEX ix_escaneo_notaria_phash, DROP COLUMN hash_perceptual;
+    """
     __tablename__ = 'h_escaneo_medio_pago'
+    __table_args__ = (
+        Index("ix_escaneo_notaria_id", "notaria", "id_escaneo"),
+        Index("ix_escaneo_bancos_id", "bancos", "id_escaneo"),
+        Index("ix_escaneo_ts_creacion", "ts_creacion"),
+        Index("ix_escaneo_notaria_busq_id", "notaria_busqueda", "id_escaneo"),
+        Index("ix_escaneo_referencia_busq_id", "referencia_busqueda", "id_escaneo"),
+        Index(
+            "ft_escaneo_busqueda", "notaria_busqueda", "referencia_busqueda", mysql_prefix="FULLTEXT"
+        ).ddl_if(dialect="mysql"),
+        Index("ix_escaneo_notaria_hash", "notaria", "hash_contenido"),
+    )
     
     id_escaneo = Column(Integer, primary_key=True, autoincrement=True)
     notaria = Column(String(255), nullable=False)
     co_tipo_doc = Column(Integer, ForeignKey('a_tipo_documento_escaneo.co_tipo_doc'), nullable=False)
     url_imagen = Column(String(255), nullable=False)
     referencia = Column(String(200), nullable=True)
+
+    # Columnas de búsqueda normalizadas (fold_upper)
+    notaria_busqueda = Column(String(255), nullable=True)
+    referencia_busqueda = Column(String(200), nullable=True)
     
     # Campos detectados
     medio_pago = Column(String(100), nullable=True)
@@ -33,10 +83,38 @@ class EscaneoMedioPago(Base):
     bancos = Column(String(100), nullable=True)
     documento_pago = Column(String(100), nullable=True)
     
-    raw_ai_response = Column(JSON, nullable=True)
+    # diferida: el historial solo la trae con include_raw=true
+    raw_ai_response = deferred(Column(JSON, nullable=True))
     ts_creacion = Column(DateTime, server_default=text('CURRENT_TIMESTAMP'))
 
+    # Detección de duplicados
+    hash_contenido = Column(String(64), nullable=True)
+    id_escaneo_origen = Column(Integer, ForeignKey('h_escaneo_medio_pago.id_escaneo'), nullable=True)
+
+    # escaneo + auditoría se guardan juntos (un flush, un commit)
+    auditorias = relationship("AuditoriaEscaneo", back_populates="escaneo")
+
+
+@event.listens_for(EscaneoMedioPago, "before_insert")
+@event.listens_for(EscaneoMedioPago, "before_update")
+def _sync_busqueda(mapper, connection, target):
+    target.notaria_busqueda = fold_upper(target.notaria) or None
+    target.referencia_busqueda = fold_upper(target.referencia) or None
+
 class AuditoriaEscaneo(Base):
+    """
+    Auditoría de cada llamada de visión. bytes_* y tokens_imagen_* registran la
+    imagen antes/después del preprocesado (app/utils/vision_image.py); los
+    tokens de imagen son estimados, prompt_tokens es lo que facturó la API.
+
+    DDL:
+      ALTER TABLE a_auditoria_escaneo
+        ADD COLUMN bytes_original INT NULL,
+        ADD COLUMN bytes_enviados INT NULL,
+        ADD COLUMN tokens_imagen_original INT NULL,
+        ADD COLUMN tokens_imagen_enviada INT NULL,
+        ADD COLUMN detalle_imagen VARCHAR(10) NULL;
+    """
     __tablename__ = 'a_auditoria_escaneo'
     
     id_auditoria = Column(Integer, primary_key=True, autoincrement=True)
@@ -47,6 +125,15 @@ class AuditoriaEscaneo(Base):
     prompt_tokens = Column(Integer, nullable=True)
     completion_tokens = Column(Integer, nullable=True)
     costo_usd = Column(Numeric(10, 6), nullable=True)
-    estado = Column(String(20), nullable=False) # SUCCESS, ERROR
+    estado = Column(String(20), nullable=False) # SUCCESS, ERROR, DUPLICADO
     mensaje_error = Column(Text, nullable=True)
     ts_ejecucion = Column(DateTime, server_default=text('CURRENT_TIMESTAMP'))
+
+    # Imagen enviada a la IA (antes / después del preprocesado)
+    bytes_original = Column(Integer, nullable=True)
+    bytes_enviados = Column(Integer, nullable=True)
+    tokens_imagen_original = Column(Integer, nullable=True)
+    tokens_imagen_enviada = Column(Integer, nullable=True)
+    detalle_imagen = Column(String(10), nullable=True)  # low, high
+
+    escaneo = relationship("EscaneoMedioPago", back_populates="auditorias")
@@ -0,0 +1,152 @@
+# app/repositories/blob_repository.py
+"""
+Blob store para los binarios de minutas (DOCX subido, DOCX inteligente).
+
+- Direccionado por contenido: la clave es el SHA-256 del archivo original,
+  así que subir dos veces el mismo documento lo guarda una sola vez.
+- Comprimido con zlib solo si reduce el tamaño (un DOCX ya es un zip y
+  suele quedarse en "raw").
+- Backends: "db" (tabla a_minuta_blob) y "fs" (directorio local). La
+  referencia guardada en la consulta es "<backend>:<sha256>", de modo que
+  leer no depende del backend configurado al momento de escribir.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+import zlib
+from dataclasses import dataclass
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.minuta import MinutaBlob
+
+CODEC_ZLIB = "zlib"
+CODEC_RAW = "raw"
+
+
+@dataclass(frozen=True)
+class BlobRef:
+    ref: str            # "<backend>:<sha256>"
+    sha256: str
+    size: int           # bytes originales
+    stored_size: int    # bytes almacenados
+
+
+def _encode(data: bytes, level: int = 6) -> tuple[bytes, str]:
+    packed = zlib.compress(data, level)
+    if len(packed) < len(data):
+        return packed, CODEC_ZLIB
+    return data, CODEC_RAW
+
+
+def _decode(stored: bytes, codec: str) -> bytes:
+    return zlib.decompress(stored) if codec == CODEC_ZLIB else stored
+
+
+def parse_ref(ref: str) -> tuple[str, str]:
+    backend, _, sha = (ref or "").partition(":")
+    if not backend or len(sha) != 64:
+        raise ValueError(f"referencia de blob inválida: {ref!r}")
+    return backend, sha
+
+
+class DbBlobStore:
+    """Blobs en la tabla a_minuta_blob, dentro de la transacción de la Session."""
+    backend = "db"
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def put(self, data: bytes) -> BlobRef:
+        sha = hashlib.sha256(data).hexdigest()
+        existing = self.db.execute(
+            select(MinutaBlob.nu_bytes_almacenados).where(MinutaBlob.co_hash == sha)
+        ).scalar()
+
+        if existing is None:
+            stored, codec = _encode(data)
+            try:
+                # SAVEPOINT: si otra petición insertó el mismo hash, no se pierde la transacción
+                with self.db.begin_nested():
+                    self.db.add(MinutaBlob(
+                        co_hash=sha,
+                        nu_bytes=len(data),
+                        nu_bytes_almacenados=len(stored),
+                        tx_codec=codec,
+                        contenido=stored,
+                    ))
+                existing = len(stored)
+            except IntegrityError:
+                existing = self.db.execute(
+                    select(MinutaBlob.nu_bytes_almacenados).where(MinutaBlob.co_hash == sha)
+                ).scalar()
+
+        return BlobRef(ref=f"{self.backend}:{sha}", sha256=sha, size=len(data), stored_size=existing)
+
+    def get(self, sha: str) -> bytes | None:
+        row = self.db.execute(
+            select(MinutaBlob.contenido, MinutaBlob.tx_codec).where(MinutaBlob.co_hash == sha)
+        ).first()
+        return _decode(row[0], row[1]) if row else None
+
+
+class LocalFsBlobStore:
+    """Blobs como archivos <root>/<sha[:2]>/<sha>.<codec>; escritura atómica (tmp + rename)."""
+    backend = "fs"
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, sha: str, codec: str) -> str:
+        return os.path.join(self.root, sha[:2], f"{sha}.{codec}")
+
+    def put(self, data: bytes) -> BlobRef:
+        sha = hashlib.sha256(data).hexdigest()
+        for codec in (CODEC_ZLIB, CODEC_RAW):
+            path = self._path(sha, codec)
+            if os.path.exists(path):
+                return BlobRef(f"{self.backend}:{sha}", sha, len(data), os.path.getsize(path))
+
+        stored, codec = _encode(data)
+        path = self._path(sha, codec)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(stored)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return BlobRef(f"{self.backend}:{sha}", sha, len(data), len(stored))
+
+    def get(self, sha: str) -> bytes | None:
+        for codec in (CODEC_ZLIB, CODEC_RAW):
+            path = self._path(sha, codec)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return _decode(f.read(), codec)
+        return None
+
+
+def get_blob_store(db: Session, backend: str | None = None):
+    """Store de escritura según BLOB_STORE_BACKEND ("db" por defecto)."""
+    from app.core.config import settings
+
+    backend = backend or settings.blob_store_backend
+    if backend == LocalFsBlobStore.backend:
+        return LocalFsBlobStore(settings.blob_store_dir)
+    if backend == DbBlobStore.backend:
+        return DbBlobStore(db)
+    raise ValueError(f"BLOB_STORE_BACKEND desconocido: {backend!r}")
+
+
+def read_blob(db: Session, ref: str) -> bytes | None:
+    """Lee un blob por su referencia; el backend sale del prefijo."""
+    backend, sha = parse_ref(ref)
+    return get_blob_store(db, backend).get(sha)
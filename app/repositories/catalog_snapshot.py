@@ -0,0 +1,352 @@
+# app/repositories/catalog_snapshot.py
+"""
+Snapshot en memoria de los catálogos de lookup (país, tipo de documento,
+ocupación, estado civil, moneda, zona registral y CIIU).
+
+Son tablas pequeñas que casi no cambian; normalizar una minuta con 6
+participantes hacía 30+ queries contra ellas. El snapshot se carga una vez
+(al arrancar), se indexa en dicts y se refresca cada CATALOG_REFRESH_S
+segundos o explícitamente con invalidate().
+
+Los repositorios Snapshot* exponen los mismos métodos que los de
+catalogos_repository / ciiu_repository, así que normalize_payload los usa
+sin cambios.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.ciiu import Ciiu
+from app.models.estado_civil import Estado_Civil
+from app.models.ocupacion import Ocupacion
+from app.models.pais import Pais
+from app.models.tipo_documento import Tipo_Documento
+from app.models.tipo_moneda import Tipo_moneda
+from app.models.zona_registral import ZonaRegistral
+from app.utils.fuzzy_matcher import NgramMatcher
+from app.utils.parsing.text import fold_upper
+
+_OTROS_OCUPACION = "OTROS (ESPECIFICAR)"
+
+
+def snapshot_row(obj) -> SimpleNamespace:
+    """Copia plana de las columnas de una fila ORM (sin Session asociada)."""
+    return SimpleNamespace(**{c.key: getattr(obj, c.key) for c in obj.__table__.columns})
+
+
+def _index(rows: list, attr: str) -> dict:
+    """{fold_upper(valor): fila}; ante duplicados gana la primera (como LIMIT 1)."""
+    out = {}
+    for r in rows:
+        key = fold_upper(str(getattr(r, attr, None) or ""))
+        if key:
+            out.setdefault(key, r)
+    return out
+
+
+class CatalogSnapshot:
+    def __init__(
+        self,
+        paises: list,
+        tipos_documento: list,
+        ocupaciones: list,
+        estados_civiles: list,
+        monedas: list,
+        zonas: list,
+        ciius: list,
+        match_threshold: float = 0.45,
+    ):
+        self.loaded_at = time.time()
+
+        self.pais_by_nombre = _index(paises, "no_pais")
+        self.pais_by_gerundio = _index(paises, "gerundio_pais")
+        self.doc_by_nc = _index(tipos_documento, "nc_tipo_documento")
+        self.ec_by_nombre = _index(estados_civiles, "no_tipo_estado_civil")
+        self.moneda_by_nombre = _index(monedas, "no_tipo_moneda")
+        self.zona_by_nombre = _index(zonas, "no_zona_registral")
+        self.zona_by_nc = _index(zonas, "nc_zona_registral")
+
+        self.ocupaciones = list(ocupaciones)
+        self.ocup_by_desc = _index(ocupaciones, "de_ocupacion")
+        # el fallback OTROS no compite en el matcher difuso
+        self.ocup_matcher = NgramMatcher(
+            [r for r in ocupaciones if fold_upper(r.de_ocupacion or "") != _OTROS_OCUPACION],
+            "de_ocupacion",
+            threshold=match_threshold,
+        )
+
+        self.ciius = sorted(ciius, key=lambda r: r.co_ciiu)
+        self.ciiu_by_codigo = {str(r.co_ciiu): r for r in self.ciius}
+        self.ciiu_by_actividad = _index(self.ciius, "de_actividad")
+        self.ciiu_matcher = NgramMatcher(self.ciius, "de_actividad", threshold=match_threshold)
+        self.ciiu_catalogo_prompt = "\n".join(f"- {r.co_ciiu}: {r.de_actividad}" for r in self.ciius)
+
+    @classmethod
+    def load(cls, db: Session, match_threshold: float = 0.45) -> "CatalogSnapshot":
+        def activos(model):
+            pk = model.__mapper__.primary_key[0]
+            stmt = select(model).where(model.in_estado == 1).order_by(pk.asc())
+            return [snapshot_row(o) for o in db.execute(stmt).scalars().all()]
+
+        return cls(
+            paises=activos(Pais),
+            tipos_documento=activos(Tipo_Documento),
+            ocupaciones=activos(Ocupacion),
+            estados_civiles=activos(Estado_Civil),
+            monedas=activos(Tipo_moneda),
+            zonas=activos(ZonaRegistral),
+            ciius=activos(Ciiu),
+            match_threshold=match_threshold,
+        )
+
+    def stats(self) -> dict:
+        return {
+            "loaded_at": self.loaded_at,
+            "paises": len(self.pais_by_nombre),
+            "tipos_documento": len(self.doc_by_nc),
+            "ocupaciones": len(self.ocupaciones),
+            "estados_civiles": len(self.ec_by_nombre),
+            "monedas": len(self.moneda_by_nombre),
+            "zonas": len(self.zona_by_nombre),
+            "ciius": len(self.ciius),
+        }
+
+
+# ── Repositorios drop-in (mismas firmas que los repos con BD) ─────────────────
+
+class SnapshotPaisRepository:
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.snapshot = snapshot
+
+    def find_by_name_or_gentilicio(self, nombre: str) -> tuple[SimpleNamespace | None, bool]:
+        n = fold_upper(nombre)
+        if not n:
+            return None, False
+        row = self.snapshot.pais_by_nombre.get(n)
+        if row:
+            return row, False
+        row = self.snapshot.pais_by_gerundio.get(n)
+        return row, (row is not None)
+
+    def find_by_name(self, nombre: str) -> SimpleNamespace | None:
+        row, _ = self.find_by_name_or_gentilicio(nombre)
+        return row
+
+
+class SnapshotTipoDocumentoRepository:
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.snapshot = snapshot
+
+    def find_by_nc(self, nc: str) -> SimpleNamespace | None:
+        n = fold_upper(nc)
+        return self.snapshot.doc_by_nc.get(n) if n else None
+
+
+class SnapshotOcupacionRepository:
+    """
+    Estrategia:
+      1) Exact match
+      2) Match difuso (n-gramas): la ocupación más parecida si supera el umbral
+      3) Fallback: OTROS (ESPECIFICAR)
+    """
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.snapshot = snapshot
+
+    def find_by_desc(self, desc: str) -> SimpleNamespace | None:
+        if not (desc or "").strip():
+            return None
+
+        hit = self.snapshot.ocup_by_desc.get(fold_upper(desc))
+        if hit:
+            return hit
+
+        row, _score = self.snapshot.ocup_matcher.best(desc)
+        if row:
+            return row
+
+        return self.snapshot.ocup_by_desc.get(_OTROS_OCUPACION)
+
+
+class SnapshotEstadoCivilRepository:
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.snapshot = snapshot
+
+    def find_by_name(self, nombre: str) -> SimpleNamespace | None:
+        n = fold_upper(nombre)
+        return self.snapshot.ec_by_nombre.get(n) if n else None
+
+
+class SnapshotMonedaRepository:
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.snapshot = snapshot
+
+    def find_by_name(self, nombre: str) -> SimpleNamespace | None:
+        n = fold_upper(nombre)
+        return self.snapshot.moneda_by_nombre.get(n) if n else None
+
+
+class SnapshotZonaRegistralRepository:
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.snapshot = snapshot
+
+    def find_by_name(self, nombre: str) -> SimpleNamespace | None:
+        n = fold_upper(nombre)
+        return self.snapshot.zona_by_nombre.get(n) if n else None
+
+    def find_by_nc(self, nc: str) -> SimpleNamespace | None:
+        n = fold_upper(nc)
+        return self.snapshot.zona_by_nc.get(n) if n else None
+
+    def find_by_name_or_nc(self, value: str) -> SimpleNamespace | None:
+        n = fold_upper(value)
+        if not n:
+            return None
+        return self.find_by_nc(n) or self.find_by_name(n)
+
+
+class SnapshotCiiuRepository:
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.snapshot = snapshot
+
+    def list_activos(self) -> list[SimpleNamespace]:
+        return list(self.snapshot.ciius)
+
+    def format_catalogo_for_prompt(self) -> str:
+        return self.snapshot.ciiu_catalogo_prompt
+
+    def find_by_codigo(self, codigo: str) -> SimpleNamespace | None:
+        if not codigo:
+            return None
+        return self.snapshot.ciiu_by_codigo.get(str(codigo).strip())
+
+    def find_by_actividad_exacta(self, actividad: str) -> SimpleNamespace | None:
+        if not actividad:
+            return None
+        return self.snapshot.ciiu_by_actividad.get(fold_upper(actividad))
+
+    def find_best_match(self, value: str) -> SimpleNamespace | None:
+        """Mismos casos que CiiuRepository.find_best_match ("A", "X: ACTIVIDAD", "ACTIVIDAD")."""
+        if not value:
+            return None
+
+        s = value.strip()
+
+        if len(s) <= 3 and s[0].isalpha():
+            row = self.find_by_codigo(s[0].upper())
+            if row:
+                return row
+
+        for sep in [":", "-", "—"]:
+            if sep in s:
+                left, right = s.split(sep, 1)
+                left = left.strip()
+                right = right.strip()
+
+                if left and len(left) <= 3 and left[0].isalpha():
+                    row = self.find_by_codigo(left[0].upper())
+                    if row:
+                        return row
+
+                row = self.find_by_actividad_exacta(right)
+                if row:
+                    return row
+
+        row = self.find_by_actividad_exacta(s)
+        if row:
+            return row
+
+        # Fallback: la actividad más parecida (n-gramas) si supera el umbral
+        row, _score = self.snapshot.ciiu_matcher.best(s)
+        return row
+
+
+# ── Gestor del snapshot del proceso ───────────────────────────────────────────
+
+class CatalogSnapshotManager:
+    def __init__(self, session_factory, refresh_s: float = 600, match_threshold: float = 0.45):
+        self.session_factory = session_factory
+        self.refresh_s = refresh_s
+        self.match_threshold = match_threshold
+        self._snapshot: CatalogSnapshot | None = None
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.load_errors = 0
+
+    def refresh(self) -> CatalogSnapshot:
+        db = self.session_factory()
+        try:
+            snapshot = CatalogSnapshot.load(db, match_threshold=self.match_threshold)
+        finally:
+            db.close()
+        self._snapshot = snapshot
+        self.loads += 1
+        print(f"[CATALOGOS] snapshot cargado: {snapshot.stats()}")
+        return snapshot
+
+    def invalidate(self) -> None:
+        self._snapshot = None
+
+    def get(self) -> CatalogSnapshot:
+        snap = self._snapshot
+        if snap is not None and (time.time() - snap.loaded_at) < self.refresh_s:
+            return snap
+
+        with self._lock:
+            snap = self._snapshot
+            if snap is not None and (time.time() - snap.loaded_at) < self.refresh_s:
+                return snap
+            try:
+                return self.refresh()
+            except Exception as e:
+                self.load_errors += 1
+                if snap is None:
+                    raise
+                # BD caída: seguimos con el snapshot anterior
+                print(f"[CATALOGOS] refresh falló, se mantiene el snapshot anterior: {e}")
+                return snap
+
+    def repositories(self) -> dict:
+        """Repos listos para normalize_payload(**repos)."""
+        snap = self.get()
+        return {
+            "ciiu_repo": SnapshotCiiuRepository(snap),
+            "pais_repo": SnapshotPaisRepository(snap),
+            "doc_repo": SnapshotTipoDocumentoRepository(snap),
+            "ocup_repo": SnapshotOcupacionRepository(snap),
+            "ec_repo": SnapshotEstadoCivilRepository(snap),
+            "moneda_repo": SnapshotMonedaRepository(snap),
+            "zona_repo": SnapshotZonaRegistralRepository(snap),
+        }
+
+    def stats(self) -> dict:
+        snap = self._snapshot
+        return {
+            "loaded": snap is not None,
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "refresh_s": self.refresh_s,
+            **(snap.stats() if snap else {}),
+        }
+
+
+_manager: CatalogSnapshotManager | None = None
+
+
+def get_catalog_snapshots() -> CatalogSnapshotManager:
+    """Gestor único por proceso (usa SessionLocal para sus propias lecturas)."""
+    global _manager
+    if _manager is None:
+        from app.core.config import settings
+        from app.db.session import SessionLocal
+
+        _manager = CatalogSnapshotManager(
+            SessionLocal,
+            refresh_s=settings.catalog_refresh_s,
+            match_threshold=settings.catalog_match_threshold,
+        )
+    return _manager
@@ -1,5 +1,7 @@
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
 from app.models.minuta import ConsultaMinuta, ParticipanteMinuta, ValorMinutaMaster, ValorTransferencia, ValorMedioPago, BienMinuta, MinutaAuditoria
+from app.repositories.blob_repository import get_blob_store, read_blob
 from app.utils.date_utils import parse_optional_date
 import logging
 
@@ -21,162 +23,47 @@ class MinutaRepository:
     ) -> ConsultaMinuta:
         """
         Persiste el payload canónico y el archivo binario en la base de datos histórica.
+        Una sola transacción con un número fijo de round trips: flush de la
+        cabecera + un INSERT multi-fila por tabla de detalle + commit.
         """
         try:
             acto_data = payload.get("acto", {})
-            
-            # 1. Crear Cabecera (ConsultaMinuta)
+
+            # 1. Binario al blob store (direccionado por contenido); la fila guarda ref + tamaño
+            archivo = get_blob_store(self.db).put(docx_bytes) if docx_bytes else None
+
+            # 2. Cabecera (ConsultaMinuta): único flush, para obtener id_consulta
             nueva_consulta = ConsultaMinuta(
                 co_cnl=co_cnl,
                 no_servicio=acto_data.get("nombre_servicio"),
                 fe_minuta=parse_optional_date(acto_data.get("fecha_minuta")),
-                minuta_archivo=docx_bytes,
+                minuta_archivo_ref=archivo.ref if archivo else None,
+                nu_archivo_bytes=archivo.size if archivo else None,
                 estado_minuta=estado,
                 co_seguridad=co_seguridad,
                 no_notaria=no_notaria
             )
             self.db.add(nueva_consulta)
-            self.db.flush()  # Para obtener el id_consulta
-
-            # 2. Procesar Participantes
-            participantes_group = payload.get("participantes", {})
-            for grupo_key, lista in participantes_group.items():
-                if not lista:
-                    continue
-                # grupo_key: otorgantes, beneficiarios, fiduciarios
-                grupo_name = grupo_key[:-1].upper() if grupo_key.endswith('s') else grupo_key.upper()
-                
-                for p in lista:
-                    # Si no hay nombre ni razón social, ignorar
-                    if not p.get("nombres") and not p.get("razon_social"):
-                        continue
-                        
-                    doc = p.get("documento", {})
-                    dom = p.get("domicilio", {})
-                    ubi = dom.get("ubigeo", {})
-                    
-                    nuevo_p = ParticipanteMinuta(
-                        id_consulta=nueva_consulta.id_consulta,
-                        grupo_participante=grupo_name,
-                        tipo_persona=p.get("tipo_persona"),
-                        nombres=p.get("nombres"),
-                        apellido_paterno=p.get("apellido_paterno"),
-                        apellido_materno=p.get("apellido_materno"),
-                        razon_social=p.get("razon_social"),
-                        ciiu=p.get("ciiu"),
-                        co_ciiu=p.get("co_ciiu"),
-                        objeto_empresa=p.get("objeto_empresa"),
-                        pais=p.get("pais"),
-                        co_pais=p.get("co_pais"),
-                        documento_tipo=doc.get("tipo_documento"),
-                        documento_numero=doc.get("numero_documento"),
-                        documento_co=doc.get("co_documento"),
-                        ocupacion=p.get("ocupacion"),
-                        co_ocupacion=p.get("co_ocupacion"),
-                        otros_ocupaciones=p.get("otros_ocupaciones"),
-                        estado_civil=p.get("estado_civil"),
-                        co_estado_civil=p.get("co_estado_civil"),
-                        domicilio_direccion=dom.get("direccion"),
-                        ubigeo_departamento=ubi.get("departamento"),
-                        ubigeo_provincia=ubi.get("provincia"),
-                        ubigeo_distrito=ubi.get("distrito"),
-                        genero=p.get("genero"),
-                        rol=p.get("rol"),
-                        relacion=p.get("relacion"),
-                        porcentaje_participacion=p.get("porcentaje_participacion", 0.0),
-                        nu_acciones=p.get("numeroAcciones_participaciones", 0),
-                        nu_acciones_suscritas=p.get("acciones_suscritas", 0),
-                        mo_aportado=p.get("monto_aportado", 0.0)
-                    )
-                    self.db.add(nuevo_p)
-
-            # 3. Procesar Valores (Jerarquía: Maestro -> Detalles)
-            valores_group = payload.get("valores", {})
-            trans_list = valores_group.get("transferencia", [])
-            pagos_list = valores_group.get("medioPago", [])
-
-            max_len = max(len(trans_list), len(pagos_list))
-            for i in range(max_len):
-                t = trans_list[i] if i < len(trans_list) else {}
-                p = pagos_list[i] if i < len(pagos_list) else {}
-
-                # Si ambos están vacíos (placeholders), saltar
-                if not any(t.values()) and not any(p.values()):
-                    continue
-
-                # 3.1 Crear el Maestro
-                maestro = ValorMinutaMaster(
-                    id_consulta=nueva_consulta.id_consulta,
-                    tipo_registro="VALOR"
-                )
-                self.db.add(maestro)
-                self.db.flush()  # Para obtener el id_valor generado
-
-                # 3.2 Crear Detalle de Transferencia si hay data
-                if any(t.values()):
-                    nueva_t = ValorTransferencia(
-                        id_valor=maestro.id_valor,
-                        moneda=t.get("moneda"),
-                        co_moneda=t.get("co_moneda"),
-                        monto=t.get("monto"),
-                        forma_pago=t.get("forma_pago"),
-                        oportunidad_pago=t.get("oportunidad_pago")
-                    )
-                    self.db.add(nueva_t)
-
-                # 3.3 Crear Detalle de Medio de Pago si hay data
-                if any(p.values()):
-                    nuevo_p = ValorMedioPago(
-                        id_valor=maestro.id_valor,
-                        medio_pago=p.get("medio_pago"),
-                        moneda=p.get("moneda"),
-                        co_moneda=p.get("co_moneda"),
-                        valor_bien=p.get("valor_bien"),
-                        fecha_pago=parse_optional_date(p.get("fecha_pago")),
-                        bancos=p.get("bancos"),
-                        documento_pago=p.get("documento_pago")
-                    )
-                    self.db.add(nuevo_p)
-
-            # 4. Procesar Bienes
-            for b in payload.get("bienes", []):
-                # Validar que no sea un objeto vacío
-                if not b.get("tipo_bien") and not b.get("partida_registral"):
-                    continue
-                    
-                ubi = b.get("ubigeo", {})
-                nuevo_b = BienMinuta(
-                    id_consulta=nueva_consulta.id_consulta,
-                    tipo_bien=b.get("tipo_bien"),
-                    clase_bien=b.get("clase_bien"),
-                    ubigeo_departamento=ubi.get("departamento"),
-                    ubigeo_provincia=ubi.get("provincia"),
-                    ubigeo_distrito=ubi.get("distrito"),
-                    partida_registral=b.get("partida_registral"),
-                    zona_registral=b.get("zona_registral"),
-                    co_zona_registral=b.get("co_zona_registral"),
-                    fe_adquisicion=parse_optional_date(b.get("fecha_adquisicion")),
-                    fe_minuta_bien=parse_optional_date(b.get("fecha_minuta")),
-                    opcion_bien_mueble=b.get("opcion_bien_mueble"),
-                    nu_psm=b.get("numero_psm"),
-                    otros_bienes=b.get("otros_bienes"),
-                    pais=b.get("pais"),
-                    origen_bien=b.get("origen_del_bien")
-                )
-                self.db.add(nuevo_b)
-
-            # 5. Procesar Auditoría (NUEVA TABLA)
+            self.db.flush()
+            id_consulta = nueva_consulta.id_consulta
+
+            # 3. Detalle: un INSERT multi-fila por tabla (round trips fijos,
+            #    sin importar cuántos participantes/valores/bienes traiga el payload)
+            self._insert_many(ParticipanteMinuta, _participante_rows(payload, id_consulta))
+            self._insert_valores(payload, id_consulta)
+            self._insert_many(BienMinuta, _bien_rows(payload, id_consulta))
+
+            # 4. Auditoría
             if audit_data:
-                nueva_auditoria = MinutaAuditoria(
-                    id_consulta=nueva_consulta.id_consulta,
-                    raw_json=audit_data.get("raw_json"),
-                    prompt_tokens=audit_data.get("prompt_tokens"),
-                    completion_tokens=audit_data.get("completion_tokens"),
-                    model=audit_data.get("model"),
-                    latency_ms=audit_data.get("latency_ms"),
-                    metadata_json=audit_data.get("metadata_json")
-                )
-                self.db.add(nueva_auditoria)
+                self._insert_many(MinutaAuditoria, [{
+                    "id_consulta": id_consulta,
+                    "raw_json": audit_data.get("raw_json"),
+                    "prompt_tokens": audit_data.get("prompt_tokens"),
+                    "completion_tokens": audit_data.get("completion_tokens"),
+                    "model": audit_data.get("model"),
+                    "latency_ms": audit_data.get("latency_ms"),
+                    "metadata_json": audit_data.get("metadata_json"),
+                }])
 
             self.db.commit()
             return nueva_consulta
@@ -185,3 +72,172 @@ class MinutaRepository:
             self.db.rollback()
             logger.error(f"Error guardando historial de minuta: {e}")
             raise e
+
+    # ── Binarios (carga explícita) ───────────────────────────────────────────
+
+    def get_archivo(self, consulta: ConsultaMinuta) -> bytes | None:
+        """DOCX subido: blob store, o la columna legada (diferida) en filas antiguas."""
+        if consulta.minuta_archivo_ref:
+            return read_blob(self.db, consulta.minuta_archivo_ref)
+        return consulta.minuta_archivo
+
+    def get_legasys(self, consulta: ConsultaMinuta) -> bytes | None:
+        """DOCX inteligente: blob store, o la columna legada (diferida)."""
+        if consulta.minuta_legasys_ref:
+            return read_blob(self.db, consulta.minuta_legasys_ref)
+        return consulta.minuta_legasys
+
+    def set_legasys(self, consulta: ConsultaMinuta, data: bytes) -> None:
+        """Guarda el DOCX inteligente en el blob store (el commit queda a cargo del llamador)."""
+        ref = get_blob_store(self.db).put(data)
+        consulta.minuta_legasys_ref = ref.ref
+        consulta.nu_legasys_bytes = ref.size
+
+    def _insert_many(self, model, rows: list[dict]) -> None:
+        # INSERT Core sobre la tabla (no el bulk del ORM, que agrupa por columnas
+        # no nulas y podría partir el lote en varios statements)
+        if rows:
+            self.db.execute(insert(model.__table__), rows)
+
+    def _insert_valores(self, payload: dict, id_consulta: int) -> None:
+        """
+        Maestro -> detalles. Los id_valor se recuperan con un SELECT por id_consulta
+        (ordenado por PK = orden de inserción) en vez de un flush por maestro.
+        """
+        pares = _valor_pairs(payload)
+        if not pares:
+            return
+
+        self._insert_many(
+            ValorMinutaMaster,
+            [{"id_consulta": id_consulta, "tipo_registro": "VALOR"} for _ in pares],
+        )
+        ids = self.db.execute(
+            select(ValorMinutaMaster.id_valor)
+            .where(ValorMinutaMaster.id_consulta == id_consulta)
+            .order_by(ValorMinutaMaster.id_valor.asc())
+        ).scalars().all()
+
+        transferencias, medios = [], []
+        for id_valor, (t, p) in zip(ids, pares):
+            if any(t.values()):
+                transferencias.append({
+                    "id_valor": id_valor,
+                    "moneda": t.get("moneda"),
+                    "co_moneda": t.get("co_moneda"),
+                    "monto": t.get("monto"),
+                    "forma_pago": t.get("forma_pago"),
+                    "oportunidad_pago": t.get("oportunidad_pago"),
+                })
+            if any(p.values()):
+                medios.append({
+                    "id_valor": id_valor,
+                    "medio_pago": p.get("medio_pago"),
+                    "moneda": p.get("moneda"),
+                    "co_moneda": p.get("co_moneda"),
+                    "valor_bien": p.get("valor_bien"),
+                    "fecha_pago": parse_optional_date(p.get("fecha_pago")),
+                    "bancos": p.get("bancos"),
+                    "documento_pago": p.get("documento_pago"),
+                })
+
+        self._insert_many(ValorTransferencia, transferencias)
+        self._insert_many(ValorMedioPago, medios)
+
+
+def _participante_rows(payload: dict, id_consulta: int) -> list[dict]:
+    rows = []
+    for grupo_key, lista in (payload.get("participantes") or {}).items():
+        if not lista:
+            continue
+        # grupo_key: otorgantes, beneficiarios, fiduciarios
+        grupo_name = grupo_key[:-1].upper() if grupo_key.endswith('s') else grupo_key.upper()
+
+        for p in lista:
+            # Si no hay nombre ni razón social, ignorar
+            if not p.get("nombres") and not p.get("razon_social"):
+                continue
+
+            doc = p.get("documento", {})
+            dom = p.get("domicilio", {})
+            ubi = dom.get("ubigeo", {})
+
+            rows.append({
+                "id_consulta": id_consulta,
+                "grupo_participante": grupo_name,
+                "tipo_persona": p.get("tipo_persona"),
+                "nombres": p.get("nombres"),
+                "apellido_paterno": p.get("apellido_paterno"),
+                "apellido_materno": p.get("apellido_materno"),
+                "razon_social": p.get("razon_social"),
+                "ciiu": p.get("ciiu"),
+                "co_ciiu": p.get("co_ciiu"),
+                "objeto_empresa": p.get("objeto_empresa"),
+                "pais": p.get("pais"),
+                "co_pais": p.get("co_pais"),
+                "documento_tipo": doc.get("tipo_documento"),
+                "documento_numero": doc.get("numero_documento"),
+                "documento_co": doc.get("co_documento"),
+                "ocupacion": p.get("ocupacion"),
+                "co_ocupacion": p.get("co_ocupacion"),
+                "otros_ocupaciones": p.get("otros_ocupaciones"),
+                "estado_civil": p.get("estado_civil"),
+                "co_estado_civil": p.get("co_estado_civil"),
+                "domicilio_direccion": dom.get("direccion"),
+                "ubigeo_departamento": ubi.get("departamento"),
+                "ubigeo_provincia": ubi.get("provincia"),
+                "ubigeo_distrito": ubi.get("distrito"),
+                "genero": p.get("genero"),
+                "rol": p.get("rol"),
+                "relacion": p.get("relacion"),
+                "porcentaje_participacion": p.get("porcentaje_participacion", 0.0),
+                "nu_acciones": p.get("numeroAcciones_participaciones", 0),
+                "nu_acciones_suscritas": p.get("acciones_suscritas", 0),
+                "mo_aportado": p.get("monto_aportado", 0.0),
+            })
+    return rows
+
+
+def _valor_pairs(payload: dict) -> list[tuple[dict, dict]]:
+    """(transferencia, medioPago) por posición; se omiten los pares vacíos (placeholders)."""
+    valores_group = payload.get("valores", {})
+    trans_list = valores_group.get("transferencia", [])
+    pagos_list = valores_group.get("medioPago", [])
+
+    pares = []
+    for i in range(max(len(trans_list), len(pagos_list))):
+        t = trans_list[i] if i < len(trans_list) else {}
+        p = pagos_list[i] if i < len(pagos_list) else {}
+        if not any(t.values()) and not any(p.values()):
+            continue
+        pares.append((t, p))
+    return pares
+
+
+def _bien_rows(payload: dict, id_consulta: int) -> list[dict]:
+    rows = []
+    for b in payload.get("bienes", []):
+        # Validar que no sea un objeto vacío
+        if not b.get("tipo_bien") and not b.get("partida_registral"):
+            continue
+
+        ubi = b.get("ubigeo", {})
+        rows.append({
+            "id_consulta": id_consulta,
+            "tipo_bien": b.get("tipo_bien"),
+            "clase_bien": b.get("clase_bien"),
+            "ubigeo_departamento": ubi.get("departamento"),
+            "ubigeo_provincia": ubi.get("provincia"),
+            "ubigeo_distrito": ubi.get("distrito"),
+            "partida_registral": b.get("partida_registral"),
+            "zona_registral": b.get("zona_registral"),
+            "co_zona_registral": b.get("co_zona_registral"),
+            "fe_adquisicion": parse_optional_date(b.get("fecha_adquisicion")),
+            "fe_minuta_bien": parse_optional_date(b.get("fecha_minuta")),
+            "opcion_bien_mueble": b.get("opcion_bien_mueble"),
+            "nu_psm": b.get("numero_psm"),
+            "otros_bienes": b.get("otros_bienes"),
+            "pais": b.get("pais"),
+            "origen_bien": b.get("origen_del_bien"),
+        })
+    return rows
@@ -0,0 +1,48 @@
+# app/repositories/scan_dedup.py
+"""
+Búsqueda de escaneos repetidos de la misma notaría.
+
+El personal sube el mismo voucher dos veces (reintentos, doble click, el
+mismo recibo para dos referencias) y cada subida pagaba una llamada de
+visión. Antes de llamar a la IA se busca un escaneo previo exitoso de la
+misma notaría con el mismo hash_contenido (SHA-256 de los bytes: copia
+exacta).
+
+No hay coincidencia aproximada: los recibos de una misma plantilla (p. ej.
+constancias de BCP) quedan a pocos bits de distancia en un hash perceptual
+y la copia heredaría monto y documento_pago de otro voucher.
+
+Solo cuentan originales (id_escaneo_origen nulo) con auditoría SUCCESS.
+"""
+from __future__ import annotations
+
+from sqlalchemy import exists, select
+from sqlalchemy.orm import Session, undefer
+
+from app.models.scan import AuditoriaEscaneo, EscaneoMedioPago
+
+
+def _originales(notaria: str, *columns):
+    return (
+        select(*(columns or (EscaneoMedioPago,)))
+        .where(
+            EscaneoMedioPago.notaria == notaria,
+            EscaneoMedioPago.id_escaneo_origen.is_(None),
+            exists().where(
+                AuditoriaEscaneo.id_escaneo == EscaneoMedioPago.id_escaneo,
+                AuditoriaEscaneo.estado == "SUCCESS",
+            ),
+        )
+    )
+
+
+def _first(db: Session, stmt) -> EscaneoMedioPago | None:
+    stmt = stmt.options(undefer(EscaneoMedioPago.raw_ai_response))
+    return db.execute(stmt.order_by(EscaneoMedioPago.id_escaneo.asc()).limit(1)).scalar_one_or_none()
+
+
+def find_duplicate(db: Session, notaria: str, hash_contenido: str | None) -> EscaneoMedioPago | None:
+    """Escaneo original que se puede reutilizar para esta imagen, o None."""
+    if not hash_contenido:
+        return None
+    return _first(db, _originales(notaria).where(EscaneoMedioPago.hash_contenido == hash_contenido))
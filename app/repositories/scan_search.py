@@ -0,0 +1,123 @@
+# app/repositories/scan_search.py
+"""
+Planificador de búsqueda de texto para el historial de escaneos.
+
+Los filtros notaria/referencia eran ilike('%x%'): ningún índice sirve y cada
+página filtrada recorría la tabla. Ahora se busca sobre las columnas
+normalizadas (*_busqueda, fold_upper) con el camino indexado que el motor
+soporta:
+
+  - "fulltext" (MySQL, término >= 3 caracteres): MATCH ... AGAINST en modo
+    booleano, cada palabra como prefijo (+PALABRA*). Encuentra palabras en
+    cualquier posición ("UNO" -> "NOTARIA UNO") usando el índice FULLTEXT.
+  - "prefix": rango col >= 'X' AND col < 'Y' sobre el índice compuesto
+    (col, id_escaneo). Encuentra valores que empiezan por el término.
+  - "contains": el LIKE '%x%' de antes (sin índice), por compatibilidad.
+
+HISTORIAL_SEARCH_MODE=auto elige fulltext en MySQL y prefix en el resto.
+"""
+from __future__ import annotations
+
+import re
+
+from sqlalchemy import and_, text, update
+from sqlalchemy.orm import Session
+
+from app.models.scan import EscaneoMedioPago
+from app.utils.parsing.text import fold_upper
+
+MODES = ("auto", "fulltext", "prefix", "contains")
+
+# mínimo de InnoDB (innodb_ft_min_token_size); por debajo, prefijo
+_FT_MIN_LEN = 3
+_FT_WORD_RE = re.compile(r"[A-Z0-9Ñ]+")
+
+
+def _prefix_upper_bound(term: str) -> str:
+    """Menor string mayor que todos los que empiezan con `term`."""
+    return term[:-1] + chr(ord(term[-1]) + 1)
+
+
+class ScanSearchPlanner:
+    def __init__(self, dialect_name: str, mode: str = "auto"):
+        if mode not in MODES:
+            raise ValueError(f"HISTORIAL_SEARCH_MODE desconocido: {mode!r}")
+        self.dialect_name = dialect_name
+        self.mode = mode
+
+    @classmethod
+    def for_session(cls, db: Session, mode: str | None = None) -> "ScanSearchPlanner":
+        if mode is None:
+            from app.core.config import settings
+
+            mode = settings.historial_search_mode
+        return cls(db.get_bind().dialect.name, mode)
+
+    def strategy(self, term: str) -> str:
+        if self.mode != "auto":
+            return self.mode
+        if self.dialect_name in ("mysql", "mariadb") and len(term) >= _FT_MIN_LEN:
+            return "fulltext"
+        return "prefix"
+
+    def text_filter(self, column, raw_column, value: str):
+        """
+        Condición para buscar `value` en `column` (columna *_busqueda).
+        raw_column: columna original, solo para el modo "contains".
+        """
+        term = fold_upper(value)
+        if not term:
+            return None
+
+        strategy = self.strategy(term)
+        if strategy == "fulltext":
+            words = _FT_WORD_RE.findall(term)
+            if words and all(len(w) >= _FT_MIN_LEN for w in words):
+                query = " ".join(f"+{w}*" for w in words)
+                # El índice FULLTEXT cubre ambas columnas: MATCH debe nombrar las dos
+                param = f"ft_{column.key}"
+                return and_(
+                    text(
+                        f"MATCH (notaria_busqueda, referencia_busqueda) AGAINST (:{param} IN BOOLEAN MODE)"
+                    ).bindparams(**{param: query}),
+                    column.like(f"%{term}%"),
+                )
+            strategy = "prefix"
+
+        if strategy == "prefix":
+            return and_(column >= term, column < _prefix_upper_bound(term))
+
+        return raw_column.ilike(f"%{value}%")
+
+    def notaria(self, value: str):
+        return self.text_filter(EscaneoMedioPago.notaria_busqueda, EscaneoMedioPago.notaria, value)
+
+    def referencia(self, value: str):
+        return self.text_filter(EscaneoMedioPago.referencia_busqueda, EscaneoMedioPago.referencia, value)
+
+
+def backfill_busqueda(db: Session, batch_size: int = 1000) -> int:
+    """Completa notaria_busqueda/referencia_busqueda en filas anteriores a las columnas."""
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.query(
+            EscaneoMedioPago.id_escaneo, EscaneoMedioPago.notaria, EscaneoMedioPago.referencia
+        ).filter(
+            EscaneoMedioPago.id_escaneo > last_id,
+            EscaneoMedioPago.notaria_busqueda.is_(None),
+        ).order_by(EscaneoMedioPago.id_escaneo.asc()).limit(batch_size).all()
+        if not rows:
+            return total
+
+        db.execute(update(EscaneoMedioPago), [
+            {
+                "id_escaneo": r.id_escaneo,
+                "notaria_busqueda": fold_upper(r.notaria) or None,
+                "referencia_busqueda": fold_upper(r.referencia) or None,
+            }
+            for r in rows
+        ])
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1].id_escaneo
@@ -0,0 +1,135 @@
+# app/services/llm_gateway.py
+"""
+Gateway asíncrono hacia OpenAI, compartido por la extracción de minutas
+y el escaneo de vouchers.
+
+- Usa el cliente async (AsyncOpenAI): una llamada de 10-40 s ya no bloquea
+  el event loop del worker de uvicorn.
+- Un semáforo limita cuántas llamadas hay en vuelo por worker
+  (OPENAI_MAX_CONCURRENCY); el resto espera su turno sin bloquear.
+- Devuelve siempre (dict_parseado, telemetry_dict).
+"""
+import asyncio
+import time
+
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+from app.utils.json_utils import parse_json_strict
+
+
+def _ms(dt: float) -> float:
+    return round(dt * 1000, 2)
+
+
+class LLMGateway:
+    def __init__(self, client=None, max_concurrency: int | None = None, model: str | None = None):
+        self.client = client or AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            timeout=settings.openai_timeout_s,
+            max_retries=settings.openai_max_retries,
+        )
+        self.model = model or settings.openai_model
+        self.max_concurrency = max(1, int(max_concurrency or settings.openai_max_concurrency))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._in_flight = 0
+        self._waiting = 0
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+        }
+
+    async def chat_json(
+        self,
+        messages: list[dict],
+        trace_id: str | None = None,
+        tag: str = "OPENAI",
+    ) -> tuple[dict, dict]:
+        """
+        Ejecuta un chat completion en modo JSON y retorna (dict_parseado, telemetry_dict).
+        """
+        debug = getattr(settings, "openai_debug", True)
+
+        t_queue0 = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        queue_ms = _ms(time.perf_counter() - t_queue0)
+
+        self._in_flight += 1
+        t0 = time.perf_counter()
+        try:
+            resp = await self.client.chat.completions.create(
+                model=self.model,
+                temperature=0,
+                response_format={"type": "json_object"},
+                messages=messages,
+            )
+        except Exception as e:
+            t1 = time.perf_counter()
+            if debug:
+                print(f"[{tag}] trace={trace_id} ERROR after {_ms(t1-t0)}ms -> {type(e).__name__}: {e}")
+            raise
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+        t1 = time.perf_counter()
+        latency_ms = _ms(t1 - t0)
+
+        # ===== Extracción de metadatos útiles =====
+        choice = resp.choices[0] if resp.choices else None
+        msg = choice.message if choice else None
+        text = (msg.content or "").strip() if msg else ""
+
+        usage = getattr(resp, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) if usage else 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) if usage else 0
+        total_tokens = getattr(usage, "total_tokens", 0) if usage else 0
+
+        if debug:
+            print(
+                f"[{tag}] "
+                f"trace={trace_id} "
+                f"model={self.model} "
+                f"queue={queue_ms}ms "
+                f"latency={latency_ms}ms "
+                f"tokens(prompt={prompt_tokens}, completion={completion_tokens})"
+            )
+            print(f"[{tag}] trace={trace_id} raw_len={len(text)}")
+
+        # ===== Parse estricto =====
+        try:
+            data = parse_json_strict(text)
+        except Exception as e:
+            if debug:
+                print(f"[{tag}] trace={trace_id} PARSE_ERROR: {type(e).__name__}: {e}")
+            raise
+
+        telemetry = {
+            "raw_text": text,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": total_tokens,
+            "model": self.model,
+            "latency_ms": latency_ms,
+            "queue_ms": queue_ms,
+        }
+
+        return data, telemetry
+
+
+_gateway: LLMGateway | None = None
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Instancia única por proceso (se crea en el primer uso)."""
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway()
+    return _gateway
@@ -0,0 +1,151 @@
+# app/services/minuta_idempotency.py
+"""
+Envíos idempotentes de minutas y coalescencia single-flight.
+
+Cuando el frontend reintenta un POST /api/v1/minutas lento, el servidor
+arrancaba un segundo pipeline completo para el mismo archivo: otra llamada
+al LLM y otra fila en p_consulta_minuta. Cada envío tiene ahora una clave
+de idempotencia:
+
+  - explícita: header Idempotency-Key, o
+  - derivada: sha256 del archivo + co_cnl,
+
+siempre acotada al token (dos clientes nunca comparten resultados).
+
+  - Si ya hay una ejecución en curso con la misma clave, la petición se
+    engancha a ella y recibe el mismo resultado (single-flight).
+  - Si terminó con éxito hace menos de MINUTA_IDEMPOTENCY_TTL_S, se devuelve
+    la respuesta guardada (con el mismo id_consulta) sin volver a ejecutar.
+  - Los errores no se guardan: el siguiente reintento ejecuta de nuevo. Una
+    respuesta sin id_consulta (la consulta no se pudo guardar) tampoco.
+  - Una clave explícita reutilizada con otro archivo/co_cnl responde 422.
+
+El estado vive en la memoria de cada proceso y no se comparte: ni entre
+nodos ni entre los workers de gunicorn del mismo nodo (el Procfile levanta
+WEB_CONCURRENCY, 2 por defecto). Un reintento que cae en otro worker ejecuta
+el pipeline de nuevo y crea otra fila en p_consulta_minuta. Para clientes
+que reintentan, el modo asíncrono (?async=true, backend sql) es el que
+garantiza una sola ejecución.
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import hashlib
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException
+
+from app.core.security import hash_token
+from app.utils.cache.lru import LRUCache
+
+EJECUTADA = "ejecutada"    # esta petición ejecutó el pipeline
+EN_CURSO = "en_curso"      # se enganchó a una ejecución idéntica en curso
+ALMACENADA = "almacenada"  # respuesta guardada de una ejecución anterior
+
+
+def build_idempotency_key(token: str | None, sha256: str, co_cnl: str, explicit: str | None = None) -> str:
+    """Clave acotada al token: la explícita si viene, si no archivo + co_cnl."""
+    base = f"k|{explicit.strip()}" if explicit and explicit.strip() else f"d|{sha256}|{co_cnl}"
+    return hashlib.sha256(f"{hash_token(token)}|{base}".encode("utf-8")).hexdigest()
+
+
+def has_id_consulta(result: Any) -> bool:
+    """Respuesta de extracción con la consulta guardada (la única que vale la pena repetir)."""
+    payload = result.get("payload") if isinstance(result, dict) else None
+    return isinstance(payload, dict) and bool(payload.get("id_consulta"))
+
+
+class SingleFlight:
+    def __init__(self, ttl_s: float = 600, max_items: int = 1000, enabled: bool = True):
+        self.enabled = enabled
+        self._inflight: dict[str, tuple[str | None, asyncio.Task]] = {}
+        self._done = LRUCache(max_items=max_items, ttl_s=ttl_s)
+        self.executed = 0
+        self.coalesced = 0
+        self.replayed = 0
+
+    @staticmethod
+    def _check(stored_fp: str | None, fingerprint: str | None) -> None:
+        if stored_fp is not None and fingerprint is not None and stored_fp != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key ya usada con otro archivo o co_cnl",
+            )
+
+    async def run(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        fingerprint: str | None = None,
+        store_if: Callable[[Any], bool] | None = None,
+    ) -> tuple[Any, str]:
+        """
+        Ejecuta fn() una sola vez por clave. Devuelve (resultado, origen) con
+        origen EJECUTADA / EN_CURSO / ALMACENADA; cada llamador recibe su copia.
+        Con store_if, solo se guardan los resultados que lo cumplen.
+        """
+        if not self.enabled:
+            self.executed += 1
+            return await fn(), EJECUTADA
+
+        stored = self._done.get(key)
+        if stored is not None:
+            self._check(stored[0], fingerprint)
+            self.replayed += 1
+            return copy.deepcopy(stored[1]), ALMACENADA
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._check(inflight[0], fingerprint)
+            self.coalesced += 1
+            result = await asyncio.shield(inflight[1])
+            return copy.deepcopy(result), EN_CURSO
+
+        # Tarea propia: si el cliente que la originó se desconecta, los enganchados siguen
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = (fingerprint, task)
+        task.add_done_callback(lambda t: self._settle(key, fingerprint, store_if, t))
+        self.executed += 1
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result), EJECUTADA
+
+    def _settle(
+        self, key: str, fingerprint: str | None, store_if: Callable[[Any], bool] | None, task: asyncio.Task
+    ) -> None:
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if store_if is not None and not store_if(result):
+            return
+        self._done.set(key, (fingerprint, copy.deepcopy(result)))
+
+    def forget(self, key: str) -> None:
+        self._done.pop(key)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "replayed": self.replayed,
+            "stored": self._done.stats(),
+        }
+
+
+_single_flight: SingleFlight | None = None
+
+
+def get_minuta_single_flight() -> SingleFlight:
+    global _single_flight
+    if _single_flight is None:
+        from app.core.config import settings
+
+        _single_flight = SingleFlight(
+            ttl_s=settings.minuta_idempotency_ttl_s,
+            max_items=settings.minuta_idempotency_max_items,
+            enabled=settings.minuta_idempotency_enabled,
+        )
+    return _single_flight
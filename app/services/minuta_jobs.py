@@ -0,0 +1,544 @@
+# app/services/minuta_jobs.py
+"""
+Modo asíncrono de extracción de minutas (POST /api/v1/minutas?async=true).
+
+La extracción síncrona mantiene la conexión HTTP abierta durante toda la
+llamada al LLM (decenas de segundos): los clientes con timeouts cortos
+reintentan y el servidor acumula peticiones colgadas. En modo asíncrono la
+petición solo valida token, archivo y co_cnl, encola un job y responde 202
+con su id; el cliente consulta GET /api/v1/minutas/jobs/{id}.
+
+- Un pool de MINUTA_JOBS_WORKERS tareas procesa los jobs (pasos 2-10 de
+  MinutaService.extract_document, cada una con su propia sesión).
+- Con MINUTA_JOBS_MAX_PENDING jobs en cola se responde 503 + Retry-After
+  (contrapresión en lugar de una cola sin límite).
+- Al terminar con éxito se avisa al orquestador (MINUTA_JOBS_CALLBACK), igual
+  que la ruta síncrona.
+- Backend "sql" (por defecto): tabla a_minuta_job, compartida entre nodos y
+  entre los workers de gunicorn del mismo nodo. Backend "memory": cola en el
+  proceso, solo para un único worker (con varios, el GET del job cae en otro
+  proceso y responde 404); los jobs se pierden al reiniciar.
+- Un job PROCESANDO por más de STALE_S se re-encola (nodo caído). Si ya había
+  guardado su p_consulta_minuta (id_consulta anotado en el job), se cierra con
+  ese id_consulta sin repetir el LLM ni insertar otra consulta.
+- Los jobs terminados se olvidan tras MINUTA_JOBS_TTL_S.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.orm import undefer
+
+from app.core.security import ResolvedCredential
+from app.models.minuta import MinutaJob
+from app.repositories.blob_repository import get_blob_store, read_blob
+from app.services import orchestrator_client
+from app.utils.ingestion import UploadedDocument
+
+PENDIENTE = "PENDIENTE"
+PROCESANDO = "PROCESANDO"
+EXITO = "EXITO"
+ERROR = "ERROR"
+
+# segundos sugeridos al cliente cuando la cola está llena
+RETRY_AFTER_S = 5
+# un job PROCESANDO más tiempo que esto se da por perdido (nodo caído) y se re-encola
+STALE_S = 900
+_PURGE_EVERY_S = 60
+
+
+@dataclass
+class JobRecord:
+    job_id: str
+    co_cnl: str
+    credencial: ResolvedCredential
+    fecha_minuta_hint: str | None
+    estado: str
+    creado: datetime
+    documento: UploadedDocument | None = None
+    iniciado: datetime | None = None
+    finalizado: datetime | None = None
+    resultado: dict | None = None
+    error: dict | None = None
+    id_consulta: int | None = None
+
+    def to_status(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.estado,
+            "co_cnl": self.co_cnl,
+            "creado": self.creado.isoformat(),
+            "iniciado": self.iniciado.isoformat() if self.iniciado else None,
+            "finalizado": self.finalizado.isoformat() if self.finalizado else None,
+            "resultado": self.resultado,
+            "error": self.error,
+        }
+
+
+class InMemoryJobBackend:
+    """Cola FIFO en el proceso (un solo nodo)."""
+    name = "memory"
+
+    def __init__(self, ttl_s: float = 3600):
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._jobs: dict[str, JobRecord] = {}
+        self._queue: deque[str] = deque()
+
+    def create(self, job: JobRecord) -> None:
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._queue.append(job.job_id)
+
+    def claim(self) -> JobRecord | None:
+        with self._lock:
+            while self._queue:
+                job = self._jobs.get(self._queue.popleft())
+                if job is not None and job.estado == PENDIENTE:
+                    job.estado = PROCESANDO
+                    job.iniciado = datetime.now()
+                    return job
+        return None
+
+    def _finish(self, job_id: str, estado: str, resultado: dict | None, error: dict | None) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.estado = estado
+            job.finalizado = datetime.now()
+            job.resultado = resultado
+            job.error = error
+            job.documento = None  # el binario ya no hace falta
+
+    def mark_persisted(self, job_id: str, id_consulta: int) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.id_consulta = id_consulta
+
+    def complete(self, job_id: str, resultado: dict) -> None:
+        self._finish(job_id, EXITO, resultado, None)
+
+    def fail(self, job_id: str, error: dict) -> None:
+        self._finish(job_id, ERROR, None, error)
+
+    def get(self, job_id: str) -> JobRecord | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._queue)
+
+    def purge(self) -> int:
+        cutoff = datetime.now() - timedelta(seconds=self.ttl_s)
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finalizado is not None and job.finalizado < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+
+class SqlJobBackend:
+    """
+    Cola en la tabla a_minuta_job (varios nodos). El archivo va al blob store
+    y el texto extraído a la fila; cada operación abre su propia sesión.
+    """
+    name = "sql"
+
+    def __init__(self, session_factory=None, ttl_s: float = 3600):
+        if session_factory is None:
+            from app.db.session import SessionLocal
+
+            session_factory = SessionLocal
+        self._session_factory = session_factory
+        self.ttl_s = ttl_s
+
+    @staticmethod
+    def _record(row: MinutaJob, documento: UploadedDocument | None = None) -> JobRecord:
+        return JobRecord(
+            job_id=row.co_job,
+            co_cnl=row.co_cnl,
+            credencial=ResolvedCredential(
+                co_credencial_seguridad=row.co_credencial_seguridad,
+                co_seguridad=row.co_seguridad,
+                no_notaria=row.no_notaria,
+            ),
+            fecha_minuta_hint=row.fe_minuta_hint,
+            estado=row.tx_estado,
+            creado=row.fe_creacion,
+            documento=documento,
+            iniciado=row.fe_inicio,
+            finalizado=row.fe_fin,
+            resultado=row.resultado,
+            error=row.error,
+            id_consulta=row.id_consulta,
+        )
+
+    def create(self, job: JobRecord) -> None:
+        documento = job.documento
+        db = self._session_factory()
+        try:
+            blob = get_blob_store(db).put(documento.raw)
+            db.add(MinutaJob(
+                co_job=job.job_id,
+                co_cnl=job.co_cnl,
+                co_credencial_seguridad=job.credencial.co_credencial_seguridad,
+                co_seguridad=job.credencial.co_seguridad,
+                no_notaria=job.credencial.no_notaria,
+                fe_minuta_hint=job.fecha_minuta_hint,
+                tx_estado=PENDIENTE,
+                documento_ref=blob.ref,
+                co_sha256=documento.sha256,
+                tx_content_type=documento.content_type,
+                contenido=documento.text,
+                fe_creacion=job.creado,
+            ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _claimable(now: datetime):
+        return or_(
+            MinutaJob.tx_estado == PENDIENTE,
+            (MinutaJob.tx_estado == PROCESANDO) & (MinutaJob.fe_inicio < now - timedelta(seconds=STALE_S)),
+        )
+
+    def claim(self) -> JobRecord | None:
+        db = self._session_factory()
+        try:
+            now = datetime.now()
+            candidates = db.execute(
+                select(MinutaJob.co_job)
+                .where(self._claimable(now))
+                .order_by(MinutaJob.fe_creacion)
+                .limit(5)
+            ).scalars().all()
+            for co_job in candidates:
+                # Toma optimista: si otro nodo lo tomó antes, rowcount = 0
+                taken = db.execute(
+                    update(MinutaJob)
+                    .where(MinutaJob.co_job == co_job, self._claimable(now))
+                    .values(tx_estado=PROCESANDO, fe_inicio=now)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                db.commit()
+                if not taken:
+                    continue
+                row = db.execute(
+                    select(MinutaJob).options(undefer(MinutaJob.contenido)).where(MinutaJob.co_job == co_job)
+                ).scalar_one()
+                documento = UploadedDocument(
+                    text=row.contenido or "",
+                    sha256=row.co_sha256,
+                    raw=read_blob(db, row.documento_ref) or b"",
+                    content_type=row.tx_content_type,
+                    cache_hit=True,
+                )
+                return self._record(row, documento)
+            return None
+        finally:
+            db.close()
+
+    def _finish(self, job_id: str, estado: str, resultado: dict | None, error: dict | None) -> None:
+        db = self._session_factory()
+        try:
+            db.execute(
+                update(MinutaJob)
+                .where(MinutaJob.co_job == job_id)
+                .values(
+                    tx_estado=estado,
+                    fe_fin=datetime.now(),
+                    resultado=jsonable_encoder(resultado),
+                    error=jsonable_encoder(error),
+                    contenido=None,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def mark_persisted(self, job_id: str, id_consulta: int) -> None:
+        db = self._session_factory()
+        try:
+            db.execute(
+                update(MinutaJob)
+                .where(MinutaJob.co_job == job_id)
+                .values(id_consulta=id_consulta)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def complete(self, job_id: str, resultado: dict) -> None:
+        self._finish(job_id, EXITO, resultado, None)
+
+    def fail(self, job_id: str, error: dict) -> None:
+        self._finish(job_id, ERROR, None, error)
+
+    def get(self, job_id: str) -> JobRecord | None:
+        db = self._session_factory()
+        try:
+            row = db.get(MinutaJob, job_id)
+            return self._record(row) if row is not None else None
+        finally:
+            db.close()
+
+    def pending_count(self) -> int:
+        db = self._session_factory()
+        try:
+            return db.query(MinutaJob).filter(MinutaJob.tx_estado == PENDIENTE).count()
+        finally:
+            db.close()
+
+    def purge(self) -> int:
+        db = self._session_factory()
+        try:
+            cutoff = datetime.now() - timedelta(seconds=self.ttl_s)
+            deleted = db.execute(
+                delete(MinutaJob)
+                .where(MinutaJob.tx_estado.in_((EXITO, ERROR)), MinutaJob.fe_fin < cutoff)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+
+class MinutaJobRunner:
+    """Pool de workers (tareas asyncio) sobre un backend de jobs."""
+
+    def __init__(
+        self,
+        backend,
+        workers: int = 4,
+        max_pending: int = 100,
+        poll_s: float = 1.0,
+        callback: bool = True,
+        session_factory=None,
+        extractor: Callable[[JobRecord], Awaitable[dict]] | None = None,
+    ):
+        if session_factory is None:
+            from app.db.session import SessionLocal
+
+            session_factory = SessionLocal
+        self.backend = backend
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.poll_s = poll_s
+        self.callback = callback
+        self._session_factory = session_factory
+        self._extractor = extractor or self._extract
+        self._tasks: list[asyncio.Task] = []
+        self._wake: asyncio.Event | None = None
+        self._last_purge = 0.0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    # ---------------- ciclo de vida ----------------
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self) -> None:
+        """Arranca los workers en el event loop actual (idempotente)."""
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"minuta-job-{n}") for n in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ---------------- API ----------------
+
+    async def submit(
+        self,
+        documento: UploadedDocument,
+        co_cnl: str,
+        credencial: ResolvedCredential,
+        fecha_minuta_hint: str | None = None,
+    ) -> JobRecord:
+        """Encola la extracción; 503 + Retry-After si la cola está llena."""
+        self.start()
+        pending = await asyncio.to_thread(self.backend.pending_count)
+        if pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Cola de extracción llena, reintente más tarde",
+                headers={"Retry-After": str(RETRY_AFTER_S)},
+            )
+
+        job = JobRecord(
+            job_id=uuid.uuid4().hex,
+            co_cnl=co_cnl,
+            credencial=credencial,
+            fecha_minuta_hint=fecha_minuta_hint,
+            estado=PENDIENTE,
+            creado=datetime.now(),
+            documento=documento,
+        )
+        await asyncio.to_thread(self.backend.create, job)
+        self.submitted += 1
+        self._wake.set()
+        return job
+
+    async def get(self, job_id: str) -> JobRecord | None:
+        return await asyncio.to_thread(self.backend.get, job_id)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "workers": self.workers,
+            "running": self.running,
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    # ---------------- workers ----------------
+
+    async def _extract(self, job: JobRecord) -> dict:
+        from app.services.minuta_service import MinutaService
+
+        async def on_persisted(id_consulta: int) -> None:
+            await asyncio.to_thread(self.backend.mark_persisted, job.job_id, id_consulta)
+
+        db = self._session_factory()
+        try:
+            return await MinutaService(db).extract_document(
+                job.documento, job.co_cnl, job.credencial,
+                fecha_minuta_hint=job.fecha_minuta_hint, on_persisted=on_persisted,
+            )
+        finally:
+            db.close()
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await asyncio.to_thread(self.backend.claim)
+            except Exception as e:
+                print(f"[MINUTA-JOBS] No se pudo tomar un job: {e}")
+                job = None
+
+            if job is None:
+                await self._maybe_purge()
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_s)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job)
+
+    async def _run(self, job: JobRecord) -> None:
+        t0 = time.perf_counter()
+        try:
+            if job.id_consulta is not None:
+                # re-encolado por vencido después de guardar la consulta: sin LLM ni otra fila
+                print(f"[MINUTA-JOBS] job={job.job_id} ya tenía id_consulta={job.id_consulta}, no se re-ejecuta")
+                resultado = {"co_cnl": job.co_cnl, "payload": {"id_consulta": job.id_consulta}}
+            else:
+                resultado = await self._extractor(job)
+        except HTTPException as e:
+            await self._fail(job, {"status_code": e.status_code, "detail": e.detail})
+            return
+        except Exception as e:
+            await self._fail(job, {"status_code": 500, "detail": str(e)})
+            return
+
+        try:
+            await asyncio.to_thread(self.backend.complete, job.job_id, resultado)
+        except Exception as e:
+            print(f"[MINUTA-JOBS] job={job.job_id} no se pudo guardar el resultado: {e}")
+            self.failed += 1
+            return
+        self.completed += 1
+        print(f"[MINUTA-JOBS] job={job.job_id} EXITO en {int((time.perf_counter() - t0) * 1000)}ms")
+
+        id_consulta = ((resultado or {}).get("payload") or {}).get("id_consulta")
+        if self.callback and id_consulta:
+            await orchestrator_client.notify_orchestrator(id_consulta)
+
+    async def _fail(self, job: JobRecord, error: dict) -> None:
+        self.failed += 1
+        print(f"[MINUTA-JOBS] job={job.job_id} ERROR {error['status_code']}: {error['detail']}")
+        try:
+            await asyncio.to_thread(self.backend.fail, job.job_id, error)
+        except Exception as e:
+            print(f"[MINUTA-JOBS] job={job.job_id} no se pudo guardar el error: {e}")
+
+    async def _maybe_purge(self) -> None:
+        now = time.monotonic()
+        if now - self._last_purge < _PURGE_EVERY_S:
+            return
+        self._last_purge = now
+        try:
+            await asyncio.to_thread(self.backend.purge)
+        except Exception as e:
+            print(f"[MINUTA-JOBS] No se pudieron purgar jobs vencidos: {e}")
+
+
+def build_job_backend(backend: str, ttl_s: float = 3600):
+    if backend == InMemoryJobBackend.name:
+        return InMemoryJobBackend(ttl_s=ttl_s)
+    if backend == SqlJobBackend.name:
+        return SqlJobBackend(ttl_s=ttl_s)
+    raise ValueError(f"MINUTA_JOBS_BACKEND desconocido: {backend!r}")
+
+
+_runner: MinutaJobRunner | None = None
+
+
+def get_minuta_jobs() -> MinutaJobRunner:
+    """Runner único por proceso (los workers arrancan con el primer job o en el lifespan)."""
+    global _runner
+    if _runner is None:
+        from app.core.config import settings
+
+        _runner = MinutaJobRunner(
+            build_job_backend(settings.minuta_jobs_backend, ttl_s=settings.minuta_jobs_ttl_s),
+            workers=settings.minuta_jobs_workers,
+            max_pending=settings.minuta_jobs_max_pending,
+            poll_s=settings.minuta_jobs_poll_s,
+            callback=settings.minuta_jobs_callback,
+        )
+    return _runner
+
+
+async def stop_minuta_jobs() -> None:
+    if _runner is not None:
+        await _runner.stop()
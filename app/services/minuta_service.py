@@ -1,30 +1,27 @@
 # app/services/minuta_service.py
+import asyncio
 import time
+from functools import lru_cache
+from typing import Awaitable, Callable
 import uuid
 from fastapi import UploadFile, HTTPException
 from sqlalchemy.orm import Session
 from pydantic import ValidationError
 
-from app.models.minuta import HCredencialSeguridad, PSeguridad
-from app.models.servicio_cnl import ServicioCnl
-from app.models.servicio_cnl_prompt import ServicioCnlPrompt
+from app.core.security import ResolvedCredential, get_token_authenticator
+from app.db.session import release_connection
+
 
 from app.repositories.prompt_repository import PromptRepository
-from app.repositories.ciiu_repository import CiiuRepository
 from app.repositories.minuta_repository import MinutaRepository
-from app.repositories.catalogos_repository import (
-    PaisRepository,
-    TipoDocumentoRepository,
-    OcupacionRepository,
-    EstadoCivilRepository,
-    MonedaRepository,
-    ZonaRegistralRepository,
-)
-from app.services.openai_service import OpenAIService
-from app.utils.ingestion import get_text_from_upload
+from app.repositories.catalog_snapshot import get_catalog_snapshots
+from app.services.openai_service import OpenAIService, SYSTEM_MESSAGE
+from app.services.minuta_idempotency import EJECUTADA, build_idempotency_key, get_minuta_single_flight, has_id_consulta
+from app.services.service_config import get_service_configs
+from app.utils.ingestion import UploadedDocument, read_document
 from app.utils.parsing.payload import normalize_payload
-from app.utils.template import render_template
-from app.utils.prompt import build_service_rules_text
+from app.utils.cache import get_llm_response_cache
+from app.utils.json_utils import parse_json_strict
 
 from app.schemas.payload_schemas import CanonicalPayload
 
@@ -32,13 +29,23 @@ from app.schemas.payload_schemas import CanonicalPayload
 def _ms(dt: float) -> float:
     return round(dt * 1000, 2)
 
+
+@lru_cache(maxsize=256)
+def _payload_base_text(nombre_servicio: str, fecha_minuta_hint: str) -> str:
+    """Texto de {{payload_base}}: solo depende del servicio y la fecha, se serializa una vez."""
+    base_payload = CanonicalPayload()
+    base_payload.acto.nombre_servicio = nombre_servicio
+    if fecha_minuta_hint:
+        base_payload.acto.fecha_minuta = fecha_minuta_hint
+    return str(base_payload.model_dump(by_alias=True))
+
 class MinutaService:
     def __init__(self, db: Session):
         self.db = db
         self.prompt_repo = PromptRepository(db)
-        self.ciiu_repo = CiiuRepository(db)
         self.minuta_repo = MinutaRepository(db)
         self.ai = OpenAIService()
+        self.llm_cache = get_llm_response_cache()
 
     async def extract(
         self,
@@ -48,88 +55,108 @@ class MinutaService:
         fecha_minuta_hint: str | None = None,
     ) -> dict:
         t_total0 = time.perf_counter()
+        credencial, documento = await self.receive(file, token)
+        return await self.extract_document(
+            documento, co_cnl, credencial, fecha_minuta_hint=fecha_minuta_hint, t_total0=t_total0
+        )
+
+    async def extract_idempotent(
+        self,
+        file: UploadFile,
+        co_cnl: str,
+        token: str = None,
+        idempotency_key: str | None = None,
+        fecha_minuta_hint: str | None = None,
+    ) -> tuple[dict, str]:
+        """
+        extract() con idempotencia: reintentos idénticos (misma clave) que llegan
+        a este mismo proceso se enganchan a la ejecución en curso o reciben la
+        respuesta guardada, sin otra llamada al LLM ni otra fila en
+        p_consulta_minuta. Devuelve (respuesta, origen).
+        """
+        t_total0 = time.perf_counter()
+        credencial, documento = await self.receive(file, token)
+        key = build_idempotency_key(token, documento.sha256, co_cnl, idempotency_key)
+        result, origen = await get_minuta_single_flight().run(
+            key,
+            lambda: self.extract_document(
+                documento, co_cnl, credencial, fecha_minuta_hint=fecha_minuta_hint, t_total0=t_total0
+            ),
+            fingerprint=f"{documento.sha256}|{co_cnl}",
+            # si el histórico no se guardó (sin id_consulta), el reintento ejecuta de nuevo
+            store_if=has_id_consulta,
+        )
+        if origen != EJECUTADA:
+            print(f"[MINUTA] idempotencia: respuesta {origen} | sha256={documento.sha256[:12]}")
+        return result, origen
+
+    async def receive(self, file: UploadFile, token: str = None):
+        """Pasos 0-1: token y lectura/validación del archivo. Devuelve (credencial, documento)."""
         t0 = time.perf_counter()
 
         # 0) Validar Seguridad Token
         if not token:
             raise HTTPException(status_code=400, detail="falta token")
 
-        credencial = self.db.query(HCredencialSeguridad).join(
-            PSeguridad, HCredencialSeguridad.co_seguridad == PSeguridad.co_seguridad
-        ).filter(
-            HCredencialSeguridad.no_token_api == token,
-            HCredencialSeguridad.in_estado == 1
-        ).first()
+        credencial = get_token_authenticator().authenticate(self.db, token)
 
-        if not credencial:
-            raise HTTPException(status_code=400, detail="token incorrecto")
-
-        co_seguridad_val = credencial.co_seguridad
-        no_notaria_val = credencial.seguridad.name
-
-        # 1) Texto del archivo
-        contenido = await get_text_from_upload(file)
-        
-        # Capturamos el binario para persistencia posterior
-        await file.seek(0)
-        docx_bytes = await file.read()
+        # 1) Texto del archivo (cache por sha256; el binario se reutiliza para persistencia)
+        documento = await read_document(file)
         
         t1 = time.perf_counter()
         print(
-            f"[MINUTA] t1(get_text)={_ms(t1-t0)}ms"
+            f"[MINUTA] t1(get_text)={_ms(t1-t0)}ms "
+            f"| sha256={documento.sha256[:12]} | cache_hit={documento.cache_hit}"
         )
+        return credencial, documento
 
-        # 2) Validar existencia del Servicio y Configuración de Prompt
-        t0 = time.perf_counter()
-        
-        # Primero: ¿Existe el servicio en el maestro?
-        servicio_master = self.db.query(ServicioCnl).filter(
-            ServicioCnl.co_cnl == co_cnl,
-            ServicioCnl.in_estado == 1
-        ).first()
-        
-        if not servicio_master:
-            raise HTTPException(status_code=400, detail="servicio no disponible")
-
-        # Segundo: ¿Tiene un prompt activo configurado?
-        row = self.prompt_repo.get_prompt_and_servicio_by_co_cnl(co_cnl)
-        t2 = time.perf_counter()
-        print(f"[MINUTA] t2(prompt_repo)={_ms(t2-t0)}ms")
-
-        if not row:
-            raise HTTPException(status_code=400, detail="servicio no disponible")
-
-        prompt_obj = row.get("prompt") if isinstance(row, dict) else None
-        nombre_servicio = (row.get("de_servicio") or "").strip() if isinstance(row, dict) else ""
-        servicio_obj = row.get("servicio_obj") if isinstance(row, dict) else None  # ← Step 2.5
-
-        template = (getattr(prompt_obj, "de_promp", "") or "").strip()
-
-        if not template:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Prompt vacío/no encontrado para co_cnl={co_cnl}",
-            )
+    async def extract_document(
+        self,
+        documento: UploadedDocument,
+        co_cnl: str,
+        credencial: ResolvedCredential,
+        fecha_minuta_hint: str | None = None,
+        t_total0: float | None = None,
+        on_persisted: Callable[[int], Awaitable[None]] | None = None,
+    ) -> dict:
+        """
+        Pasos 2-10 sobre un documento ya leído (petición síncrona o job asíncrono).
+        on_persisted(id_consulta) se llama apenas queda guardada la consulta.
+        """
+        t_total0 = t_total0 or time.perf_counter()
+        co_seguridad_val = credencial.co_seguridad
+        no_notaria_val = credencial.no_notaria
+        contenido = documento.text
+        docx_bytes = documento.raw
 
-        # 2.5) Reglas de negocio parametrizadas del servicio (sin I/O de BD)
+        # 2) Configuración del servicio (cache por co_cnl: servicio, prompt compilado,
+        #    reglas y flags; la BD solo se consulta al expirar la entrada)
         t0 = time.perf_counter()
-        service_rules = build_service_rules_text(servicio_obj)
-        t2b = time.perf_counter()
+        config = get_service_configs().get(self.db, co_cnl)
+        nombre_servicio = config.de_servicio
+        prompt_version = config.prompt_version
+        compiled_template = config.compiled_template
+        service_rules = config.service_rules
+        t2 = time.perf_counter()
         print(
-            f"[MINUTA] t2.5(service_rules)={_ms(t2b-t0)}ms "
-            f"| len={len(service_rules)} "
-            f"| active={'{{service_rules}}' in template}"
+            f"[MINUTA] t2(service_config)={_ms(t2-t0)}ms "
+            f"| version={prompt_version} | rules_len={len(service_rules)} "
+            f"| loaded_at={config.loaded_at:.0f}"
         )
-        if service_rules:
-            print(f"[MINUTA] service_rules:\n{service_rules}")
 
         # 3) Catálogo CIIU (solo si el prompt lo necesita)
         t0 = time.perf_counter()
+        # Catálogos desde el snapshot en memoria (sin queries por participante)
+        catalogos = get_catalog_snapshots().repositories()
         ciiu_catalogo = ""
-        if "{{ciiu_catalogo}}" in template:
-            ciiu_catalogo = self.ciiu_repo.format_catalogo_for_prompt()
+        if config.uses_ciiu:
+            ciiu_catalogo = catalogos["ciiu_repo"].format_catalogo_for_prompt()
         t3 = time.perf_counter()
-        print(f"[MINUTA] t3(ciiu_catalogo)={_ms(t3-t0)}ms | used={'{{ciiu_catalogo}}' in template}")
+        print(f"[MINUTA] t3(ciiu_catalogo)={_ms(t3-t0)}ms | used={config.uses_ciiu}")
+
+        # Fin de las lecturas: devolvemos la conexión al pool antes del LLM.
+        # Normalización + persistencia (pasos 9-10) abren una unidad de trabajo corta.
+        release_connection(self.db)
 
         # 4) Backend arma payload base (ESTÁNDAR)
         t0 = time.perf_counter()
@@ -142,26 +169,30 @@ class MinutaService:
 
         # 5) Render template con placeholders (incluye {{service_rules}})
         t0 = time.perf_counter()
-        final_prompt = render_template(
-            template,
+        final_prompt = compiled_template.render(
             {
                 "co_cnl": co_cnl,
                 "contenido": contenido,
                 "fecha_minuta_hint": fecha_minuta_hint or "",
                 "ciiu_catalogo": ciiu_catalogo,
                 "reglas_servicio": service_rules,
-                "payload_base": base_payload.model_dump(by_alias=True),
+                "payload_base": _payload_base_text(nombre_servicio, fecha_minuta_hint or ""),
             },
         )
         t5 = time.perf_counter()
         print(f"[MINUTA] t5(render_template)={_ms(t5-t0)}ms | prompt_len={len(final_prompt or '')}")
 
-        # 6) LLM
+        # 6) LLM (o cache de respuestas: mismo modelo + system + prompt + versión)
         t0 = time.perf_counter()
         trace_id = uuid.uuid4().hex[:8]
-        raw, telemetry = self.ai.extract_json(final_prompt, trace_id=trace_id)
+        raw, telemetry = await self._extract_json_cached(
+            final_prompt, co_cnl=co_cnl, prompt_version=prompt_version, trace_id=trace_id
+        )
         t6 = time.perf_counter()
-        print(f"[MINUTA] trace={trace_id} t6(llm_extract_json)={_ms(t6-t0)}ms")
+        print(
+            f"[MINUTA] trace={trace_id} t6(llm_extract_json)={_ms(t6-t0)}ms "
+            f"| cache_hit={telemetry.get('cache_hit', False)}"
+        )
 
         # 7) Merge base + LLM
         t0 = time.perf_counter()
@@ -185,30 +216,17 @@ class MinutaService:
         t8 = time.perf_counter()
         print(f"[MINUTA] t8(pydantic_validate)={_ms(t8-t0)}ms")
 
-        # 9) Normalización final (con catálogos)
-        pais_repo = PaisRepository(self.db)
-        doc_repo = TipoDocumentoRepository(self.db)
-        ocup_repo = OcupacionRepository(self.db)
-        ec_repo = EstadoCivilRepository(self.db)
-        moneda_repo = MonedaRepository(self.db)
-        zona_repo = ZonaRegistralRepository(self.db)
-        
+        # 9) Normalización final (con catálogos del snapshot, sin BD)
         payload_dump = canonical.model_dump(by_alias=True)
         acto_p = (payload_dump.get("payload", payload_dump).get("acto") or {})
         nombre_servicio_p = (acto_p.get("nombre_servicio") or "").strip()
 
         cleaned = normalize_payload(
             payload_dump,
-            ciiu_repo=self.ciiu_repo,
-            pais_repo=pais_repo,
-            doc_repo=doc_repo,
-            ocup_repo=ocup_repo,
-            ec_repo=ec_repo,
-            moneda_repo=moneda_repo,
-            zona_repo=zona_repo,
+            **catalogos,
             texto_contexto=contenido,
             nombre_servicio=nombre_servicio_p,
-            min_otro=int(getattr(servicio_obj, "min_otro", 0) or 0),
+            min_otro=config.min_otro,
         )
 
         final_payload = cleaned
@@ -230,7 +248,15 @@ class MinutaService:
                 "completion_tokens": telemetry.get("completion_tokens"),
                 "model": telemetry.get("model"),
                 "latency_ms": telemetry.get("latency_ms"),
-                "metadata_json": {"trace_id": trace_id}
+                "metadata_json": {
+                    "trace_id": trace_id,
+                    "document_sha256": documento.sha256,
+                    "text_cache_hit": documento.cache_hit,
+                    "prompt_version": prompt_version,
+                    "cache_hit": telemetry.get("cache_hit", False),
+                    "cache_key": telemetry.get("cache_key"),
+                    "cached_usage": telemetry.get("cached_usage"),
+                }
             }
             consulta_obj = self.minuta_repo.save_full_minuta(
                 payload=final_payload,
@@ -244,6 +270,12 @@ class MinutaService:
             id_consulta_out = consulta_obj.id_consulta
         except Exception as e:
             print(f"[MINUTA] Error al guardar histórico (no crítico): {e}")
+
+        if id_consulta_out and on_persisted is not None:
+            try:
+                await on_persisted(id_consulta_out)
+            except Exception as e:
+                print(f"[MINUTA] No se pudo anotar id_consulta={id_consulta_out}: {e}")
             
         if id_consulta_out and isinstance(final_payload, dict):
             final_payload["id_consulta"] = id_consulta_out
@@ -253,6 +285,71 @@ class MinutaService:
             "payload": final_payload,
         }
 
+    async def _extract_json_cached(
+        self,
+        final_prompt: str,
+        co_cnl: str,
+        prompt_version: str,
+        trace_id: str,
+    ) -> tuple[dict, dict]:
+        """
+        Paso 6 con cache de respuestas. En un hit no se llama al LLM: la telemetría
+        queda con cache_hit=True, 0 tokens consumidos y el uso original en cached_usage.
+        """
+        cache = self.llm_cache
+        if cache is None:
+            raw, telemetry = await self.ai.extract_json(final_prompt, trace_id=trace_id)
+            telemetry["cache_hit"] = False
+            return raw, telemetry
+
+        key = cache.make_key(self.ai.gateway.model, SYSTEM_MESSAGE, final_prompt, prompt_version)
+        t0 = time.perf_counter()
+        try:
+            await asyncio.to_thread(cache.invalidate_scope, co_cnl, prompt_version)
+            cached = await asyncio.to_thread(cache.get, key)
+        except Exception as e:
+            print(f"[MINUTA] trace={trace_id} llm_cache no disponible: {e}")
+            cached = None
+
+        if cached:
+            raw = parse_json_strict(cached.get("raw_text") or "")
+            telemetry = {
+                "raw_text": cached.get("raw_text"),
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "model": cached.get("model"),
+                "latency_ms": _ms(time.perf_counter() - t0),
+                "cache_hit": True,
+                "cache_key": key,
+                "cached_usage": {
+                    "prompt_tokens": cached.get("prompt_tokens"),
+                    "completion_tokens": cached.get("completion_tokens"),
+                    "latency_ms": cached.get("latency_ms"),
+                },
+            }
+            return raw, telemetry
+
+        raw, telemetry = await self.ai.extract_json(final_prompt, trace_id=trace_id)
+        telemetry["cache_hit"] = False
+        telemetry["cache_key"] = key
+        try:
+            await asyncio.to_thread(
+                cache.set,
+                key,
+                {
+                    "raw_text": telemetry.get("raw_text"),
+                    "prompt_tokens": telemetry.get("prompt_tokens"),
+                    "completion_tokens": telemetry.get("completion_tokens"),
+                    "model": telemetry.get("model"),
+                    "latency_ms": telemetry.get("latency_ms"),
+                },
+                co_cnl,
+                prompt_version,
+            )
+        except Exception as e:
+            print(f"[MINUTA] trace={trace_id} no se pudo guardar en llm_cache: {e}")
+        return raw, telemetry
+
     def _extract_payload_object(self, raw: dict) -> dict:
         if not isinstance(raw, dict): return {}
         obj = raw
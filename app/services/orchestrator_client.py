@@ -0,0 +1,17 @@
+# app/services/orchestrator_client.py
+"""Aviso al orquestador cuando una minuta queda guardada (petición síncrona o job)."""
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+async def notify_orchestrator(id_consulta: int):
+    url = f"http://161.132.68.187:8003/api/orchestrator/start/{id_consulta}"
+    try:
+        async with httpx.AsyncClient() as client:
+            await client.post(url, timeout=5.0)
+            logger.info(f"Orquestador notificado con id_consulta={id_consulta}")
+    except Exception as e:
+        logger.error(f"Error al notificar al Orquestador: {e}")
@@ -0,0 +1,90 @@
+# app/services/scan_packing.py
+"""
+Empaquetado de varios vouchers en una sola llamada de visión.
+
+Cada escaneo individual repite el prompt de instrucciones (~60 líneas de
+reglas BCP/BBVA) junto a una sola imagen. Cuando una notaría sube varios
+vouchers de la misma operación, se envían en grupos de hasta
+SCAN_MULTI_IMAGES_PER_REQUEST imágenes por llamada: el prompt se paga una
+vez por grupo y la IA devuelve un arreglo con un resultado por imagen.
+
+Los tokens de la llamada se reparten entre las imágenes del grupo para que
+cada AuditoriaEscaneo registre su parte (ver split_tokens).
+"""
+from __future__ import annotations
+
+from app.utils.vision_image import PreparedImage
+
+MULTI_INSTRUCTIONS = """
+        MODO VARIAS IMÁGENES:
+        Recibirás {n} imágenes, cada una precedida por el texto "Imagen k:" (k de 1 a {n}).
+        Son documentos independientes: aplica TODAS las reglas anteriores a cada imagen por separado,
+        sin mezclar datos entre imágenes.
+        Devuelve SOLO este objeto JSON, con un elemento por imagen y en el mismo orden:
+        {{"resultados": [{{"imagen": 1, "medio_pago": "...", "moneda": "...", "valor_bien": "...",
+        "fecha_pago": "...", "bancos": "...", "documento_pago": "..."}}, ...]}}
+        """
+
+# tokens de imagen supuestos cuando no se pudo estimar (archivo que no abre como imagen)
+_DEFAULT_IMAGE_TOKENS = 765
+
+
+def chunked(items: list, size: int) -> list[list]:
+    size = max(1, int(size))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def build_multi_messages(prompt: str, images: list[PreparedImage]) -> list[dict]:
+    """Mensajes de chat con el prompt una sola vez y las imágenes numeradas."""
+    content: list[dict] = [{"type": "text", "text": prompt + MULTI_INSTRUCTIONS.format(n=len(images))}]
+    for k, image in enumerate(images, start=1):
+        content.append({"type": "text", "text": f"Imagen {k}:"})
+        content.append({"type": "image_url", "image_url": {"url": image.data_url(), "detail": image.detail}})
+    return [
+        {"role": "system", "content": "Devuelve SOLO un objeto JSON válido."},
+        {"role": "user", "content": content},
+    ]
+
+
+def parse_multi_results(data: dict, n: int) -> list[dict | None]:
+    """
+    Resultado por imagen (posición 0..n-1), o None si la IA no devolvió esa
+    imagen. Se ubica por el campo "imagen"; si falta, por la posición.
+    """
+    resultados = data.get("resultados") if isinstance(data, dict) else None
+    if not isinstance(resultados, list):
+        return [None] * n
+
+    out: list[dict | None] = [None] * n
+    for pos, item in enumerate(resultados):
+        if not isinstance(item, dict):
+            continue
+        k = item.get("imagen", pos + 1)
+        try:
+            idx = int(k) - 1
+        except (TypeError, ValueError):
+            idx = pos
+        if 0 <= idx < n and out[idx] is None:
+            out[idx] = {key: value for key, value in item.items() if key != "imagen"}
+    return out
+
+
+def split_tokens(total: int, weights: list[float]) -> list[int]:
+    """Reparte `total` según `weights` (mayor resto): las partes suman exactamente `total`."""
+    if not weights:
+        return []
+    weights = [max(0.0, float(w)) for w in weights]
+    wsum = sum(weights) or float(len(weights))
+    if not sum(weights):
+        weights = [1.0] * len(weights)
+    raw = [total * w / wsum for w in weights]
+    parts = [int(r) for r in raw]
+    order = sorted(range(len(raw)), key=lambda i: raw[i] - parts[i], reverse=True)
+    for i in order[: total - sum(parts)]:
+        parts[i] += 1
+    return parts
+
+
+def image_weights(images: list[PreparedImage]) -> list[int]:
+    """Peso de cada imagen en los tokens de entrada del grupo (tokens de imagen estimados)."""
+    return [image.tokens_enviados or _DEFAULT_IMAGE_TOKENS for image in images]
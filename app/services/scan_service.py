@@ -1,61 +1,30 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import event
+from sqlalchemy.orm import Session, undefer
 from fastapi import UploadFile, HTTPException
 from app.models.scan import EscaneoMedioPago, AuditoriaEscaneo, ParametroSistema
-from app.models.minuta import HCredencialSeguridad, PSeguridad
-from app.services.openai_service import client
+from app.core.security import THUMB_URL_PREFIX, build_signed_image_url, get_token_authenticator, verify_image_signature
+from app.services.llm_gateway import get_llm_gateway
+from app.db.session import SessionLocal, release_connection
+from app.repositories.scan_search import ScanSearchPlanner
 from app.core.config import settings
-from app.utils.json_utils import parse_json_strict
+from app.utils.cache.lru import LRUCache
+from app.utils.thumbnails import THUMB_SIZES, ensure_thumbnail
+from app.utils.uploads import store_upload
+from app.utils.vision_image import PreparedImage, prepare_for_vision
+from app.services.scan_writer import get_scan_writer
+from app.services.scan_packing import build_multi_messages, chunked, image_weights, parse_multi_results, split_tokens
+from app.repositories.scan_dedup import find_duplicate
+import asyncio
 import time
 import uuid
 import os
-import base64
+import csv
+import io
+import json
+from dataclasses import dataclass
 from datetime import datetime
 
-class ScanService:
-    @staticmethod
-    async def scan_medio_pago(token: str, file: UploadFile, referencia: str, db: Session):
-        start_time = time.time()
-        
-        # 0. Validar Seguridad Token y obtener co_notaria
-        credencial = db.query(HCredencialSeguridad).join(
-            PSeguridad, HCredencialSeguridad.co_seguridad == PSeguridad.co_seguridad
-        ).filter(
-            HCredencialSeguridad.no_token_api == token,
-            HCredencialSeguridad.in_estado == 1
-        ).first()
-
-        if not credencial:
-            raise HTTPException(status_code=400, detail="token incorrecto")
-
-        notaria_val = str(credencial.seguridad.name)
-        
-        # 1. Generar nombre único para el archivo
-        now = datetime.now()
-        ext = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
-        unique_filename = f"{uuid.uuid4()}_{now.strftime('%H%M%S_%d%M%Y')}.{ext}"
-        
-        folder_path = os.path.join("assets", "escaneos")
-        os.makedirs(folder_path, exist_ok=True)
-        
-        file_path = os.path.join(folder_path, unique_filename)
-        try:
-            content = await file.read()
-            with open(file_path, "wb") as f:
-                f.write(content)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"No se pudo guardar la imagen: {str(e)}")
-            
-        url_imagen = f"/{file_path.replace(os.sep, '/')}"
-        
-        # 2. Codificar imagen a Base64 para enviarla a OpenAI
-        try:
-            with open(file_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error al procesar la imagen para IA: {str(e)}")
-
-        # 3. Llamar a OpenAI con Vision
-        prompt = """
+VOUCHER_PROMPT = """
         Eres un experto en extraer datos de documentos financieros (vouchers, cheques, capturas de transferencias).
         Analiza la imagen adjunta y extrae los siguientes datos en formato JSON estricto:
         {
@@ -91,215 +60,861 @@ class ScanService:
         """
 
 
+PRECIO_PARAMS = ("PRECIO_GPT4O_MINI_INPUT", "PRECIO_GPT4O_MINI_OUTPUT")
+
+# Precios por token: leídos una vez por TTL, no en cada escaneo
+_precios_cache = LRUCache(max_items=1, ttl_s=settings.scan_pricing_ttl_s)
+
+# Totales del historial por filtros: count() sobre el join crece con la tabla
+_historial_counts = LRUCache(max_items=256, ttl_s=settings.historial_count_ttl_s)
+
+
+def _historial_filtros(planner: ScanSearchPlanner, notaria: str, referencia: str, medio_pago: str, banco: str, fecha_desde: str, fecha_hasta: str) -> list:
+    filtros = []
+    # Texto libre: columnas normalizadas con índice (fulltext / prefijo), ver scan_search
+    if notaria and (cond := planner.notaria(notaria)) is not None:
+        filtros.append(cond)
+
+    if referencia and (cond := planner.referencia(referencia)) is not None:
+        filtros.append(cond)
+
+    if medio_pago and medio_pago.strip() != "" and medio_pago != "-- Todos --":
+        filtros.append(EscaneoMedioPago.medio_pago == medio_pago)
+
+    if banco and banco.strip() != "" and banco != "-- Todos --":
+        filtros.append(EscaneoMedioPago.bancos == banco)
+
+    if fecha_desde:
+        try:
+            dt_desde = datetime.strptime(fecha_desde, "%Y-%m-%d")
+            filtros.append(EscaneoMedioPago.ts_creacion >= dt_desde)
+        except ValueError:
+            pass
+
+    if fecha_hasta:
+        try:
+            dt_hasta = datetime.strptime(fecha_hasta, "%Y-%m-%d").replace(hour=23, minute=59, second=59)
+            filtros.append(EscaneoMedioPago.ts_creacion <= dt_hasta)
+        except ValueError:
+            pass
+
+    return filtros
+
+
+def _historial_query(db: Session, include_raw: bool, notaria: str, referencia: str, medio_pago: str, banco: str, fecha_desde: str, fecha_hasta: str):
+    query = db.query(EscaneoMedioPago, AuditoriaEscaneo).outerjoin(
+        AuditoriaEscaneo, EscaneoMedioPago.id_escaneo == AuditoriaEscaneo.id_escaneo
+    )
+    # raw_ai_response es diferida: solo viaja si se pide explícitamente
+    if include_raw:
+        query = query.options(undefer(EscaneoMedioPago.raw_ai_response))
+
+    # Aplicar Filtros (Backend)
+    planner = ScanSearchPlanner.for_session(db)
+    return query.filter(*_historial_filtros(planner, notaria, referencia, medio_pago, banco, fecha_desde, fecha_hasta))
+
+
+HISTORIAL_CAMPOS = (
+    "id_escaneo", "notaria", "referencia", "url_imagen", "url_imagen_firmada", "url_miniatura",
+    "medio_pago", "moneda", "monto",
+    "fecha_pago", "bancos", "documento_pago", "ts_creacion", "raw_ai_response", "id_escaneo_origen", "estado",
+    "tokens_consumidos", "prompt_tokens", "completion_tokens", "costo_usd",
+)
+
+
+IMAGES_DIR = os.path.join("assets", "escaneos")
+
+
+def _signed_image_url(url_imagen: str | None, thumb: str | None = None) -> str | None:
+    """URL firmada (sin BD al servirla) para /assets/escaneos/<archivo> o una de sus miniaturas."""
+    if not url_imagen:
+        return None
+    filename = os.path.basename(url_imagen)
+    if thumb:
+        return build_signed_image_url(filename, prefix=f"{THUMB_URL_PREFIX}{thumb}/")
+    return build_signed_image_url(filename)
+
+
+def _image_path(filename: str) -> str:
+    # el nombre viene de la URL: nada de rutas relativas ni separadores
+    if not filename or filename != os.path.basename(filename) or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado físicamente")
+    file_path = os.path.join(IMAGES_DIR, filename)
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado físicamente")
+    return file_path
+
+
+@dataclass(frozen=True)
+class _Subida:
+    archivo: str
+    ext: str
+    unique_filename: str
+    url_imagen: str
+    content: bytes
+    hashes: dict
+
+
+async def _recibir_imagen(file: UploadFile) -> _Subida:
+    """Guarda la subida con nombre único (una sola lectura) y calcula sus hashes."""
+    now = datetime.now()
+    ext = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
+    unique_filename = f"{uuid.uuid4()}_{now.strftime('%H%M%S_%d%M%Y')}.{ext}"
+
+    file_path = os.path.join(IMAGES_DIR, unique_filename)
+    try:
+        # una sola pasada: hash + escritura en hilo; el mismo buffer va a la IA
+        upload = await store_upload(file, file_path, max_bytes=settings.scan_max_upload_mb * 1024 * 1024)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo guardar la imagen: {str(e)}")
+
+    hashes = {"hash_contenido": upload.sha256}
+
+    return _Subida(
+        archivo=file.filename,
+        ext=ext,
+        unique_filename=unique_filename,
+        url_imagen=f"/{file_path.replace(os.sep, '/')}",
+        content=upload.content,
+        hashes=hashes,
+    )
+
+
+def _buscar_duplicado(db: Session, notaria_val: str, hashes: dict) -> EscaneoMedioPago | None:
+    if not settings.scan_dedup_enabled:
+        return None
+    return find_duplicate(db, notaria_val, hashes["hash_contenido"])
+
+
+async def _preparar_imagen(subida: _Subida) -> PreparedImage:
+    try:
+        image = await asyncio.to_thread(
+            prepare_for_vision,
+            subida.content,
+            fallback_mime=f"image/{subida.ext}",
+            max_side=settings.scan_image_max_side,
+            fmt=settings.scan_image_format,
+            quality=settings.scan_image_quality,
+            detail=settings.scan_image_detail,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al procesar la imagen para IA: {str(e)}")
+    print(
+        f"[SCAN] imagen {image.bytes_original} -> {image.bytes_enviados} bytes, "
+        f"tokens img ~{image.tokens_original} -> ~{image.tokens_enviados} (detail={image.detail})"
+    )
+    return image
+
+
+def _image_audit(image: PreparedImage) -> dict:
+    return {
+        "bytes_original": image.bytes_original,
+        "bytes_enviados": image.bytes_enviados,
+        "tokens_imagen_original": image.tokens_original,
+        "tokens_imagen_enviada": image.tokens_enviados,
+        "detalle_imagen": image.detail,
+    }
+
+
+def _precios_tokens(db: Session) -> tuple[float, float]:
+    """
+    Precio por token (entrada, salida) desde la tabla de parámetros.
+    Cacheado SCAN_PRICING_TTL_S; los cambios vía ORM lo invalidan al instante.
+    """
+    precios = _precios_cache.get("precios")
+    if precios is not None:
+        return precios
+
+    valores = dict(
+        db.query(ParametroSistema.co_parametro, ParametroSistema.valor)
+        .filter(ParametroSistema.co_parametro.in_(PRECIO_PARAMS))
+        .all()
+    )
+    # Si no existen en BD, usamos los oficiales actuales (0.15 y 0.60 por millón)
+    precio_input = float(valores["PRECIO_GPT4O_MINI_INPUT"]) if "PRECIO_GPT4O_MINI_INPUT" in valores else 0.00000015
+    precio_output = float(valores["PRECIO_GPT4O_MINI_OUTPUT"]) if "PRECIO_GPT4O_MINI_OUTPUT" in valores else 0.00000060
+    precios = (precio_input, precio_output)
+    _precios_cache.set("precios", precios)
+    return precios
+
+
+@event.listens_for(ParametroSistema, "after_insert")
+@event.listens_for(ParametroSistema, "after_update")
+@event.listens_for(ParametroSistema, "after_delete")
+def _invalidate_precios(mapper, connection, target):
+    if target.co_parametro in PRECIO_PARAMS:
+        _precios_cache.clear()
+
+
+def _persistir(db: Session, escaneo: EscaneoMedioPago) -> int:
+    """Escaneo + auditorías (relación) en un flush y un commit; devuelve id_escaneo."""
+    db.add(escaneo)
+    db.flush()
+    escaneo_id = escaneo.id_escaneo  # antes del commit: después expiraría y pediría un SELECT
+    db.commit()
+    # hay un escaneo nuevo: los totales cacheados del historial quedan viejos
+    _historial_counts.clear()
+    return escaneo_id
+
+
+def _escaneo_detectado(notaria_val: str, url_imagen: str, referencia: str, detected_data: dict, hashes: dict) -> EscaneoMedioPago:
+    # Mapeo de tipo_doc según medio_pago detectado
+    co_tipo_doc = 1 # Por defecto Voucher
+    if detected_data.get("medio_pago") == "CHEQUE DE GERENCIA":
+        co_tipo_doc = 2
+    elif detected_data.get("medio_pago") == "TRANSFERENCIA DE FONDOS":
+        co_tipo_doc = 3
+
+    # Limpiar monto si viene con múltiples puntos (ej: 96.735.50) o comas
+    monto_str = detected_data.get("valor_bien")
+    monto_final = None
+    if monto_str:
+        monto_str = str(monto_str).replace(" ", "").replace(",", "")
+        if monto_str.count('.') > 1:
+            parts = monto_str.split('.')
+            monto_str = "".join(parts[:-1]) + "." + parts[-1]
         try:
-            response = client.chat.completions.create(
-                model=getattr(settings, "openai_model", "gpt-4o-mini"),
-                temperature=0,
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": "Devuelve SOLO un objeto JSON válido."},
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/{ext};base64,{base64_image}"
-                                }
-                            }
-                        ]
+            monto_final = float(monto_str)
+        except ValueError:
+            monto_final = None
+
+    return EscaneoMedioPago(
+        notaria=notaria_val,
+        co_tipo_doc=co_tipo_doc, 
+        url_imagen=url_imagen,
+        referencia=referencia,
+        medio_pago=detected_data.get("medio_pago"),
+        moneda=detected_data.get("moneda"),
+        monto=monto_final,
+        fecha_pago=datetime.strptime(detected_data.get("fecha_pago"), "%Y-%m-%d").date() if detected_data.get("fecha_pago") else None,
+        bancos=detected_data.get("bancos"),
+        documento_pago=detected_data.get("documento_pago"),
+        raw_ai_response=detected_data,
+        **hashes
+    )
+
+
+def _escaneo_copia(original: EscaneoMedioPago, notaria_val: str, url_imagen: str, referencia: str, hashes: dict) -> EscaneoMedioPago:
+    """Escaneo con la lectura de `original`; id_escaneo_origen queda enlazado si ya tiene id."""
+    return EscaneoMedioPago(
+        notaria=notaria_val,
+        co_tipo_doc=original.co_tipo_doc,
+        url_imagen=url_imagen,
+        referencia=referencia,
+        medio_pago=original.medio_pago,
+        moneda=original.moneda,
+        monto=original.monto,
+        fecha_pago=original.fecha_pago,
+        bancos=original.bancos,
+        documento_pago=original.documento_pago,
+        raw_ai_response=dict(original.raw_ai_response or {}),
+        id_escaneo_origen=original.id_escaneo,
+        **hashes
+    )
+
+
+def _escaneo_fallido(notaria_val: str, subida: _Subida, referencia: str, mensaje: str) -> EscaneoMedioPago:
+    return EscaneoMedioPago(
+        notaria=notaria_val,
+        co_tipo_doc=1, 
+        url_imagen=subida.url_imagen,
+        referencia=referencia,
+        raw_ai_response={"error": mensaje},
+        **subida.hashes
+    )
+
+
+def _vision_messages(image: PreparedImage) -> list[dict]:
+    return [
+        {"role": "system", "content": "Devuelve SOLO un objeto JSON válido."},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": VOUCHER_PROMPT},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image.data_url(),
+                        "detail": image.detail,
                     }
-                ],
+                }
+            ]
+        }
+    ]
+
+
+def _guardar_fallido(
+    db: Session,
+    notaria_val: str,
+    subida: _Subida,
+    referencia: str,
+    mensaje: str,
+    start_time: float,
+    image_audit: dict,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    precios: tuple[float, float] = (0.0, 0.0),
+) -> int:
+    """Escaneo con datos nulos + auditoría ERROR, para dejar rastro de la imagen subida."""
+    escaneo_fail = _fallido_con_auditoria(
+        notaria_val, subida, referencia, mensaje, start_time, image_audit,
+        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, precios=precios,
+    )
+    return _persistir(db, escaneo_fail)
+
+
+def _fallido_con_auditoria(
+    notaria_val: str,
+    subida: _Subida,
+    referencia: str,
+    mensaje: str,
+    start_time: float,
+    image_audit: dict,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    precios: tuple[float, float] = (0.0, 0.0),
+) -> EscaneoMedioPago:
+    """Escaneo fallido con su auditoría ERROR enlazada (sin guardar)."""
+    escaneo_fail = _escaneo_fallido(notaria_val, subida, referencia, mensaje)
+    AuditoriaEscaneo(
+        escaneo=escaneo_fail,
+        notaria=notaria_val,
+        duracion_ms=int((time.time() - start_time) * 1000),
+        tokens_consumidos=prompt_tokens + completion_tokens,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        costo_usd=prompt_tokens * precios[0] + completion_tokens * precios[1],
+        estado="ERROR",
+        mensaje_error=mensaje,
+        **image_audit
+    )
+    return escaneo_fail
+
+
+def _auditoria_sin_ia(notaria_val: str, start_time: float, estado: str, mensaje: str | None = None, **image_audit) -> AuditoriaEscaneo:
+    """Auditoría sin tokens: duplicados reutilizados o fallos antes de la respuesta de la IA."""
+    return AuditoriaEscaneo(
+        notaria=notaria_val,
+        duracion_ms=int((time.time() - start_time) * 1000),
+        tokens_consumidos=0,
+        prompt_tokens=0,
+        completion_tokens=0,
+        costo_usd=0.0,
+        estado=estado,
+        mensaje_error=mensaje,
+        **image_audit
+    )
+
+
+def _ndjson(obj: dict) -> str:
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+
+def _batch_line(indice: int, subida: _Subida, detected_data: dict, **extra) -> str:
+    data = _scan_response(None, detected_data)["data"]
+    data.pop("id_escaneo")  # se conoce al guardar: va en la línea "resumen"
+    return _ndjson({"indice": indice, "archivo": subida.archivo, "status": "success", **data, **extra})
+
+
+async def _scan_batch_lines(subidas: list[_Subida], notaria_val: str, referencia: str, start_time: float, session_factory):
+    # La sesión del request puede cerrarse antes de que termine el streaming: sesión propia
+    db = session_factory()
+    try:
+        precio_input, precio_output = _precios_tokens(db)
+        originales = {i: _buscar_duplicado(db, notaria_val, s.hashes) for i, s in enumerate(subidas)}
+        release_connection(db)
+
+        semaphore = asyncio.Semaphore(max(1, settings.scan_batch_concurrency))
+        gateway = get_llm_gateway()
+
+        async def leer(i: int):
+            """(i, detected_data | None, telemetry, image | None, error | None)"""
+            image = None
+            async with semaphore:
+                try:
+                    image = await _preparar_imagen(subidas[i])
+                    data, telemetry = await gateway.chat_json(
+                        _vision_messages(image), trace_id=subidas[i].unique_filename, tag="SCAN-BATCH"
+                    )
+                except HTTPException as e:
+                    return i, None, {}, image, str(e.detail)
+                except Exception as e:
+                    return i, None, {}, image, str(e)
+            return i, data, telemetry, image, None
+
+        async def copia_de(i: int, primaria: asyncio.Task):
+            _, data, _, _, error = await primaria
+            return i, data, {}, None, error
+
+        # Repetidas dentro del lote: una sola llamada, las demás esperan a la primera
+        tasks: dict[int, asyncio.Task] = {}
+        copias: dict[int, int] = {}
+        primera_por_hash: dict[str, int] = {}
+        for i, subida in enumerate(subidas):
+            if originales[i] is not None:
+                continue
+            h = subida.hashes["hash_contenido"]
+            if h in primera_por_hash:
+                copias[i] = primera_por_hash[h]
+            else:
+                primera_por_hash[h] = i
+                tasks[i] = asyncio.ensure_future(leer(i))
+        for i, j in copias.items():
+            tasks[i] = asyncio.ensure_future(copia_de(i, tasks[j]))
+
+        filas: dict[int, tuple[EscaneoMedioPago, AuditoriaEscaneo]] = {}
+        fallidos: dict[int, str] = {}
+        total_tokens = 0
+        total_costo = 0.0
+
+        # Repetidas de escaneos anteriores: sin IA, se responden de inmediato
+        for i, original in originales.items():
+            if original is None:
+                continue
+            subida = subidas[i]
+            filas[i] = (
+                _escaneo_copia(original, notaria_val, subida.url_imagen, referencia, subida.hashes),
+                _auditoria_sin_ia(notaria_val, start_time, "DUPLICADO"),
             )
-            
-            # Extraer respuesta
-            text_response = response.choices[0].message.content
-            detected_data = parse_json_strict(text_response)
-            
-            usage = getattr(response, "usage", None)
-            tokens_consumidos = getattr(usage, "total_tokens", 0) if usage else 0
-            prompt_tokens = getattr(usage, "prompt_tokens", 0) if usage else 0
-            completion_tokens = getattr(usage, "completion_tokens", 0) if usage else 0
-            
-            # Recuperar precios de la tabla de parámetros
-            p_input = db.query(ParametroSistema).filter_by(co_parametro='PRECIO_GPT4O_MINI_INPUT').first()
-            p_output = db.query(ParametroSistema).filter_by(co_parametro='PRECIO_GPT4O_MINI_OUTPUT').first()
-            
-            # Si no existen en BD, usamos los oficiales actuales (0.15 y 0.60 por millón)
-            precio_input = float(p_input.valor) if p_input else 0.00000015
-            precio_output = float(p_output.valor) if p_output else 0.00000060
-            
-            costo_usd = (prompt_tokens * precio_input) + (completion_tokens * precio_output)
-            
+            yield _batch_line(i, subida, original.raw_ai_response or {}, id_escaneo_origen=original.id_escaneo)
+
+        for future in asyncio.as_completed(list(tasks.values())):
+            i, data, telemetry, image, error = await future
+            subida = subidas[i]
+            extra = {"duplicado_de_indice": copias[i]} if i in copias else {}
+
+            if data is None:
+                fallidos[i] = error or "sin respuesta de la IA"
+                if i not in copias:
+                    filas[i] = (
+                        _escaneo_fallido(notaria_val, subida, referencia, fallidos[i]),
+                        _auditoria_sin_ia(
+                            notaria_val, start_time, "ERROR", fallidos[i],
+                            **(_image_audit(image) if image is not None else {})
+                        ),
+                    )
+                yield _ndjson({
+                    "indice": i, "archivo": subida.archivo, "status": "error",
+                    "error": f"Error en el procesamiento de IA: {fallidos[i]}", **extra,
+                })
+                continue
+
+            if i not in copias:
+                prompt_tokens = telemetry.get("prompt_tokens", 0)
+                completion_tokens = telemetry.get("completion_tokens", 0)
+                costo = prompt_tokens * precio_input + completion_tokens * precio_output
+                total_tokens += telemetry.get("total_tokens", 0)
+                total_costo += costo
+                filas[i] = (
+                    _escaneo_detectado(notaria_val, subida.url_imagen, referencia, data, subida.hashes),
+                    AuditoriaEscaneo(
+                        notaria=notaria_val,
+                        duracion_ms=int((time.time() - start_time) * 1000),
+                        tokens_consumidos=telemetry.get("total_tokens", 0),
+                        prompt_tokens=prompt_tokens,
+                        completion_tokens=completion_tokens,
+                        costo_usd=costo,
+                        estado="SUCCESS",
+                        **_image_audit(image)
+                    ),
+                )
+            yield _batch_line(i, subida, data, **extra)
+
+        # Todo en una transacción: primero las filas con id propio, luego las copias del lote
+        try:
+            db.add_all(escaneo for escaneo, _ in filas.values())
+            db.flush()
+            for i, j in copias.items():
+                subida = subidas[i]
+                if i in fallidos:
+                    filas[i] = (
+                        _escaneo_fallido(notaria_val, subida, referencia, fallidos[i]),
+                        _auditoria_sin_ia(notaria_val, start_time, "ERROR", fallidos[i]),
+                    )
+                else:
+                    filas[i] = (
+                        _escaneo_copia(filas[j][0], notaria_val, subida.url_imagen, referencia, subida.hashes),
+                        _auditoria_sin_ia(notaria_val, start_time, "DUPLICADO"),
+                    )
+                db.add(filas[i][0])
+            for escaneo, auditoria in filas.values():
+                escaneo.auditorias.append(auditoria)
+            db.flush()
+            # antes del commit: después expirarían y pedirían un SELECT por fila
+            id_escaneos = [filas[i][0].id_escaneo for i in range(len(subidas))]
+            db.commit()
         except Exception as e:
-            # En caso de error, guardamos la auditoría como fallida
-            duracion_ms = int((time.time() - start_time) * 1000)
-            auditoria = AuditoriaEscaneo(
-                notaria=notaria_val,
-                duracion_ms=duracion_ms,
-                tokens_consumidos=0,
-                prompt_tokens=0,
-                completion_tokens=0,
-                costo_usd=0.0,
-                estado="ERROR",
-                mensaje_error=str(e)
+            db.rollback()
+            print(f"[SCAN-BATCH] No se pudo guardar el lote de {notaria_val}: {e}")
+            yield _ndjson({"resumen": None, "error": f"No se pudo guardar el lote: {str(e)}"})
+            return
+
+        _historial_counts.clear()
+        print(f"[SCAN-BATCH] {len(subidas)} imágenes de {notaria_val}, {len(fallidos)} con error, {total_tokens} tokens")
+        yield _ndjson({"resumen": {
+            "imagenes": len(subidas),
+            "errores": len(fallidos),
+            "id_escaneos": id_escaneos,
+            "tokens_consumidos": total_tokens,
+            "costo_usd": round(total_costo, 6),
+        }})
+    finally:
+        db.close()
+
+
+def _scan_response(id_escaneo: int, detected_data: dict) -> dict:
+    return {
+        "status": "success",
+        "data": {
+            "id_escaneo": id_escaneo,
+            "tipo_documento": detected_data.get("medio_pago"),
+            "valores": {
+                "medio_pago": detected_data.get("medio_pago"),
+                "moneda": detected_data.get("moneda"),
+                "co_moneda": 1 if detected_data.get("moneda") == "SOLES" else 2,
+                "valor_bien": detected_data.get("valor_bien"),
+                "fecha_pago": detected_data.get("fecha_pago"),
+                "bancos": detected_data.get("bancos"),
+                "documento_pago": detected_data.get("documento_pago")
+            }
+        }
+    }
+
+
+def _notaria_firmante(db: Session, token: str | None) -> str | None:
+    """Notaría del token del historial; sin token no se firma ninguna imagen."""
+    if not token:
+        return None
+    credencial = get_token_authenticator().authenticate(
+        db, token, status_code=401, detail="Token incorrecto o inactivo"
+    )
+    return str(credencial.no_notaria)
+
+
+def _historial_row(e: EscaneoMedioPago, a: AuditoriaEscaneo | None, include_raw: bool, notaria_firma: str | None = None) -> dict:
+    # las URLs firmadas abren la imagen sin token: solo para la notaría autenticada
+    firmar = notaria_firma is not None and e.notaria == notaria_firma
+    return {
+        "id_escaneo": e.id_escaneo,
+        "notaria": e.notaria,
+        "referencia": e.referencia,
+        "url_imagen": e.url_imagen,
+        "url_imagen_firmada": _signed_image_url(e.url_imagen) if firmar else None,
+        "url_miniatura": _signed_image_url(e.url_imagen, thumb="sm") if firmar else None,
+        "medio_pago": e.medio_pago,
+        "moneda": e.moneda,
+        "monto": float(e.monto) if e.monto is not None else None,
+        "fecha_pago": e.fecha_pago.strftime("%Y-%m-%d") if e.fecha_pago else None,
+        "bancos": e.bancos,
+        "documento_pago": e.documento_pago,
+        "ts_creacion": e.ts_creacion.isoformat() if e.ts_creacion else None,
+        "raw_ai_response": e.raw_ai_response if include_raw else None,
+        "id_escaneo_origen": e.id_escaneo_origen,
+        "estado": a.estado if a else None,
+        "tokens_consumidos": a.tokens_consumidos if a else 0,
+        "prompt_tokens": a.prompt_tokens if a else 0,
+        "completion_tokens": a.completion_tokens if a else 0,
+        "costo_usd": float(a.costo_usd) if a and a.costo_usd is not None else 0.0
+    }
+
+
+class ScanService:
+    @staticmethod
+    async def scan_medio_pago(token: str, file: UploadFile, referencia: str, db: Session):
+        start_time = time.time()
+        
+        # 0. Validar Seguridad Token y obtener co_notaria
+        credencial = get_token_authenticator().authenticate(db, token)
+        notaria_val = str(credencial.no_notaria)
+
+        # Sin más lecturas hasta después del LLM: devolvemos la conexión al pool
+        release_connection(db)
+        
+        # 1. Guardar la imagen (una sola lectura de la subida) y calcular sus hashes
+        subida = await _recibir_imagen(file)
+
+        # 1b. ¿Misma imagen ya leída para esta notaría? Se reutiliza sin llamar a la IA
+        original = _buscar_duplicado(db, notaria_val, subida.hashes)
+        if original is not None:
+            return ScanService._save_duplicate(
+                db, original, notaria_val, subida.url_imagen, referencia, subida.hashes, start_time
             )
-            # Necesitamos un id_escaneo, pero si falló la IA antes de insertar el histórico, 
-            # tal vez queramos insertar el histórico de todas formas con datos nulos.
-            # Vamos a insertar el histórico con datos nulos para dejar rastro de la imagen subida.
-            
-            escaneo_fail = EscaneoMedioPago(
-                notaria=notaria_val,
-                co_tipo_doc=1, 
-                url_imagen=url_imagen,
-                referencia=referencia,
-                raw_ai_response={"error": str(e)}
+        # La búsqueda abrió otra transacción: se libera antes de la IA
+        release_connection(db)
+        
+        # 2. Orientar, reducir y recomprimir para la IA (en disco queda la original)
+        image = await _preparar_imagen(subida)
+        image_audit = _image_audit(image)
+
+        # 3. Llamar a OpenAI con Vision (vía LLMGateway, sin bloquear el event loop)
+        try:
+            detected_data, telemetry = await get_llm_gateway().chat_json(
+                _vision_messages(image),
+                trace_id=subida.unique_filename,
+                tag="SCAN",
             )
-            db.add(escaneo_fail)
-            db.commit()
-            db.refresh(escaneo_fail)
+
+            tokens_consumidos = telemetry.get("total_tokens", 0)
+            prompt_tokens = telemetry.get("prompt_tokens", 0)
+            completion_tokens = telemetry.get("completion_tokens", 0)
             
-            auditoria.id_escaneo = escaneo_fail.id_escaneo
-            db.add(auditoria)
-            db.commit()
+            precio_input, precio_output = _precios_tokens(db)
+            costo_usd = (prompt_tokens * precio_input) + (completion_tokens * precio_output)
+            
+        except Exception as e:
+            # En caso de error, guardamos la auditoría como fallida.
+            # El histórico se inserta con datos nulos para dejar rastro de la imagen subida.
+            _guardar_fallido(db, notaria_val, subida, referencia, str(e), start_time, image_audit)
             
             raise HTTPException(status_code=500, detail=f"Error en el procesamiento de IA: {str(e)}")
 
-        # 4. Guardar en Histórico (Éxito)
-        # Mapeo de tipo_doc según medio_pago detectado
-        co_tipo_doc = 1 # Por defecto Voucher
-        if detected_data.get("medio_pago") == "CHEQUE DE GERENCIA":
-            co_tipo_doc = 2
-        elif detected_data.get("medio_pago") == "TRANSFERENCIA DE FONDOS":
-            co_tipo_doc = 3
-
-        # Limpiar monto si viene con múltiples puntos (ej: 96.735.50) o comas
-        monto_str = detected_data.get("valor_bien")
-        monto_final = None
-        if monto_str:
-            monto_str = str(monto_str).replace(" ", "").replace(",", "")
-            if monto_str.count('.') > 1:
-                parts = monto_str.split('.')
-                monto_str = "".join(parts[:-1]) + "." + parts[-1]
-            try:
-                monto_final = float(monto_str)
-            except ValueError:
-                monto_final = None
-
-        escaneo = EscaneoMedioPago(
+        # 4. Histórico + Auditoría (Éxito): un flush y un commit vía la relación
+        escaneo = _escaneo_detectado(notaria_val, subida.url_imagen, referencia, detected_data, subida.hashes)
+        AuditoriaEscaneo(
+            escaneo=escaneo,
             notaria=notaria_val,
-            co_tipo_doc=co_tipo_doc, 
-            url_imagen=url_imagen,
-            referencia=referencia,
-            medio_pago=detected_data.get("medio_pago"),
-            moneda=detected_data.get("moneda"),
-            monto=monto_final,
-            fecha_pago=datetime.strptime(detected_data.get("fecha_pago"), "%Y-%m-%d").date() if detected_data.get("fecha_pago") else None,
-            bancos=detected_data.get("bancos"),
-            documento_pago=detected_data.get("documento_pago"),
-            raw_ai_response=detected_data
-        )
-
-        
-        db.add(escaneo)
-        db.commit()
-        db.refresh(escaneo)
-        
-        # 5. Guardar en Auditoría (Éxito)
-        duracion_ms = int((time.time() - start_time) * 1000)
-        auditoria = AuditoriaEscaneo(
-            id_escaneo=escaneo.id_escaneo,
-            notaria=notaria_val,
-            duracion_ms=duracion_ms,
+            duracion_ms=int((time.time() - start_time) * 1000),
             tokens_consumidos=tokens_consumidos,
             prompt_tokens=prompt_tokens,
             completion_tokens=completion_tokens,
             costo_usd=costo_usd,
-            estado="SUCCESS"
+            estado="SUCCESS",
+            **image_audit
+        )
+
+        if settings.scan_write_behind:
+            # Se responde ya; el INSERT lo hace el hilo escritor (sin id_escaneo en la respuesta)
+            await get_scan_writer().submit(escaneo, on_commit=_historial_counts.clear)
+            return _scan_response(None, detected_data)
+
+        return _scan_response(_persistir(db, escaneo), detected_data)
+
+    @staticmethod
+    async def scan_multi(token: str, files: list[UploadFile], referencia: str, db: Session):
+        """
+        Varios vouchers en una o pocas llamadas de visión (ver scan_packing).
+        Cada imagen queda como su propio EscaneoMedioPago/AuditoriaEscaneo con
+        su parte de los tokens. Devuelve un resultado por archivo, en orden.
+        """
+        start_time = time.time()
+        if not files:
+            raise HTTPException(status_code=400, detail="Debe enviar al menos una imagen")
+        if len(files) > settings.scan_multi_max_files:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Máximo {settings.scan_multi_max_files} imágenes por solicitud",
+            )
+
+        credencial = get_token_authenticator().authenticate(db, token)
+        notaria_val = str(credencial.no_notaria)
+        release_connection(db)
+
+        subidas = [await _recibir_imagen(f) for f in files]
+
+        # Repetidas: contra escaneos previos de la notaría o dentro del mismo lote
+        originales: dict[int, EscaneoMedioPago] = {}
+        pendientes: list[int] = []
+        copias: dict[int, int] = {}  # posición -> posición de la primera con el mismo contenido
+        primera_por_hash: dict[str, int] = {}
+        for i, subida in enumerate(subidas):
+            original = _buscar_duplicado(db, notaria_val, subida.hashes)
+            if original is not None:
+                originales[i] = original
+            elif subida.hashes["hash_contenido"] in primera_por_hash:
+                copias[i] = primera_por_hash[subida.hashes["hash_contenido"]]
+            else:
+                primera_por_hash[subida.hashes["hash_contenido"]] = i
+                pendientes.append(i)
+        # Las búsquedas abrieron otra transacción: se libera antes de la IA
+        release_connection(db)
+
+        images = {i: await _preparar_imagen(subidas[i]) for i in pendientes}
+        grupos = chunked(pendientes, settings.scan_multi_images_per_request)
+
+        async def leer_grupo(grupo: list[int]):
+            messages = build_multi_messages(VOUCHER_PROMPT, [images[i] for i in grupo])
+            try:
+                data, telemetry = await get_llm_gateway().chat_json(
+                    messages, trace_id=subidas[grupo[0]].unique_filename, tag="SCAN-MULTI"
+                )
+            except Exception as e:
+                return grupo, None, {}, str(e)
+            return grupo, parse_multi_results(data, len(grupo)), telemetry, None
+
+        lecturas = await asyncio.gather(*(leer_grupo(g) for g in grupos))
+
+        precio_input, precio_output = _precios_tokens(db)
+        filas: dict[int, EscaneoMedioPago] = {}
+        detectados_por: dict[int, dict] = {}
+        errores: dict[int, str] = {}
+        total_tokens = 0
+        total_costo = 0.0
+
+        for i, original in originales.items():
+            subida = subidas[i]
+            filas[i] = _escaneo_copia(original, notaria_val, subida.url_imagen, referencia, subida.hashes)
+            _auditoria_sin_ia(notaria_val, start_time, "DUPLICADO").escaneo = filas[i]
+            detectados_por[i] = dict(original.raw_ai_response or {})
+
+        for grupo, detectados, telemetry, error in lecturas:
+            group_images = [images[i] for i in grupo]
+            prompt_parts = split_tokens(telemetry.get("prompt_tokens", 0), image_weights(group_images))
+            completion_parts = split_tokens(telemetry.get("completion_tokens", 0), [1] * len(grupo))
+            total_tokens += telemetry.get("total_tokens", 0)
+
+            for pos, i in enumerate(grupo):
+                subida = subidas[i]
+                image_audit = _image_audit(images[i])
+                detected_data = detectados[pos] if detectados else None
+                if detected_data is None:
+                    errores[i] = error or f"La IA no devolvió resultado para la imagen {pos + 1} del grupo"
+                    filas[i] = _fallido_con_auditoria(
+                        notaria_val, subida, referencia, errores[i], start_time, image_audit,
+                        prompt_tokens=prompt_parts[pos], completion_tokens=completion_parts[pos],
+                        precios=(precio_input, precio_output),
+                    )
+                    continue
+
+                filas[i] = _escaneo_detectado(notaria_val, subida.url_imagen, referencia, detected_data, subida.hashes)
+                costo = prompt_parts[pos] * precio_input + completion_parts[pos] * precio_output
+                total_costo += costo
+                AuditoriaEscaneo(
+                    escaneo=filas[i],
+                    notaria=notaria_val,
+                    duracion_ms=int((time.time() - start_time) * 1000),
+                    tokens_consumidos=prompt_parts[pos] + completion_parts[pos],
+                    prompt_tokens=prompt_parts[pos],
+                    completion_tokens=completion_parts[pos],
+                    costo_usd=costo,
+                    estado="SUCCESS",
+                    **image_audit
+                )
+                detectados_por[i] = detected_data
+
+        # Todo en una transacción: primero las filas con id propio, luego las copias del lote
+        try:
+            db.add_all(filas.values())
+            db.flush()
+            for i, j in copias.items():
+                subida = subidas[i]
+                if j in errores:
+                    errores[i] = errores[j]
+                    filas[i] = _fallido_con_auditoria(
+                        notaria_val, subida, referencia, errores[j], start_time, _image_audit(images[j])
+                    )
+                else:
+                    filas[i] = _escaneo_copia(filas[j], notaria_val, subida.url_imagen, referencia, subida.hashes)
+                    _auditoria_sin_ia(notaria_val, start_time, "DUPLICADO").escaneo = filas[i]
+                    detectados_por[i] = detectados_por[j]
+                db.add(filas[i])
+            db.flush()
+            # antes del commit: después expirarían y pedirían un SELECT por fila
+            ids = {i: (e.id_escaneo, e.id_escaneo_origen) for i, e in filas.items()}
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(status_code=500, detail=f"No se pudo guardar el lote: {str(e)}")
+
+        resultados: list[dict] = []
+        for i in range(len(subidas)):
+            id_escaneo, id_origen = ids[i]
+            if i in errores:
+                resultados.append({"id_escaneo": id_escaneo, "error": f"Error en el procesamiento de IA: {errores[i]}"})
+                continue
+            resultado = _scan_response(id_escaneo, detectados_por[i])["data"]
+            if id_origen is not None:
+                resultado["id_escaneo_origen"] = id_origen
+            resultados.append(resultado)
+
+        _historial_counts.clear()
+        print(
+            f"[SCAN-MULTI] {len(subidas)} imágenes de {notaria_val}: "
+            f"{len(grupos)} llamadas IA, {total_tokens} tokens"
         )
-        db.add(auditoria)
-        db.commit()
-        
         return {
             "status": "success",
-            "data": {
-                "id_escaneo": escaneo.id_escaneo,
-                "tipo_documento": detected_data.get("medio_pago"),
-                "valores": {
-                    "medio_pago": detected_data.get("medio_pago"),
-                    "moneda": detected_data.get("moneda"),
-                    "co_moneda": 1 if detected_data.get("moneda") == "SOLES" else 2,
-                    "valor_bien": detected_data.get("valor_bien"),
-                    "fecha_pago": detected_data.get("fecha_pago"),
-                    "bancos": detected_data.get("bancos"),
-                    "documento_pago": detected_data.get("documento_pago")
-                }
-            }
+            "data": [
+                {"archivo": subida.archivo, **resultado}
+                for subida, resultado in zip(subidas, resultados)
+            ],
+            "meta": {
+                "imagenes": len(subidas),
+                "llamadas_ia": len(grupos),
+                "tokens_consumidos": total_tokens,
+                "costo_usd": round(total_costo, 6),
+            },
         }
 
     @staticmethod
-    def get_historial(limit: int, offset: int, notaria: str, referencia: str, medio_pago: str, banco: str, fecha_desde: str, fecha_hasta: str, db: Session):
+    async def scan_batch(token: str, files: list[UploadFile], referencia: str, db: Session, session_factory=None):
+        """
+        Lote de vouchers con una llamada de visión por imagen, en paralelo
+        (hasta SCAN_BATCH_CONCURRENCY a la vez). Token, precios y duplicados se
+        resuelven una vez por lote. Devuelve un generador NDJSON: una línea por
+        imagen apenas termina (en orden de llegada, con "indice") y al final una
+        línea "resumen" con los id_escaneo, tras guardar todo en una transacción.
+        Las subidas se leen antes de empezar a responder.
+        """
+        start_time = time.time()
+        if not files:
+            raise HTTPException(status_code=400, detail="Debe enviar al menos una imagen")
+        if len(files) > settings.scan_batch_max_files:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Máximo {settings.scan_batch_max_files} imágenes por lote",
+            )
+
+        credencial = get_token_authenticator().authenticate(db, token)
+        notaria_val = str(credencial.no_notaria)
+        release_connection(db)
+
+        subidas = list(await asyncio.gather(*(_recibir_imagen(f) for f in files)))
+        return _scan_batch_lines(subidas, notaria_val, referencia, start_time, session_factory or SessionLocal)
+
+    @staticmethod
+    def _save_duplicate(db: Session, original: EscaneoMedioPago, notaria_val: str, url_imagen: str, referencia: str, hashes: dict, start_time: float):
+        """Nuevo escaneo con la lectura de `original` (sin IA), enlazado a él."""
+        detected_data = dict(original.raw_ai_response or {})
+        escaneo = _escaneo_copia(original, notaria_val, url_imagen, referencia, hashes)
+        _auditoria_sin_ia(notaria_val, start_time, "DUPLICADO").escaneo = escaneo
+        escaneo_id = _persistir(db, escaneo)
+        print(f"[SCAN] imagen repetida de {notaria_val}: reutiliza escaneo {original.id_escaneo} sin IA")
+
+        response = _scan_response(escaneo_id, detected_data)
+        response["data"]["id_escaneo_origen"] = original.id_escaneo
+        return response
+
+    @staticmethod
+    def get_historial(limit: int, offset: int, notaria: str, referencia: str, medio_pago: str, banco: str, fecha_desde: str, fecha_hasta: str, db: Session, include_raw: bool = False, cursor: int = None, token: str = None):
+        # 0. Token opcional: solo habilita URLs firmadas de las imágenes de su notaría
+        notaria_firma = _notaria_firmante(db, token)
+
         # 1. Consultar base de datos (TODOS los registros para el administrador)
-        query = db.query(EscaneoMedioPago, AuditoriaEscaneo).outerjoin(
-            AuditoriaEscaneo, EscaneoMedioPago.id_escaneo == AuditoriaEscaneo.id_escaneo
-        )
-        
-        # Aplicar Filtros (Backend)
-        if notaria:
-            query = query.filter(EscaneoMedioPago.notaria.ilike(f"%{notaria}%"))
-            
-        if referencia:
-            query = query.filter(EscaneoMedioPago.referencia.ilike(f"%{referencia}%"))
-            
-        if medio_pago and medio_pago.strip() != "" and medio_pago != "-- Todos --":
-            query = query.filter(EscaneoMedioPago.medio_pago == medio_pago)
-            
-        if banco and banco.strip() != "" and banco != "-- Todos --":
-            query = query.filter(EscaneoMedioPago.bancos == banco)
-            
-        if fecha_desde:
-            try:
-                dt_desde = datetime.strptime(fecha_desde, "%Y-%m-%d")
-                query = query.filter(EscaneoMedioPago.ts_creacion >= dt_desde)
-            except ValueError:
-                pass
-                
-        if fecha_hasta:
-            try:
-                dt_hasta = datetime.strptime(fecha_hasta, "%Y-%m-%d").replace(hour=23, minute=59, second=59)
-                query = query.filter(EscaneoMedioPago.ts_creacion <= dt_hasta)
-            except ValueError:
-                pass
-        
-        # 2. Total
-        total = query.count()
-        
+        query = _historial_query(db, include_raw, notaria, referencia, medio_pago, banco, fecha_desde, fecha_hasta)
+
+        # 2. Total (cache de TTL corto por combinación de filtros)
+        count_key = (notaria, referencia, medio_pago, banco, fecha_desde, fecha_hasta)
+        total = _historial_counts.get(count_key)
+        if total is None:
+            total = query.count()
+            _historial_counts.set(count_key, total)
+
         # 3. Paginación y orden (más recientes primero)
-        resultados = query.order_by(EscaneoMedioPago.id_escaneo.desc()).offset(offset).limit(limit).all()
+        query = query.order_by(EscaneoMedioPago.id_escaneo.desc())
+        if cursor is not None:
+            # Keyset: id_escaneo < cursor usa el índice de la PK, sin recorrer las filas saltadas
+            resultados = query.filter(EscaneoMedioPago.id_escaneo < cursor).limit(limit + 1).all()
+        else:
+            resultados = query.offset(offset).limit(limit + 1).all()
+
+        has_more = len(resultados) > limit
+        resultados = resultados[:limit]
+        next_cursor = resultados[-1][0].id_escaneo if (has_more and resultados) else None
 
         # 4. Formatear respuesta
-        data = []
-        for e, a in resultados:
-            data.append({
-                "id_escaneo": e.id_escaneo,
-                "notaria": e.notaria,
-                "referencia": e.referencia,
-                "url_imagen": e.url_imagen,
-                "medio_pago": e.medio_pago,
-                "moneda": e.moneda,
-                "monto": float(e.monto) if e.monto is not None else None,
-                "fecha_pago": e.fecha_pago.strftime("%Y-%m-%d") if e.fecha_pago else None,
-                "bancos": e.bancos,
-                "documento_pago": e.documento_pago,
-                "ts_creacion": e.ts_creacion.isoformat() if e.ts_creacion else None,
-                "raw_ai_response": e.raw_ai_response,
-                "estado": a.estado if a else None,
-                "tokens_consumidos": a.tokens_consumidos if a else 0,
-                "prompt_tokens": a.prompt_tokens if a else 0,
-                "completion_tokens": a.completion_tokens if a else 0,
-                "costo_usd": float(a.costo_usd) if a and a.costo_usd is not None else 0.0
-            })
+        data = [_historial_row(e, a, include_raw, notaria_firma) for e, a in resultados]
 
         return {
             "status": "success",
@@ -307,24 +922,69 @@ class ScanService:
             "meta": {
                 "total": total,
                 "limit": limit,
-                "offset": offset
+                "offset": offset if cursor is None else None,
+                "cursor": cursor,
+                "next_cursor": next_cursor
             }
         }
 
     @staticmethod
-    def get_image(filename: str, token: str, db: Session):
-        # 0. Validar Seguridad Token y obtener co_notaria
-        credencial = db.query(HCredencialSeguridad).join(
-            PSeguridad, HCredencialSeguridad.co_seguridad == PSeguridad.co_seguridad
-        ).filter(
-            HCredencialSeguridad.no_token_api == token,
-            HCredencialSeguridad.in_estado == 1
-        ).first()
+    def export_historial(formato: str, notaria: str, referencia: str, medio_pago: str, banco: str, fecha_desde: str, fecha_hasta: str, include_raw: bool = False, session_factory=None, batch_size: int = 500, token: str = None):
+        """
+        Generador con el historial completo (mismos filtros que get_historial) como
+        líneas NDJSON o CSV. Lee con cursor del lado del servidor (yield_per): la
+        memoria no depende de la cantidad de filas.
 
-        if not credencial:
-            raise HTTPException(status_code=401, detail="Token incorrecto o inactivo")
+        Abre su propia Session: el generador se consume después de que el endpoint
+        retornó, cuando la Session de get_db ya está cerrada.
+        """
+        session_factory = session_factory or SessionLocal
+        campos = [c for c in HISTORIAL_CAMPOS if include_raw or c != "raw_ai_response"]
 
-        notaria_val = str(credencial.seguridad.name)
+        # el token se valida antes de empezar el stream (401 en vez de un cuerpo cortado)
+        notaria_firma = None
+        if token:
+            db = session_factory()
+            try:
+                notaria_firma = _notaria_firmante(db, token)
+            finally:
+                db.close()
+
+        def generate():
+            db = session_factory()
+            try:
+                query = _historial_query(db, include_raw, notaria, referencia, medio_pago, banco, fecha_desde, fecha_hasta)
+                query = query.order_by(EscaneoMedioPago.id_escaneo.desc()).yield_per(batch_size)
+
+                if formato == "csv":
+                    buf = io.StringIO()
+                    writer = csv.DictWriter(buf, fieldnames=campos, extrasaction="ignore")
+                    writer.writeheader()
+                    yield buf.getvalue()
+                    for e, a in query:
+                        row = _historial_row(e, a, include_raw, notaria_firma)
+                        if include_raw and row["raw_ai_response"] is not None:
+                            row["raw_ai_response"] = json.dumps(row["raw_ai_response"], ensure_ascii=False)
+                        buf.seek(0)
+                        buf.truncate()
+                        writer.writerow(row)
+                        yield buf.getvalue()
+                else:
+                    for e, a in query:
+                        row = _historial_row(e, a, include_raw, notaria_firma)
+                        yield json.dumps({c: row[c] for c in campos}, ensure_ascii=False) + "\n"
+            finally:
+                db.close()
+
+        return generate()
+
+    @staticmethod
+    def get_image(filename: str, token: str, db: Session):
+        # 0. Validar Seguridad Token y obtener co_notaria
+        credencial = get_token_authenticator().authenticate(
+            db, token, status_code=401, detail="Token incorrecto o inactivo"
+        )
+        notaria_val = str(credencial.no_notaria)
 
         # 1. Verificar que la imagen existe en la BD para esta notaría
         url_imagen_db = f"/assets/escaneos/{filename}"
@@ -340,8 +1000,23 @@ class ScanService:
             raise HTTPException(status_code=403, detail="No tienes permiso para ver esta imagen o no existe")
 
         # 2. Verificar existencia física
-        file_path = os.path.join("assets", "escaneos", filename)
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Archivo no encontrado físicamente")
+        return _image_path(filename)
+
+    @staticmethod
+    def get_signed_image(filename: str, exp: int, sig: str):
+        """Imagen por URL firmada (url_imagen_firmada del historial): sin acceso a BD."""
+        if not verify_image_signature(filename, exp, sig):
+            raise HTTPException(status_code=403, detail="Enlace de imagen inválido o expirado")
+        return _image_path(filename)
 
-        return file_path
+    @staticmethod
+    def get_thumbnail(file_path: str, size: str):
+        """Miniatura WebP de una imagen ya autorizada; se genera en la primera petición."""
+        if size not in THUMB_SIZES:
+            raise HTTPException(status_code=404, detail=f"Tamaño de miniatura no soportado. Use: {', '.join(THUMB_SIZES)}")
+        try:
+            return ensure_thumbnail(file_path, size)
+        except (OSError, ValueError) as e:
+            # PIL.UnidentifiedImageError es OSError: archivo que no es imagen
+            print(f"[SCAN] No se pudo generar la miniatura de {os.path.basename(file_path)}: {e}")
+            raise HTTPException(status_code=415, detail="No se pudo generar la miniatura de la imagen")
@@ -0,0 +1,113 @@
+# app/services/scan_writer.py
+"""
+Escritura diferida (write-behind) de escaneos.
+
+Con SCAN_WRITE_BEHIND=true el escaneo y su auditoría se entregan a un hilo
+escritor y la respuesta sale apenas se interpreta la lectura de la IA; el
+INSERT + COMMIT ocurre después, con su propia sesión. La respuesta no trae
+id_escaneo (aún no existe): quien lo necesite debe dejarlo desactivado.
+
+- Un solo hilo escribe en orden de llegada (sin competir por el pool).
+- Si hay SCAN_WRITE_BEHIND_MAX_PENDING escrituras en cola, la petición espera
+  su propia escritura (contrapresión en lugar de acumular memoria sin límite),
+  hecha en un hilo con asyncio.to_thread: nunca bloquea el event loop.
+- flush() espera a que la cola se vacíe (apagado del proceso, tests).
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable
+
+
+class ScanWriteBehind:
+    def __init__(self, session_factory=None, max_pending: int = 1000):
+        if session_factory is None:
+            from app.db.session import SessionLocal
+
+            session_factory = SessionLocal
+        self._session_factory = session_factory
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scan-writer")
+        self._lock = threading.Lock()
+        self._futures: set[Future] = set()
+        self.max_pending = max(1, int(max_pending))
+        self.written = 0
+        self.failed = 0
+        self.inline = 0
+
+    def _write(self, rows: list, on_commit: Callable[[], None] | None) -> None:
+        db = self._session_factory()
+        try:
+            db.add_all(rows)
+            db.commit()
+            with self._lock:
+                self.written += len(rows)
+        except Exception as e:
+            db.rollback()
+            with self._lock:
+                self.failed += len(rows)
+            print(f"[SCAN-WRITER] No se pudo guardar el escaneo: {e}")
+            raise
+        finally:
+            db.close()
+        if on_commit is not None:
+            on_commit()
+
+    async def submit(self, *rows, on_commit: Callable[[], None] | None = None) -> Future:
+        """Encola rows (objetos ORM nuevos, sin sesión) para INSERT + COMMIT."""
+        with self._lock:
+            saturated = len(self._futures) >= self.max_pending
+            if saturated:
+                self.inline += 1
+        if saturated:
+            future: Future = Future()
+            try:
+                await asyncio.to_thread(self._write, list(rows), on_commit)
+                future.set_result(None)
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        future = self._executor.submit(self._write, list(rows), on_commit)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._futures.discard(future)
+
+    def flush(self, timeout: float | None = None) -> None:
+        with self._lock:
+            pending = list(self._futures)
+        wait(pending, timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": len(self._futures),
+                "written": self.written,
+                "failed": self.failed,
+                "inline": self.inline,
+                "max_pending": self.max_pending,
+            }
+
+
+_writer: ScanWriteBehind | None = None
+
+
+def get_scan_writer() -> ScanWriteBehind:
+    """Escritor único por proceso (se crea en el primer uso)."""
+    global _writer
+    if _writer is None:
+        from app.core.config import settings
+
+        _writer = ScanWriteBehind(max_pending=settings.scan_write_behind_max_pending)
+    return _writer
+
+
+def flush_scan_writer(timeout: float | None = None) -> None:
+    if _writer is not None:
+        _writer.flush(timeout)
@@ -0,0 +1,125 @@
+# app/services/service_config.py
+"""
+Cache de configuración por co_cnl: fila ServicioCnl, plantilla compilada,
+reglas del servicio ya construidas y flags (uses_ciiu, min_otro).
+
+Hay solo unas decenas de co_cnl; antes cada extracción repetía la query de
+existencia del servicio, el JOIN servicio -> relación -> prompt y
+build_service_rules_text. Con el cache, los pasos 2-2.5 son un lookup en un
+dict. Las entradas expiran a los SERVICE_CONFIG_TTL_S segundos (o con
+invalidate()) y se recargan en el siguiente uso.
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.models.servicio_cnl import ServicioCnl
+from app.repositories.catalog_snapshot import snapshot_row
+from app.repositories.prompt_repository import PromptRepository
+from app.utils.cache.lru import LRUCache
+from app.utils.prompt import build_prompt_version, build_service_rules_text
+from app.utils.template import CompiledTemplate, compile_template
+
+
+@dataclass(frozen=True)
+class ServiceConfig:
+    co_cnl: str
+    de_servicio: str
+    servicio: SimpleNamespace       # copia de la fila ServicioCnl (sin Session)
+    co_prompt: int | None
+    template: str
+    compiled_template: CompiledTemplate
+    service_rules: str
+    prompt_version: str
+    uses_ciiu: bool                 # el prompt tiene {{ciiu_catalogo}}
+    min_otro: int
+    loaded_at: float
+
+
+def load_service_config(db: Session, co_cnl: str) -> ServiceConfig:
+    """
+    Lee y arma la configuración de un co_cnl desde BD.
+    Lanza HTTPException con los mismos códigos que el pipeline de minutas.
+    """
+    # ¿Existe el servicio en el maestro?
+    servicio_master = db.query(ServicioCnl).filter(
+        ServicioCnl.co_cnl == co_cnl,
+        ServicioCnl.in_estado == 1
+    ).first()
+    if not servicio_master:
+        raise HTTPException(status_code=400, detail="servicio no disponible")
+
+    # ¿Tiene un prompt activo configurado?
+    row = PromptRepository(db).get_prompt_and_servicio_by_co_cnl(co_cnl)
+    if not row:
+        raise HTTPException(status_code=400, detail="servicio no disponible")
+
+    prompt_obj = row.get("prompt")
+    servicio_obj = row.get("servicio_obj")
+    template = (getattr(prompt_obj, "de_promp", "") or "").strip()
+    if not template:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Prompt vacío/no encontrado para co_cnl={co_cnl}",
+        )
+
+    servicio = snapshot_row(servicio_obj)
+    co_prompt = getattr(prompt_obj, "co_prompt", None)
+    prompt_version = build_prompt_version(prompt_obj, servicio)
+    compiled = compile_template(template, key=(co_prompt, prompt_version))
+
+    return ServiceConfig(
+        co_cnl=co_cnl,
+        de_servicio=(row.get("de_servicio") or "").strip(),
+        servicio=servicio,
+        co_prompt=co_prompt,
+        template=template,
+        compiled_template=compiled,
+        service_rules=build_service_rules_text(servicio),
+        prompt_version=prompt_version,
+        uses_ciiu="ciiu_catalogo" in compiled.placeholders,
+        min_otro=int(getattr(servicio, "min_otro", 0) or 0),
+        loaded_at=time.time(),
+    )
+
+
+class ServiceConfigCache:
+    def __init__(self, ttl_s: float = 300, max_items: int = 256, loader=load_service_config):
+        self._cache = LRUCache(max_items=max_items, ttl_s=ttl_s)
+        self.loader = loader
+        self.loads = 0
+
+    def get(self, db: Session, co_cnl: str) -> ServiceConfig:
+        config = self._cache.get(co_cnl)
+        if config is None:
+            config = self.loader(db, co_cnl)
+            self._cache.set(co_cnl, config)
+            self.loads += 1
+        return config
+
+    def invalidate(self, co_cnl: str | None = None) -> None:
+        if co_cnl is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(co_cnl)
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "loads": self.loads}
+
+
+_service_configs: ServiceConfigCache | None = None
+
+
+def get_service_configs() -> ServiceConfigCache:
+    """Cache único por proceso."""
+    global _service_configs
+    if _service_configs is None:
+        from app.core.config import settings
+
+        _service_configs = ServiceConfigCache(ttl_s=settings.service_config_ttl_s)
+    return _service_configs
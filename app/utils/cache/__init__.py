@@ -0,0 +1,12 @@
+# app/utils/cache/__init__.py
+from .lru import LRUCache
+from .text_cache import DocumentTextCache, sha256_hex
+from .llm_response_cache import LLMResponseCache, get_llm_response_cache
+
+__all__ = [
+    "LRUCache",
+    "DocumentTextCache",
+    "sha256_hex",
+    "LLMResponseCache",
+    "get_llm_response_cache",
+]
@@ -0,0 +1,171 @@
+# app/utils/cache/llm_response_cache.py
+"""
+Cache persistente de respuestas del LLM (match exacto).
+
+Clave = sha256(model, mensaje de sistema, prompt renderizado, versión del prompt).
+Con temperature=0 la misma entrada produce la misma salida, así que un hit
+evita la latencia y el costo en tokens de la llamada.
+
+- Persistencia: archivo SQLite local (sobrevive reinicios y se comparte entre
+  los workers del mismo nodo).
+- TTL por entrada + evicción LRU por cantidad de entradas.
+- Cada entrada guarda su "scope" (co_cnl) y "version" (hash del Prompt.de_promp y
+  de la parametrización de ServicioCnl). Cuando la versión de un co_cnl cambia,
+  las entradas viejas ya no pueden coincidir (la versión es parte de la clave)
+  y además se purgan con invalidate_scope().
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_response (
+    cache_key   TEXT PRIMARY KEY,
+    scope       TEXT,
+    version     TEXT,
+    payload     TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_llm_response_scope ON llm_response(scope, version);
+CREATE INDEX IF NOT EXISTS ix_llm_response_access ON llm_response(last_access);
+"""
+
+
+class LLMResponseCache:
+    def __init__(self, path: str, ttl_s: float = 7 * 24 * 3600, max_entries: int = 5000):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._scope_versions: dict[str, str] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(model: str, system: str, prompt: str, version: str = "") -> str:
+        raw = json.dumps([model or "", system or "", prompt or "", version or ""], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ── SQLite ───────────────────────────────────────────────────────────────
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(_SCHEMA)
+                    conn.commit()
+                    self._initialized = True
+        return conn
+
+    # ── API ──────────────────────────────────────────────────────────────────
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT payload, created_at FROM llm_response WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            payload, created_at = row
+            if self.ttl_s and created_at + self.ttl_s <= now:
+                conn.execute("DELETE FROM llm_response WHERE cache_key = ?", (key,))
+                conn.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+
+            conn.execute("UPDATE llm_response SET last_access = ? WHERE cache_key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return json.loads(payload)
+        finally:
+            conn.close()
+
+    def set(self, key: str, value: dict, scope: str = "", version: str = "") -> None:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_response (cache_key, scope, version, payload, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, scope, version, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            (count,) = conn.execute("SELECT COUNT(*) FROM llm_response").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM llm_response WHERE cache_key IN ("
+                    "SELECT cache_key FROM llm_response ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            conn.commit()
+        finally:
+            conn.close()
+
+    def invalidate_scope(self, scope: str, current_version: str) -> int:
+        """
+        Borra las entradas de un scope (co_cnl) cuya versión no es la actual.
+        Solo toca la BD cuando este proceso ve un cambio de versión.
+        """
+        if self._scope_versions.get(scope) == current_version:
+            return 0
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "DELETE FROM llm_response WHERE scope = ? AND version <> ?", (scope, current_version)
+            )
+            conn.commit()
+            deleted = cur.rowcount or 0
+        finally:
+            conn.close()
+        self._scope_versions[scope] = current_version
+        self.invalidations += deleted
+        return deleted
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+_cache: LLMResponseCache | None = None
+
+
+def get_llm_response_cache() -> LLMResponseCache | None:
+    """Instancia única por proceso; None si está deshabilitado (LLM_CACHE_ENABLED=false)."""
+    global _cache
+    from app.core.config import settings
+
+    if not settings.llm_cache_enabled:
+        return None
+    if _cache is None:
+        os.makedirs(os.path.dirname(os.path.abspath(settings.llm_cache_path)), exist_ok=True)
+        _cache = LLMResponseCache(
+            path=settings.llm_cache_path,
+            ttl_s=settings.llm_cache_ttl_s,
+            max_entries=settings.llm_cache_max_entries,
+        )
+    return _cache
@@ -0,0 +1,179 @@
+# app/utils/cache/text_cache.py
+"""
+Cache content-addressed del texto extraído de PDF/DOCX.
+
+La clave es el SHA-256 de los bytes subidos: si un notario reenvía la misma
+minuta (aunque sea con otro co_cnl) no se vuelve a parsear con pypdf/python-docx.
+
+Dos niveles:
+  1) Memoria (LRU por proceso).
+  2) Disco opcional (TEXT_CACHE_DIR), compartido entre workers del mismo nodo,
+     con evicción por tamaño total (se borran primero los menos usados).
+
+Desde código async usar aget/aset: el nivel disco corre en un hilo y no
+bloquea el event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import threading
+
+from app.utils.cache.lru import LRUCache
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data or b"").hexdigest()
+
+
+class DocumentTextCache:
+    def __init__(
+        self,
+        max_items: int = 256,
+        disk_dir: str | None = None,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+    ):
+        self.memory = LRUCache(max_items=max_items)
+        self.disk_dir = disk_dir or None
+        self.max_disk_bytes = max(0, int(max_disk_bytes))
+        self._disk_lock = threading.Lock()
+        self._disk_bytes: int | None = None  # se calcula en el primer uso
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+
+    # ── API ──────────────────────────────────────────────────────────────────
+
+    def get(self, sha256: str) -> str | None:
+        text = self.memory.get(sha256)
+        if text is not None:
+            self.memory_hits += 1
+            return text
+
+        text = self._disk_get(sha256)
+        if text is not None:
+            self.disk_hits += 1
+            self.memory.set(sha256, text)
+            return text
+
+        self.misses += 1
+        return None
+
+    def set(self, sha256: str, text: str) -> None:
+        self.memory.set(sha256, text)
+        self._disk_set(sha256, text)
+
+    async def aget(self, sha256: str) -> str | None:
+        """get() con la lectura de disco fuera del event loop."""
+        text = self.memory.get(sha256)
+        if text is not None:
+            self.memory_hits += 1
+            return text
+        if not self.disk_dir:
+            self.misses += 1
+            return None
+        return await asyncio.to_thread(self.get, sha256)
+
+    async def aset(self, sha256: str, text: str) -> None:
+        """set() con la escritura (y evicción) de disco fuera del event loop."""
+        self.memory.set(sha256, text)
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_set, sha256, text)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_enabled": bool(self.disk_dir),
+            "disk_bytes": self._disk_bytes or 0,
+            "disk_evictions": self.disk_evictions,
+        }
+
+    # ── Nivel disco ──────────────────────────────────────────────────────────
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.disk_dir, sha256[:2], f"{sha256}.txt")
+
+    def _disk_get(self, sha256: str) -> str | None:
+        if not self.disk_dir:
+            return None
+        path = self._path(sha256)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            os.utime(path, None)  # marca de uso reciente para la evicción
+            return text
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"[TEXT_CACHE] No se pudo leer {path}: {e}")
+            return None
+
+    def _disk_set(self, sha256: str, text: str) -> None:
+        if not self.disk_dir or self.max_disk_bytes <= 0:
+            return
+        path = self._path(sha256)
+        data = text.encode("utf-8")
+        if len(data) > self.max_disk_bytes:
+            return
+        try:
+            old_size = os.path.getsize(path)  # reescritura: no sumar dos veces
+        except OSError:
+            old_size = 0
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)  # escritura atómica (otros workers leen el mismo dir)
+        except OSError as e:
+            print(f"[TEXT_CACHE] No se pudo escribir {path}: {e}")
+            return
+
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(data) - old_size
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _list_disk_entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        for root, _dirs, files in os.walk(self.disk_dir):
+            for name in files:
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _scan_disk_bytes(self) -> int:
+        return sum(size for _, size, _ in self._list_disk_entries())
+
+    def _evict_disk(self) -> None:
+        """Borra los archivos menos usados hasta quedar en el 90% del límite."""
+        entries = sorted(self._list_disk_entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_disk_bytes * 0.9)
+        for _mtime, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.disk_evictions += 1
+            except OSError:
+                continue
+        self._disk_bytes = total
@@ -0,0 +1,98 @@
+# app/utils/fuzzy_matcher.py
+"""
+Matcher difuso en memoria para catálogos pequeños (Ocupación, CIIU).
+
+Cada descripción se pliega (mayúsculas, sin tildes) y se vectoriza con
+n-gramas de caracteres ponderados por TF-IDF; la matriz (filas x n-gramas)
+se arma una sola vez en NumPy. Una consulta es un producto matriz-vector:
+se obtiene el coseno contra todo el catálogo en una operación y gana el
+mayor, si supera el umbral de confianza.
+"""
+from __future__ import annotations
+
+import math
+from collections import Counter
+from typing import Any
+
+import numpy as np
+
+from app.utils.parsing.text import fold_upper
+
+
+def char_ngrams(text: str, n: int = 3) -> Counter:
+    """Trigramas por palabra con bordes: "SOL" -> " SO", "SOL", "OL "."""
+    grams: Counter = Counter()
+    for word in fold_upper(text).split(" "):
+        if not word:
+            continue
+        padded = f" {word} "
+        if len(padded) <= n:
+            grams[padded] += 1
+            continue
+        for i in range(len(padded) - n + 1):
+            grams[padded[i:i + n]] += 1
+    return grams
+
+
+class NgramMatcher:
+    def __init__(self, rows: list, text_attr: str, n: int = 3, threshold: float = 0.5):
+        self.rows = list(rows)
+        self.n = n
+        self.threshold = threshold
+
+        grams_per_row = [char_ngrams(str(getattr(r, text_attr, "") or ""), n) for r in self.rows]
+
+        self.vocab: dict[str, int] = {}
+        df: Counter = Counter()
+        for grams in grams_per_row:
+            df.update(grams.keys())
+            for g in grams:
+                self.vocab.setdefault(g, len(self.vocab))
+
+        n_docs = max(1, len(self.rows))
+        self.idf = np.ones(len(self.vocab), dtype=np.float32)
+        for g, idx in self.vocab.items():
+            self.idf[idx] = math.log((1 + n_docs) / (1 + df[g])) + 1.0
+        # peso para n-gramas que no existen en el catálogo (penalizan la norma de la consulta)
+        self.oov_idf = math.log(1 + n_docs) + 1.0
+
+        self.matrix = np.zeros((len(self.rows), len(self.vocab)), dtype=np.float32)
+        for i, grams in enumerate(grams_per_row):
+            for g, tf in grams.items():
+                j = self.vocab[g]
+                self.matrix[i, j] = tf * self.idf[j]
+        norms = np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix /= norms
+
+    def _query_vector(self, text: str) -> np.ndarray | None:
+        grams = char_ngrams(text, self.n)
+        if not grams:
+            return None
+        q = np.zeros(len(self.vocab), dtype=np.float32)
+        oov_sq = 0.0
+        for g, tf in grams.items():
+            j = self.vocab.get(g)
+            if j is None:
+                oov_sq += (tf * self.oov_idf) ** 2
+            else:
+                q[j] = tf * self.idf[j]
+        norm = math.sqrt(float(q @ q) + oov_sq)
+        return q / norm if norm else None
+
+    def scores(self, text: str) -> np.ndarray:
+        """Coseno de `text` contra cada fila del catálogo."""
+        q = self._query_vector(text)
+        if q is None or not len(self.rows):
+            return np.zeros(len(self.rows), dtype=np.float32)
+        return self.matrix @ q
+
+    def best(self, text: str, threshold: float | None = None) -> tuple[Any, float]:
+        """(fila, score) del mejor match; (None, score) si no supera el umbral."""
+        if not self.rows:
+            return None, 0.0
+        s = self.scores(text)
+        i = int(np.argmax(s))
+        score = float(s[i])
+        limit = self.threshold if threshold is None else threshold
+        return (self.rows[i] if score >= limit else None), score
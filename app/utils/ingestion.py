@@ -1,7 +1,19 @@
 # app/utils/ingestion.py
+import asyncio
+from dataclasses import dataclass
 from fastapi import UploadFile, HTTPException
 from io import BytesIO
 
+from app.core.config import settings
+from app.utils.cache import DocumentTextCache, sha256_hex
+
+# Cache content-addressed (sha256 de los bytes) del texto extraído
+text_cache = DocumentTextCache(
+    max_items=settings.text_cache_max_items,
+    disk_dir=settings.text_cache_dir,
+    max_disk_bytes=settings.text_cache_max_disk_mb * 1024 * 1024,
+)
+
 ALLOWED_MIME = {
     "application/pdf",
     "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
@@ -15,14 +27,53 @@ def _ensure_allowed(file: UploadFile):
             detail=f"Formato no permitido: {file.content_type}. Solo PDF o Word (DOC/DOCX)."
         )
 
-async def get_text_from_upload(file: UploadFile) -> str:
+@dataclass
+class UploadedDocument:
+    text: str
+    sha256: str          # hash de los bytes subidos (clave del cache, reutilizable aguas abajo)
+    raw: bytes
+    content_type: str
+    cache_hit: bool
+
+
+async def read_document(file: UploadFile) -> UploadedDocument:
     """
-    Lee un UploadFile (PDF o Word) y devuelve el texto extraído.
+    Lee un UploadFile (PDF o Word) una sola vez y devuelve texto + hash + bytes.
+    Si el mismo archivo ya fue parseado (mismo sha256), no se vuelve a parsear.
     """
     _ensure_allowed(file)
     raw = await file.read()
+    sha256 = sha256_hex(raw)
+
+    text = await text_cache.aget(sha256)
+    cache_hit = text is not None
+    if not cache_hit:
+        # pypdf / python-docx son CPU-bound: fuera del event loop
+        text = await asyncio.to_thread(extract_text_from_bytes, raw, file.content_type)
+        await text_cache.aset(sha256, text)
+
+    return UploadedDocument(
+        text=text,
+        sha256=sha256,
+        raw=raw,
+        content_type=file.content_type,
+        cache_hit=cache_hit,
+    )
+
 
-    if file.content_type == "application/pdf":
+async def get_text_from_upload(file: UploadFile) -> str:
+    """
+    Lee un UploadFile (PDF o Word) y devuelve el texto extraído.
+    """
+    doc = await read_document(file)
+    return doc.text
+
+
+def extract_text_from_bytes(raw: bytes, content_type: str) -> str:
+    """
+    Parsea los bytes de un PDF o Word y devuelve el texto (sin cache).
+    """
+    if content_type == "application/pdf":
         try:
             from pypdf import PdfReader
         except Exception as e:
@@ -1,4 +1,5 @@
 import re
+import unicodedata
 
 def only_digits(s: str) -> str:
     return re.sub(r"\D+", "", s or "")
@@ -19,4 +20,13 @@ def get_str(d: dict, *keys: str, default: str = "") -> str:
 def clean_dict_str_fields(obj: dict, keys: tuple[str, ...]) -> None:
     for k in keys:
         if k in obj and isinstance(obj[k], str):
-            obj[k] = clean_spaces(obj[k])
\ No newline at end of file
+            obj[k] = clean_spaces(obj[k])
+
+def fold_upper(s: str) -> str:
+    """
+    Mayúsculas, sin tildes y con espacios colapsados: "  Perú  " -> "PERU".
+    Equivale a comparar con una collation *_ai_ci de MySQL.
+    """
+    s = unicodedata.normalize("NFKD", s or "")
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return clean_spaces(s).upper()
@@ -1,9 +1,11 @@
 # app/utils/prompt/__init__.py
 from .service_rules_builder import build_service_rules_text
 from .prompt_mappers import map_tipo_persona_prompt, map_obligatoriedad_prompt
+from .prompt_version import build_prompt_version
 
 __all__ = [
     "build_service_rules_text",
     "map_tipo_persona_prompt",
     "map_obligatoriedad_prompt",
+    "build_prompt_version",
 ]
@@ -0,0 +1,32 @@
+# app/utils/prompt/prompt_version.py
+"""
+Versión (hash) de la configuración de un servicio: texto del prompt +
+parametrización de ServicioCnl. Si cualquiera cambia, cambia la versión y
+los caches que dependen de ella (respuestas LLM, plantillas) se invalidan.
+Sin I/O, sin BD.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+
+# Columnas de ServicioCnl que influyen en el prompt o en la normalización
+SERVICIO_PARAM_FIELDS = (
+    "de_servicio",
+    "no_otorgante", "min_otorgante", "in_tipo_otorgante",
+    "no_beneficiario", "min_beneficiario", "in_tipo_beneficiario",
+    "no_otro", "min_otro", "in_tipo_otro",
+    "in_medio_pago", "in_oportunidad_pago",
+    "in_bienes", "in_aporte_bienes",
+)
+
+
+def build_prompt_version(prompt_obj, servicio_obj) -> str:
+    """Hash corto y estable de (Prompt.co_prompt, Prompt.de_promp, parametrización ServicioCnl)."""
+    parts = {
+        "co_prompt": getattr(prompt_obj, "co_prompt", None),
+        "de_promp": getattr(prompt_obj, "de_promp", None) or "",
+        "servicio": {f: getattr(servicio_obj, f, None) for f in SERVICIO_PARAM_FIELDS},
+    }
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
@@ -1,14 +1,71 @@
 # app/utils/template.py
 from __future__ import annotations
 
-from typing import Any
+import re
+from typing import Any, Hashable
+
+from app.utils.cache.lru import LRUCache
+
+_PLACEHOLDER_RE = re.compile(r"\{\{(\w+)\}\}")
+
+
+class CompiledTemplate:
+    """
+    Plantilla parseada una sola vez en segmentos literal / placeholder.
+    render() arma el resultado con un único join: el texto del documento
+    (50-200 KB) se copia una sola vez, no una vez por cada placeholder.
+    """
+    __slots__ = ("literals", "names")
+
+    def __init__(self, template: str):
+        parts = _PLACEHOLDER_RE.split(template or "")
+        self.literals: list[str] = parts[0::2]
+        self.names: list[str] = parts[1::2]
+
+    @property
+    def placeholders(self) -> set[str]:
+        return set(self.names)
+
+    def render(self, context: dict[str, Any]) -> str:
+        context = context or {}
+        values: dict[str, str] = {}
+        out = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            if name in context:
+                v = values.get(name)
+                if v is None:
+                    raw = context[name]
+                    v = values[name] = "" if raw is None else str(raw)
+                out.append(v)
+            else:
+                # placeholder sin valor: se deja tal cual (igual que antes)
+                out.append(f"{{{{{name}}}}}")
+            out.append(literal)
+        return "".join(out)
+
+
+# Plantillas compiladas por (co_prompt, versión del prompt)
+_compiled_templates = LRUCache(max_items=128)
+
+
+def compile_template(template: str, key: Hashable | None = None) -> CompiledTemplate:
+    """
+    Compila (o recupera del cache) una plantilla.
+    key: identificador estable, p.ej. (co_prompt, prompt_version); sin key no se cachea.
+    """
+    if key is None:
+        return CompiledTemplate(template)
+    compiled = _compiled_templates.get(key)
+    if compiled is None:
+        compiled = CompiledTemplate(template)
+        _compiled_templates.set(key, compiled)
+    return compiled
+
 
 def render_template(template: str, context: dict[str, Any]) -> str:
     """
     Reemplaza placeholders estilo {{key}} por valores string.
     No usa f-strings ni format() para evitar problemas con llaves JSON.
+    Una sola pasada: el contenido insertado no se vuelve a interpretar como plantilla.
     """
-    result = template or ""
-    for k, v in (context or {}).items():
-        result = result.replace(f"{{{{{k}}}}}", "" if v is None else str(v))
-    return result
+    return CompiledTemplate(template).render(context)
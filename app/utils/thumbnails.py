@@ -0,0 +1,66 @@
+# app/utils/thumbnails.py
+"""
+Miniaturas WebP de las imágenes de escaneos (vouchers, capturas).
+
+El historial mostraba la imagen original (a menudo varios MB) en una celda
+pequeña. Las miniaturas se generan la primera vez que se piden y quedan en
+disco junto a las originales (<dir>/thumbs/<archivo>.<tamaño>.webp); las
+siguientes peticiones sirven el archivo ya generado.
+"""
+from __future__ import annotations
+
+import io
+import os
+import tempfile
+
+from PIL import Image, ImageOps
+
+# lado mayor (px) por tamaño
+THUMB_SIZES = {"sm": 160, "md": 480}
+THUMB_QUALITY = 75
+
+
+def thumbnail_path(image_path: str, size: str) -> str:
+    folder, name = os.path.split(image_path)
+    return os.path.join(folder, "thumbs", f"{name}.{size}.webp")
+
+
+def render_thumbnail(image_path: str, max_side: int) -> bytes:
+    """Miniatura WebP respetando la orientación EXIF (fotos de celular)."""
+    with Image.open(image_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="WEBP", quality=THUMB_QUALITY, method=4)
+        return out.getvalue()
+
+
+def ensure_thumbnail(image_path: str, size: str) -> str:
+    """
+    Ruta de la miniatura `size` de `image_path`, generándola si no existe
+    o si la original es más nueva. Escritura atómica (tmp + rename).
+    """
+    if size not in THUMB_SIZES:
+        raise ValueError(f"tamaño de miniatura desconocido: {size!r}")
+
+    path = thumbnail_path(image_path, size)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(image_path):
+            return path
+    except OSError:
+        pass
+
+    data = render_thumbnail(image_path, THUMB_SIZES[size])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
@@ -0,0 +1,77 @@
+# app/utils/uploads.py
+"""
+Lectura única de archivos subidos (UploadFile).
+
+El escaneo leía la subida completa, la escribía con open() bloqueante dentro
+del event loop y luego volvía a abrir el archivo para codificarlo. Aquí la
+subida se recorre una sola vez por bloques: cada bloque se hashea (SHA-256),
+se escribe a disco en un hilo (el event loop no se bloquea) y se conserva
+para quien procesa la imagen. El tamaño máximo acota la memoria: al pasarlo
+se corta la lectura con 413 y se borra lo escrito.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+from dataclasses import dataclass
+
+from fastapi import HTTPException, UploadFile
+
+CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class StoredUpload:
+    path: str
+    content: bytes
+    sha256: str
+
+    @property
+    def size(self) -> int:
+        return len(self.content)
+
+
+async def store_upload(
+    file: UploadFile,
+    dest_path: str,
+    max_bytes: int,
+    chunk_size: int = CHUNK_SIZE,
+) -> StoredUpload:
+    """
+    Escribe `file` en `dest_path` (tmp + rename, nunca queda a medias) y
+    devuelve su contenido y hash. 413 si supera `max_bytes`.
+    """
+    folder = os.path.dirname(dest_path)
+    if folder:
+        await asyncio.to_thread(os.makedirs, folder, exist_ok=True)
+
+    tmp_path = f"{dest_path}.part"
+    digest = hashlib.sha256()
+    chunks: list[bytes] = []
+    size = 0
+
+    f = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"La imagen supera el tamaño máximo permitido ({max_bytes // (1024 * 1024)} MB)",
+                )
+            digest.update(chunk)
+            chunks.append(chunk)
+            await asyncio.to_thread(f.write, chunk)
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.replace, tmp_path, dest_path)
+    except BaseException:
+        f.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return StoredUpload(path=dest_path, content=b"".join(chunks), sha256=digest.hexdigest())
@@ -0,0 +1,134 @@
+# app/utils/vision_image.py
+"""
+Preparación de imágenes de vouchers antes de la llamada de visión.
+
+Las capturas de celular (3-12 MP) se enviaban tal cual en base64: más bytes
+de subida y más tokens de imagen, sin mejorar la lectura de un voucher.
+Antes de enviarlas:
+
+  1. se corrige la orientación EXIF (la foto llega "acostada"),
+  2. se reduce el lado mayor a SCAN_IMAGE_MAX_SIDE,
+  3. se recomprime (JPEG/WebP, SCAN_IMAGE_QUALITY),
+  4. se elige el `detail` de la API: con SCAN_IMAGE_DETAIL=auto, "low" si la
+     imagen ya entra en 512x512 (mismo contenido, costo fijo) y "high" si no.
+
+La imagen guardada en disco sigue siendo la original. Si el archivo no se
+puede abrir como imagen se envía sin cambios, como antes.
+"""
+from __future__ import annotations
+
+import base64
+import io
+import math
+from dataclasses import dataclass
+
+from PIL import Image, ImageOps
+
+DETAILS = ("auto", "low", "high")
+FORMATS = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# tarifa de imágenes de la API: "low" es fijo; "high" cobra por tiles de 512px
+_LOW_DETAIL_TOKENS = 85
+_TILE_TOKENS = 170
+_LOW_DETAIL_SIDE = 512
+
+
+def estimate_image_tokens(width: int, height: int, detail: str = "high") -> int:
+    """
+    Tokens de imagen estimados según la regla publicada para gpt-4o(-mini):
+    encajar en 2048x2048, lado menor a 768, tiles de 512 (170 c/u) + 85 base.
+    El multiplicador propio de cada modelo no se aplica: sirve para comparar.
+    """
+    if detail == "low" or width <= 0 or height <= 0:
+        return _LOW_DETAIL_TOKENS
+    scale = min(1.0, 2048 / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    tiles = math.ceil(w / 512) * math.ceil(h / 512)
+    return _TILE_TOKENS * tiles + _LOW_DETAIL_TOKENS
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    data: bytes
+    mime: str
+    detail: str
+    width: int | None
+    height: int | None
+    bytes_original: int
+    tokens_original: int | None
+    tokens_enviados: int | None
+
+    @property
+    def bytes_enviados(self) -> int:
+        return len(self.data)
+
+    def data_url(self) -> str:
+        return f"data:{self.mime};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+
+def _pick_detail(width: int, height: int, detail: str) -> str:
+    if detail != "auto":
+        return detail
+    return "low" if max(width, height) <= _LOW_DETAIL_SIDE else "high"
+
+
+def prepare_for_vision(
+    content: bytes,
+    fallback_mime: str = "image/jpeg",
+    max_side: int = 1600,
+    fmt: str = "JPEG",
+    quality: int = 80,
+    detail: str = "auto",
+) -> PreparedImage:
+    """Orienta, reduce y recomprime `content`; decide el `detail` de la llamada."""
+    fmt = fmt.upper()
+    if fmt not in FORMATS:
+        raise ValueError(f"formato de imagen no soportado: {fmt!r}")
+    if detail not in DETAILS:
+        raise ValueError(f"detail desconocido: {detail!r}")
+
+    try:
+        img = Image.open(io.BytesIO(content))
+        img.load()
+    except Exception:
+        return PreparedImage(
+            data=content, mime=fallback_mime, detail="high" if detail == "auto" else detail,
+            width=None, height=None, bytes_original=len(content),
+            tokens_original=None, tokens_enviados=None,
+        )
+
+    with img:
+        tokens_original = estimate_image_tokens(*img.size)
+        src_format = img.format
+        needs_rewrite = img.getexif().get(0x0112, 1) != 1 or max(img.size) > max_side
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            # sin alfa: JPEG no lo soporta y un voucher no lo necesita
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            rgba = img.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            img = background
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        out = io.BytesIO()
+        img.save(out, format=fmt, quality=quality, optimize=fmt == "JPEG")
+        data, mime = out.getvalue(), FORMATS[fmt]
+        width, height = img.size
+
+    # Ya pequeña y bien comprimida: recomprimir solo agregaría pérdidas
+    if len(data) >= len(content) and src_format in FORMATS and not needs_rewrite:
+        data, mime = content, FORMATS[src_format]
+
+    chosen = _pick_detail(width, height, detail)
+    return PreparedImage(
+        data=data,
+        mime=mime,
+        detail=chosen,
+        width=width,
+        height=height,
+        bytes_original=len(content),
+        tokens_original=tokens_original,
+        tokens_enviados=estimate_image_tokens(width, height, chosen),
+    )
@@ -1,17 +1,64 @@
 # main.py
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi import HTTPException
 
 from app.api.v1.router import router as v1_router
+from app.core.config import settings
+from app.db.session import pool_metrics, query_audit
+from app.utils.ingestion import text_cache
+from app.utils.cache import get_llm_response_cache
+from app.repositories.catalog_snapshot import get_catalog_snapshots
+from app.services.service_config import get_service_configs
+from app.core.security import get_token_authenticator
+from app.services.scan_writer import flush_scan_writer, get_scan_writer
+from app.services.minuta_jobs import get_minuta_jobs, stop_minuta_jobs
+from app.services.minuta_idempotency import get_minuta_single_flight
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Precarga del snapshot de catálogos (si la BD no responde, se reintenta en el primer uso)
+    try:
+        get_catalog_snapshots().refresh()
+    except Exception as e:
+        print(f"[STARTUP] No se pudo precargar el snapshot de catálogos: {e}")
+    if not settings.image_url_secret:
+        print("[STARTUP] IMAGE_URL_SECRET no configurado: URLs firmadas de imágenes desactivadas")
+    if settings.minuta_jobs_backend == "memory":
+        # cada worker de gunicorn tiene su cola: el GET del job puede caer en otro y dar 404
+        print("[STARTUP] MINUTA_JOBS_BACKEND=memory: los jobs asíncronos solo funcionan con un único worker (WEB_CONCURRENCY=1)")
+    # workers de extracción asíncrona (con backend sql toman jobs encolados por otros nodos)
+    get_minuta_jobs().start()
+    yield
+    await stop_minuta_jobs()
+    # escaneos pendientes del write-behind (SCAN_WRITE_BEHIND)
+    flush_scan_writer(timeout=30)
+
 
 app = FastAPI(
     title="API Minutas",
     version="1.0.0",
-    description="Extracción estructurada de minutas notariales usando GPT."
+    description="Extracción estructurada de minutas notariales usando GPT.",
+    lifespan=lifespan,
 )
 
+@app.middleware("http")
+async def audit_queries(request: Request, call_next):
+    # Acumula filas/bytes ORM de la petición bajo la plantilla de la ruta
+    if query_audit is None:
+        return await call_next(request)
+    token = query_audit.begin()
+    try:
+        return await call_next(request)
+    finally:
+        route = request.scope.get("route")
+        endpoint = f"{request.method} {getattr(route, 'path', '<sin ruta>')}"
+        query_audit.end(token, endpoint)
+
 @app.get("/")
 def root():
     return {"ok": True, "docs": "/docs", "health": "/health"}
@@ -20,6 +67,22 @@ def root():
 def health():
     return {"status": "ok"}
 
+@app.get("/health/metrics")
+def health_metrics():
+    llm_cache = get_llm_response_cache()
+    return {
+        "db_pool": pool_metrics.snapshot(),
+        "text_cache": text_cache.stats(),
+        "llm_cache": llm_cache.stats() if llm_cache else None,
+        "catalogos": get_catalog_snapshots().stats(),
+        "service_configs": get_service_configs().stats(),
+        "auth": get_token_authenticator().stats(),
+        "query_audit": query_audit.snapshot() if query_audit else None,
+        "scan_writer": get_scan_writer().stats() if settings.scan_write_behind else None,
+        "minuta_jobs": get_minuta_jobs().stats(),
+        "minuta_idempotency": get_minuta_single_flight().stats(),
+    }
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     return JSONResponse(
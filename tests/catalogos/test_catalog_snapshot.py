@@ -0,0 +1,118 @@
+# tests/catalogos/test_catalog_snapshot.py
+"""
+Unit tests para CatalogSnapshot y sus repositorios drop-in.
+No requieren BD: el snapshot se arma con filas simuladas.
+Ejecutar: python -m pytest tests/catalogos/test_catalog_snapshot.py -v
+"""
+import sys
+import os
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.repositories.catalog_snapshot import (
+    CatalogSnapshot,
+    CatalogSnapshotManager,
+    SnapshotCiiuRepository,
+    SnapshotOcupacionRepository,
+    SnapshotPaisRepository,
+    SnapshotTipoDocumentoRepository,
+    SnapshotZonaRegistralRepository,
+)
+from app.utils.parsing.payload import normalize_payload
+
+
+def R(**kw):
+    return SimpleNamespace(**kw)
+
+
+def make_snapshot() -> CatalogSnapshot:
+    return CatalogSnapshot(
+        paises=[
+            R(co_pais=51, no_pais="PERÚ", gerundio_pais="PERUANO"),
+            R(co_pais=756, no_pais="SUIZA", gerundio_pais="SUIZO"),
+        ],
+        tipos_documento=[R(co_tipo_documento=1, nc_tipo_documento="DNI"), R(co_tipo_documento=6, nc_tipo_documento="RUC")],
+        ocupaciones=[
+            R(co_ocupacion=10, de_ocupacion="COMERCIANTE MAYORISTA"),
+            R(co_ocupacion=11, de_ocupacion="COMERCIANTE"),
+            R(co_ocupacion=20, de_ocupacion="INGENIERO CIVIL"),
+            R(co_ocupacion=116, de_ocupacion="OTROS (ESPECIFICAR)"),
+        ],
+        estados_civiles=[R(co_tipo_estado_civil=1, no_tipo_estado_civil="SOLTERO")],
+        monedas=[R(co_tipo_moneda=1, no_tipo_moneda="SOLES")],
+        zonas=[R(co_zona_registral="09", no_zona_registral="ZONA REGISTRAL N° IX - SEDE LIMA", nc_zona_registral="LIMA")],
+        ciius=[
+            R(co_ciiu=6, de_actividad="CONSTRUCCION"),
+            R(co_ciiu=11, de_actividad="ACTIVIDADES INMOBILIARIAS, EMPRESARIALES Y DE ALQUILER"),
+        ],
+    )
+
+
+class TestSnapshotRepositories:
+
+    def test_pais_por_nombre_y_por_gentilicio(self):
+        repo = SnapshotPaisRepository(make_snapshot())
+        row, by_gerundio = repo.find_by_name_or_gentilicio("peru")
+        assert row.co_pais == 51 and by_gerundio is False
+
+        row, by_gerundio = repo.find_by_name_or_gentilicio("Suizo")
+        assert row.co_pais == 756 and by_gerundio is True
+
+        assert repo.find_by_name_or_gentilicio("") == (None, False)
+        assert repo.find_by_name("MARTE") is None
+
+    def test_ocupacion_exacta_tokens_y_fallback(self):
+        repo = SnapshotOcupacionRepository(make_snapshot())
+        assert repo.find_by_desc("comerciante").co_ocupacion == 11
+        # match difuso: la ocupación más parecida
+        assert repo.find_by_desc("INGENIERO").co_ocupacion == 20
+        assert repo.find_by_desc("ASTRONAUTA").co_ocupacion == 116
+        assert repo.find_by_desc("  ") is None
+
+    def test_zona_por_nc_o_nombre(self):
+        repo = SnapshotZonaRegistralRepository(make_snapshot())
+        assert repo.find_by_name_or_nc("lima").co_zona_registral == "09"
+        assert repo.find_by_name_or_nc("ZONA REGISTRAL N° IX - SEDE LIMA").co_zona_registral == "09"
+
+    def test_ciiu_best_match(self):
+        repo = SnapshotCiiuRepository(make_snapshot())
+        assert repo.find_best_match("CONSTRUCCIÓN").co_ciiu == 6
+        assert repo.find_best_match("F: CONSTRUCCION").co_ciiu == 6
+        assert repo.find_best_match("inmobiliarias").co_ciiu == 11
+        assert repo.format_catalogo_for_prompt().startswith("- 6: CONSTRUCCION")
+
+    def test_documento_por_nc(self):
+        repo = SnapshotTipoDocumentoRepository(make_snapshot())
+        assert repo.find_by_nc("ruc").co_tipo_documento == 6
+
+
+class TestCatalogSnapshotManager:
+
+    def test_normalize_payload_usa_repos_del_snapshot(self):
+        manager = CatalogSnapshotManager(session_factory=MagicMock(), refresh_s=600)
+        manager._snapshot = make_snapshot()
+
+        raw = {
+            "participantes": {
+                "otorgantes": [{
+                    "nombres": "juan", "pais": "PERUANO", "ocupacion": "comerciante",
+                    "estado_civil": "SOLTERO", "documento": {"tipo_documento": "DNI", "numero_documento": "123"},
+                }],
+            },
+        }
+        out = normalize_payload(raw, **manager.repositories())
+        p = out["participantes"]["otorgantes"][0]
+        assert p["co_pais"] == 51
+        assert p["co_ocupacion"] == 11
+        assert p["documento"]["co_documento"] == 1
+        manager.session_factory.assert_not_called()
+
+    def test_refresh_fallido_mantiene_snapshot_anterior(self):
+        manager = CatalogSnapshotManager(session_factory=MagicMock(side_effect=RuntimeError("db down")), refresh_s=0)
+        old = make_snapshot()
+        manager._snapshot = old
+
+        assert manager.get() is old
+        assert manager.stats()["load_errors"] == 1
@@ -0,0 +1 @@
+# tests/db/__init__.py
@@ -0,0 +1,52 @@
+# tests/db/sqlite_schema.py
+"""
+Helper para tests con SQLite en memoria sobre los modelos reales.
+Los tipos propios de MySQL (LONGBLOB, LONGTEXT) se compilan como BLOB/TEXT
+y SHA2() (columnas generadas) se registra como función de SQLite.
+"""
+import hashlib
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.mysql import LONGBLOB, LONGTEXT
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+
+
+@compiles(LONGBLOB, "sqlite")
+def _longblob_sqlite(type_, compiler, **kw):
+    return "BLOB"
+
+
+@compiles(LONGTEXT, "sqlite")
+def _longtext_sqlite(type_, compiler, **kw):
+    return "TEXT"
+
+
+def _sha2(value, bits):
+    if value is None:
+        return None
+    return hashlib.sha256(str(value).encode("utf-8")).hexdigest()
+
+
+def _register_functions(dbapi_conn, _record):
+    dbapi_conn.create_function("SHA2", 2, _sha2, deterministic=True)
+
+
+def make_session(*models, url: str = "sqlite://"):
+    """
+    Session sobre SQLite (en memoria por defecto) con las tablas de `models`.
+    session.statements acumula el SQL ejecutado (un elemento por round trip).
+    Para código que escribe desde otro hilo usar un archivo: url="sqlite:///<ruta>".
+    """
+    engine = create_engine(url)
+    event.listen(engine, "connect", _register_functions)
+    Base.metadata.create_all(engine, tables=[m.__table__ for m in models])
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cur, stmt, *a: statements.append(stmt))
+
+    session = sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+    session.statements = statements
+    return session
@@ -0,0 +1,108 @@
+# tests/db/test_minuta_repository.py
+"""
+Unit tests para MinutaRepository.save_full_minuta (escritura por lotes).
+Usa SQLite en memoria (no requiere MySQL).
+Ejecutar: python -m pytest tests/db/test_minuta_repository.py -v
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from tests.db.sqlite_schema import make_session
+from app.models.minuta import (
+    BienMinuta,
+    ConsultaMinuta,
+    MinutaAuditoria,
+    MinutaBlob,
+    ParticipanteMinuta,
+    ValorMedioPago,
+    ValorMinutaMaster,
+    ValorTransferencia,
+)
+from app.repositories.minuta_repository import MinutaRepository
+
+MODELS = (
+    ConsultaMinuta, ParticipanteMinuta, ValorMinutaMaster, ValorTransferencia,
+    ValorMedioPago, BienMinuta, MinutaAuditoria, MinutaBlob,
+)
+
+
+def persona(nombre: str, dni: str) -> dict:
+    return {
+        "tipo_persona": "NATURAL",
+        "nombres": nombre,
+        "apellido_paterno": "PEREZ",
+        "documento": {"tipo_documento": "DNI", "numero_documento": dni},
+        "domicilio": {"direccion": "AV. LIMA 123", "ubigeo": {"departamento": "LIMA"}},
+    }
+
+
+def make_payload(n_participantes: int, n_valores: int) -> dict:
+    return {
+        "acto": {"nombre_servicio": "COMPRA VENTA", "fecha_minuta": "2025-03-01"},
+        "participantes": {
+            "otorgantes": [persona(f"VENDEDOR {i}", f"1000000{i}") for i in range(n_participantes)],
+            "beneficiarios": [persona("COMPRADOR", "20000000"), {"nombres": None, "razon_social": None}],
+        },
+        "valores": {
+            "transferencia": [
+                {"moneda": "SOLES", "monto": 1000 + i, "forma_pago": "CONTADO"} for i in range(n_valores)
+            ],
+            "medioPago": [
+                {"medio_pago": "DEPOSITO EN CUENTA", "valor_bien": 1000 + i, "fecha_pago": "2025-03-0%d" % (i % 9 + 1)}
+                for i in range(n_valores)
+            ] + [{"medio_pago": None, "valor_bien": None}],
+        },
+        "bienes": [{"tipo_bien": "INMUEBLE", "partida_registral": "P-1", "ubigeo": {}}, {}],
+    }
+
+
+def save(db, payload):
+    audit = {"raw_json": "{}", "prompt_tokens": 10, "model": "gpt", "metadata_json": {"trace_id": "x"}}
+    return MinutaRepository(db).save_full_minuta(
+        payload=payload, docx_bytes=b"docx", co_cnl="0101", audit_data=audit,
+        co_seguridad=1, no_notaria="NOTARIA UNO",
+    )
+
+
+class TestSaveFullMinuta:
+
+    def test_persiste_todo_el_arbol(self):
+        db = make_session(*MODELS)
+        consulta = save(db, make_payload(n_participantes=2, n_valores=3))
+        id_consulta = consulta.id_consulta
+
+        grupos = sorted(p.grupo_participante for p in db.query(ParticipanteMinuta).all())
+        assert grupos == ["BENEFICIARIO", "OTORGANTE", "OTORGANTE"]
+
+        masters = db.query(ValorMinutaMaster).filter_by(id_consulta=id_consulta).order_by(ValorMinutaMaster.id_valor).all()
+        assert len(masters) == 3
+        montos = [float(m.transferencia.monto) for m in masters]
+        assert montos == [1000.0, 1001.0, 1002.0]
+        assert [float(m.medio_pago.valor_bien) for m in masters] == montos
+
+        assert db.query(BienMinuta).count() == 1
+        auditoria = db.query(MinutaAuditoria).one()
+        assert auditoria.id_consulta == id_consulta
+        assert auditoria.metadata_json == {"trace_id": "x"}
+
+    def test_round_trips_fijos(self):
+        def contar(n_participantes, n_valores):
+            db = make_session(*MODELS)
+            payload = make_payload(n_participantes, n_valores)
+            # filas con distintas columnas nulas no deben partir el lote
+            payload["valores"]["transferencia"][-1]["co_moneda"] = 1
+            del db.statements[:]
+            save(db, payload)
+            return len(db.statements)
+
+        assert contar(1, 1) == contar(12, 10)
+
+    def test_segunda_minuta_no_mezcla_valores(self):
+        db = make_session(*MODELS)
+        save(db, make_payload(1, 2))
+        segunda = save(db, make_payload(1, 1))
+        masters = db.query(ValorMinutaMaster).filter_by(id_consulta=segunda.id_consulta).all()
+        assert len(masters) == 1
+        assert float(masters[0].transferencia.monto) == 1000.0
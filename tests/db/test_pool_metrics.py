@@ -0,0 +1,64 @@
+# tests/db/test_pool_metrics.py
+"""
+Unit tests para PoolMetrics y release_connection.
+Usa SQLite en memoria (no requiere MySQL).
+Ejecutar: python -m pytest tests/db/test_pool_metrics.py -v
+"""
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from app.db.pool_metrics import PoolMetrics
+from app.db.session import release_connection
+
+
+def make_engine():
+    return create_engine("sqlite://", poolclass=QueuePool, pool_size=2, max_overflow=0)
+
+
+class TestPoolMetrics:
+
+    def test_cuenta_checkout_y_checkin(self):
+        engine = make_engine()
+        metrics = PoolMetrics().attach(engine)
+
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            assert metrics.snapshot()["checked_out"] == 1
+
+        snap = metrics.snapshot()
+        assert snap["checkouts"] == 1
+        assert snap["checkins"] == 1
+        assert snap["checked_out"] == 0
+        assert snap["max_checked_out"] == 1
+        assert sum(snap["held_ms_histogram"].values()) == 1
+
+    def test_release_connection_no_retiene_durante_espera(self):
+        """La conexión vuelve al pool antes de la etapa lenta y la Session sigue siendo usable."""
+        engine = make_engine()
+        metrics = PoolMetrics().attach(engine)
+        Session = sessionmaker(bind=engine)
+
+        db = Session()
+        db.execute(text("SELECT 1"))
+        assert metrics.snapshot()["checked_out"] == 1
+
+        release_connection(db)
+        assert metrics.snapshot()["checked_out"] == 0
+
+        time.sleep(0.05)  # "LLM"
+
+        db.execute(text("SELECT 1"))  # unidad de trabajo corta
+        db.commit()
+        db.close()
+
+        snap = metrics.snapshot()
+        assert snap["checkouts"] == 2
+        assert snap["checked_out"] == 0
+        assert snap["max_held_ms"] < 50
@@ -0,0 +1,98 @@
+# tests/db/test_query_audit.py
+"""
+Unit tests para QueryAudit y las columnas pesadas diferidas.
+Usa SQLite en memoria (no requiere MySQL).
+Ejecutar: python -m pytest tests/db/test_query_audit.py -v
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from tests.db.sqlite_schema import make_session
+from app.db.base import Base
+from app.db.query_audit import QueryAudit, value_size
+from app.models.minuta import ConsultaMinuta, MinutaAuditoria
+from app.models.scan import AuditoriaEscaneo, EscaneoMedioPago, TipoDocumentoEscaneo
+from app.services.scan_service import ScanService
+
+RAW = {"texto": "x" * 5000}
+
+
+def make_db():
+    db = make_session(TipoDocumentoEscaneo, EscaneoMedioPago, AuditoriaEscaneo)
+    db.add(TipoDocumentoEscaneo(co_tipo_doc=1, de_tipo_doc="VOUCHER"))
+    for i in range(5):
+        db.add(EscaneoMedioPago(
+            notaria="NOTARIA UNO", co_tipo_doc=1, url_imagen=f"/assets/escaneos/{i}.jpg",
+            medio_pago="DEPOSITO EN CUENTA", raw_ai_response=RAW,
+        ))
+    db.commit()
+    db.expunge_all()
+    return db
+
+
+def historial(db, include_raw):
+    return ScanService.get_historial(
+        limit=10, offset=0, notaria=None, referencia=None, medio_pago=None, banco=None,
+        fecha_desde=None, fecha_hasta=None, db=db, include_raw=include_raw,
+    )
+
+
+def medir(audit, endpoint, fn):
+    token = audit.begin()
+    try:
+        return fn()
+    finally:
+        audit.end(token, endpoint)
+
+
+class TestQueryAudit:
+
+    def setup_method(self):
+        self.audit = QueryAudit().attach(Base)
+
+    def teardown_method(self):
+        from sqlalchemy import event
+        event.remove(Base, "load", self.audit._on_load)
+        event.remove(Base, "refresh", self.audit._on_refresh)
+
+    def test_historial_sin_raw_trae_menos_bytes(self):
+        db = make_db()
+        out = medir(self.audit, "sin_raw", lambda: historial(db, include_raw=False))
+        assert all(r["raw_ai_response"] is None for r in out["data"])
+        db.expunge_all()
+        out = medir(self.audit, "con_raw", lambda: historial(db, include_raw=True))
+        assert all(r["raw_ai_response"] == RAW for r in out["data"])
+
+        snap = self.audit.snapshot()
+        assert snap["sin_raw"]["rows"] == snap["con_raw"]["rows"] == 5
+        assert snap["con_raw"]["bytes"] - snap["sin_raw"]["bytes"] >= 5 * value_size(RAW)
+
+    def test_carga_diferida_tambien_se_cuenta(self):
+        db = make_db()
+
+        def leer():
+            e = db.query(EscaneoMedioPago).first()
+            assert "raw_ai_response" not in e.__dict__
+            return e.raw_ai_response
+
+        assert medir(self.audit, "lazy", leer) == RAW
+        assert self.audit.snapshot()["lazy"]["bytes"] >= value_size(RAW)
+
+    def test_fuera_de_peticion_no_acumula(self):
+        db = make_db()
+        historial(db, include_raw=True)
+        assert self.audit.snapshot() == {}
+
+
+class TestColumnasDiferidas:
+
+    def test_columnas_pesadas_no_se_cargan_por_defecto(self):
+        for model, col in (
+            (ConsultaMinuta, "minuta_archivo"),
+            (ConsultaMinuta, "minuta_legasys"),
+            (MinutaAuditoria, "raw_json"),
+            (EscaneoMedioPago, "raw_ai_response"),
+        ):
+            assert model.__mapper__.column_attrs[col].deferred, f"{model.__name__}.{col}"
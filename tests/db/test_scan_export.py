@@ -0,0 +1,72 @@
+# tests/db/test_scan_export.py
+"""
+Unit tests para la exportación en streaming del historial de escaneos.
+Usa SQLite en memoria (no requiere MySQL).
+Ejecutar: python -m pytest tests/db/test_scan_export.py -v
+"""
+import sys
+import os
+import csv
+import io
+import json
+
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from tests.db.sqlite_schema import make_session
+from app.models.scan import AuditoriaEscaneo, EscaneoMedioPago, TipoDocumentoEscaneo
+from app.services.scan_service import ScanService
+
+
+def make_factory(n: int = 30):
+    db = make_session(TipoDocumentoEscaneo, EscaneoMedioPago, AuditoriaEscaneo)
+    for i in range(n):
+        e = EscaneoMedioPago(
+            notaria="NOTARIA UNO" if i % 3 else "NOTARIA DOS", co_tipo_doc=1,
+            url_imagen=f"/assets/escaneos/{i}.jpg", bancos="BCP", monto=10 + i,
+            raw_ai_response={"bancos": "BCP", "i": i},
+        )
+        db.add(e)
+        db.flush()
+        db.add(AuditoriaEscaneo(id_escaneo=e.id_escaneo, notaria=e.notaria, estado="SUCCESS", prompt_tokens=5))
+    db.commit()
+    return sessionmaker(bind=db.get_bind())
+
+
+def export(factory, formato, **kw):
+    args = dict(notaria=None, referencia=None, medio_pago=None, banco=None, fecha_desde=None, fecha_hasta=None)
+    args.update(kw)
+    return ScanService.export_historial(formato=formato, session_factory=factory, batch_size=7, **args)
+
+
+class TestExportHistorial:
+
+    def test_ndjson_todas_las_filas(self):
+        lines = list(export(make_factory(30), "ndjson"))
+        rows = [json.loads(l) for l in lines]
+        assert len(rows) == 30
+        assert [r["id_escaneo"] for r in rows] == list(range(30, 0, -1))
+        assert "raw_ai_response" not in rows[0]
+        assert rows[0]["estado"] == "SUCCESS" and rows[0]["prompt_tokens"] == 5
+
+    def test_ndjson_con_raw(self):
+        rows = [json.loads(l) for l in export(make_factory(5), "ndjson", include_raw=True)]
+        assert rows[0]["raw_ai_response"] == {"bancos": "BCP", "i": 4}
+
+    def test_csv_con_encabezado_y_filtros(self):
+        text = "".join(export(make_factory(30), "csv", notaria="notaria dos", include_raw=True))
+        rows = list(csv.DictReader(io.StringIO(text)))
+        assert len(rows) == 10
+        assert all(r["notaria"] == "NOTARIA DOS" for r in rows)
+        assert json.loads(rows[0]["raw_ai_response"])["bancos"] == "BCP"
+
+    def test_csv_vacio_solo_encabezado(self):
+        lines = list(export(make_factory(3), "csv", banco="NINGUNO"))
+        assert len(lines) == 1 and lines[0].startswith("id_escaneo,")
+
+    def test_generador_es_perezoso(self):
+        gen = export(make_factory(30), "ndjson")
+        first = next(gen)
+        assert json.loads(first)["id_escaneo"] == 30
+        gen.close()
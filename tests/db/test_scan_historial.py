@@ -0,0 +1,137 @@
+# tests/db/test_scan_historial.py
+"""
+Unit tests para la paginación del historial de escaneos (offset y cursor),
+el cache de totales y las URLs firmadas por notaría. Usa SQLite en memoria (no requiere MySQL).
+Ejecutar: python -m pytest tests/db/test_scan_historial.py -v
+"""
+import sys
+import os
+import json
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from tests.db.sqlite_schema import make_session
+from app.core.config import settings
+from app.core.security import ResolvedCredential
+from app.models.scan import AuditoriaEscaneo, EscaneoMedioPago, TipoDocumentoEscaneo
+from app.services import scan_service
+from app.services.scan_service import ScanService
+
+
+def make_db(n: int = 25):
+    db = make_session(TipoDocumentoEscaneo, EscaneoMedioPago, AuditoriaEscaneo)
+    for i in range(n):
+        db.add(EscaneoMedioPago(
+            notaria="NOTARIA UNO" if i % 2 else "NOTARIA DOS", co_tipo_doc=1,
+            url_imagen=f"/assets/escaneos/{i}.jpg", bancos="BCP",
+        ))
+    db.commit()
+    return db
+
+
+def historial(db, **kw):
+    args = dict(limit=10, offset=0, notaria=None, referencia=None, medio_pago=None, banco=None,
+                fecha_desde=None, fecha_hasta=None)
+    args.update(kw)
+    return ScanService.get_historial(db=db, **args)
+
+
+class TestHistorialPaginacion:
+
+    def setup_method(self):
+        scan_service._historial_counts.clear()
+
+    def test_cursor_recorre_todo_sin_repetir(self):
+        db = make_db(25)
+        ids, cursor, paginas = [], None, 0
+        while True:
+            out = historial(db, cursor=cursor)
+            ids += [r["id_escaneo"] for r in out["data"]]
+            paginas += 1
+            cursor = out["meta"]["next_cursor"]
+            if cursor is None:
+                break
+        assert paginas == 3
+        assert ids == sorted(ids, reverse=True) and len(set(ids)) == 25
+
+    def test_cursor_coincide_con_offset(self):
+        db = make_db(25)
+        primera = historial(db)
+        segunda_offset = historial(db, offset=10)
+        segunda_cursor = historial(db, cursor=primera["meta"]["next_cursor"])
+        assert [r["id_escaneo"] for r in segunda_offset["data"]] == [r["id_escaneo"] for r in segunda_cursor["data"]]
+        assert segunda_cursor["meta"]["offset"] is None
+
+    def test_cursor_con_filtros(self):
+        db = make_db(25)
+        out = historial(db, notaria="notaría uno", limit=5)
+        out2 = historial(db, notaria="notaría uno", limit=5, cursor=out["meta"]["next_cursor"])
+        assert all(r["notaria"] == "NOTARIA UNO" for r in out["data"] + out2["data"])
+        assert out["meta"]["total"] == 12
+
+    def test_ultima_pagina_exacta_sin_next_cursor(self):
+        db = make_db(20)
+        out = historial(db, cursor=historial(db)["meta"]["next_cursor"])
+        assert len(out["data"]) == 10 and out["meta"]["next_cursor"] is None
+
+    def test_total_cacheado_por_filtros(self):
+        db = make_db(5)
+        assert historial(db)["meta"]["total"] == 5
+
+        db.add(EscaneoMedioPago(notaria="NOTARIA UNO", co_tipo_doc=1, url_imagen="/x.jpg"))
+        db.commit()
+        del db.statements[:]
+        assert historial(db)["meta"]["total"] == 5            # desde el cache
+        assert not any("count(" in s.lower() for s in db.statements)
+
+        scan_service._historial_counts.clear()
+        assert historial(db)["meta"]["total"] == 6
+        assert historial(db, notaria="NOTARIA DOS")["meta"]["total"] == 3
+
+
+class TestHistorialUrlsFirmadas:
+    """Las URLs firmadas abren la imagen sin token: solo para la notaría autenticada."""
+
+    class FakeAuthenticator:
+        def authenticate(self, db, token, status_code=400, detail="token incorrecto"):
+            if token != "tok-uno":
+                raise HTTPException(status_code=status_code, detail=detail)
+            return ResolvedCredential(co_credencial_seguridad=1, co_seguridad=1, no_notaria="NOTARIA UNO")
+
+    @pytest.fixture(autouse=True)
+    def firma(self, monkeypatch):
+        scan_service._historial_counts.clear()
+        monkeypatch.setattr(settings, "image_url_secret", "secreto-de-prueba")
+        monkeypatch.setattr(scan_service, "get_token_authenticator", lambda: self.FakeAuthenticator())
+
+    def test_sin_token_no_firma(self):
+        rows = historial(make_db(4))["data"]
+        assert all(r["url_imagen_firmada"] is None and r["url_miniatura"] is None for r in rows)
+
+    def test_solo_las_imagenes_de_su_notaria(self):
+        rows = historial(make_db(4), token="tok-uno")["data"]
+        propias = [r for r in rows if r["notaria"] == "NOTARIA UNO"]
+        ajenas = [r for r in rows if r["notaria"] != "NOTARIA UNO"]
+        assert propias and ajenas
+        assert all(r["url_imagen_firmada"] and r["url_miniatura"] for r in propias)
+        assert all(r["url_imagen_firmada"] is None and r["url_miniatura"] is None for r in ajenas)
+
+    def test_token_invalido_401(self):
+        with pytest.raises(HTTPException) as exc:
+            historial(make_db(2), token="malo")
+        assert exc.value.status_code == 401
+
+    def test_export_igual_que_historial(self):
+        factory = sessionmaker(bind=make_db(4).get_bind())
+        args = dict(notaria=None, referencia=None, medio_pago=None, banco=None, fecha_desde=None, fecha_hasta=None)
+        rows = [json.loads(l) for l in ScanService.export_historial(
+            formato="ndjson", session_factory=factory, token="tok-uno", **args
+        )]
+        assert {r["notaria"] for r in rows if r["url_imagen_firmada"]} == {"NOTARIA UNO"}
+        with pytest.raises(HTTPException) as exc:
+            ScanService.export_historial(formato="ndjson", session_factory=factory, token="malo", **args)
+        assert exc.value.status_code == 401
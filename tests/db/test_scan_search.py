@@ -0,0 +1,114 @@
+# tests/db/test_scan_search.py
+"""
+Unit tests para el planificador de búsqueda del historial de escaneos.
+El uso de índices se verifica con EXPLAIN QUERY PLAN sobre SQLite en memoria;
+el camino FULLTEXT de MySQL se verifica compilando el SQL.
+Ejecutar: python -m pytest tests/db/test_scan_search.py -v
+"""
+import sys
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.dialects import mysql
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from tests.db.sqlite_schema import make_session
+from app.models.scan import AuditoriaEscaneo, EscaneoMedioPago, TipoDocumentoEscaneo
+from app.repositories.scan_search import ScanSearchPlanner, backfill_busqueda
+
+
+def make_db():
+    db = make_session(TipoDocumentoEscaneo, EscaneoMedioPago, AuditoriaEscaneo)
+    for i in range(200):
+        db.add(EscaneoMedioPago(
+            notaria=f"NOTARÍA {i % 7}", co_tipo_doc=1, url_imagen=f"/assets/escaneos/{i}.jpg",
+            referencia=f"Exp-{i}", bancos="BCP" if i % 2 else "BBVA",
+            ts_creacion=datetime(2025, 1, 1) + timedelta(days=i),
+        ))
+    db.commit()
+    db.execute(text("ANALYZE"))
+    return db
+
+
+def plan(db, *conditions) -> str:
+    stmt = (
+        select(EscaneoMedioPago.id_escaneo)
+        .where(*conditions)
+        .order_by(EscaneoMedioPago.id_escaneo.desc())
+        .limit(10)
+    )
+    compiled = stmt.compile(db.get_bind(), compile_kwargs={"literal_binds": True})
+    rows = db.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+    return " | ".join(r[-1] for r in rows)
+
+
+class TestIndices:
+
+    def test_busqueda_por_notaria_usa_indice(self):
+        db = make_db()
+        planner = ScanSearchPlanner("sqlite")
+        assert "ix_escaneo_notaria_busq_id" in plan(db, planner.notaria("notaria 3"))
+
+    def test_busqueda_por_referencia_usa_indice(self):
+        db = make_db()
+        planner = ScanSearchPlanner("sqlite")
+        assert "ix_escaneo_referencia_busq_id" in plan(db, planner.referencia("exp-1"))
+
+    def test_filtro_por_banco_usa_indice_compuesto(self):
+        db = make_db()
+        assert "ix_escaneo_bancos_id" in plan(db, EscaneoMedioPago.bancos == "BCP")
+
+    def test_filtro_por_fecha_usa_indice(self):
+        db = make_db()
+        assert "ix_escaneo_ts_creacion" in plan(
+            db,
+            EscaneoMedioPago.ts_creacion >= datetime(2025, 3, 1),
+            EscaneoMedioPago.ts_creacion <= datetime(2025, 3, 2),
+        )
+
+    def test_modo_contains_no_usa_indice(self):
+        db = make_db()
+        planner = ScanSearchPlanner("sqlite", mode="contains")
+        assert "_busq_" not in plan(db, planner.notaria("3"))
+
+
+class TestPlanner:
+
+    def test_columnas_normalizadas(self):
+        db = make_db()
+        e = db.query(EscaneoMedioPago).first()
+        assert e.notaria_busqueda == "NOTARIA 0"
+        assert e.referencia_busqueda == "EXP-0"
+
+    def test_prefijo_sin_tildes(self):
+        db = make_db()
+        planner = ScanSearchPlanner("sqlite")
+        n = db.query(EscaneoMedioPago).filter(planner.notaria("notaría 3")).count()
+        assert n == len([i for i in range(200) if i % 7 == 3])
+
+    def test_mysql_usa_fulltext(self):
+        planner = ScanSearchPlanner("mysql")
+        cond = planner.notaria("notaría uno")
+        sql = str(select(EscaneoMedioPago.id_escaneo).where(cond).compile(dialect=mysql.dialect()))
+        assert "MATCH (notaria_busqueda, referencia_busqueda) AGAINST" in sql
+        assert "BOOLEAN MODE" in sql
+
+    def test_mysql_termino_corto_cae_a_prefijo(self):
+        planner = ScanSearchPlanner("mysql")
+        cond = planner.notaria("n1")
+        sql = str(select(EscaneoMedioPago.id_escaneo).where(cond).compile(dialect=mysql.dialect()))
+        assert "MATCH" not in sql and "notaria_busqueda >=" in sql
+
+    def test_modo_invalido(self):
+        with pytest.raises(ValueError):
+            ScanSearchPlanner("mysql", mode="regex")
+
+    def test_backfill(self):
+        db = make_db()
+        db.execute(EscaneoMedioPago.__table__.update().values(notaria_busqueda=None, referencia_busqueda=None))
+        db.commit()
+        assert backfill_busqueda(db, batch_size=64) == 200
+        assert db.query(EscaneoMedioPago).filter(EscaneoMedioPago.notaria_busqueda.is_(None)).count() == 0
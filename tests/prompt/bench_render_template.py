@@ -0,0 +1,57 @@
+# tests/prompt/bench_render_template.py
+"""
+Micro-benchmark manual: render con str.replace por placeholder (versión anterior)
+vs. plantilla precompilada con un único join.
+Ejecutar: python tests/prompt/bench_render_template.py
+
+No requiere BD ni servidor.
+"""
+import sys
+import os
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.utils.template import compile_template
+
+
+def render_template_replace(template: str, context: dict) -> str:
+    """Implementación anterior: un str.replace sobre todo el texto por cada key."""
+    result = template or ""
+    for k, v in (context or {}).items():
+        result = result.replace(f"{{{{{k}}}}}", "" if v is None else str(v))
+    return result
+
+
+TEMPLATE = (
+    "Eres un asistente notarial. Servicio {{co_cnl}}.\n"
+    + ("INSTRUCCIÓN DE EXTRACCIÓN {\"campo\": \"valor\"}\n" * 200)
+    + "REGLAS:\n{{reglas_servicio}}\nCIIU:\n{{ciiu_catalogo}}\n"
+    + "PAYLOAD BASE:\n{{payload_base}}\nFECHA: {{fecha_minuta_hint}}\n"
+    + "DOCUMENTO:\n{{contenido}}\n"
+)
+
+
+def make_context(doc_kb: int) -> dict:
+    return {
+        "co_cnl": "0101",
+        "contenido": ("CLAUSULA PRIMERA: EL VENDEDOR TRANSFIERE EL INMUEBLE. " * 20 + "\n") * (doc_kb * 1024 // 1060),
+        "fecha_minuta_hint": "",
+        "ciiu_catalogo": "\n".join(f"- {i}: ACTIVIDAD ECONOMICA NUMERO {i}" for i in range(300)),
+        "reglas_servicio": "- OTORGANTES:\n  - Debes identificar como mínimo 1 participante(s).\n" * 10,
+        "payload_base": str({"acto": {"nombre_servicio": "COMPRA VENTA"}, "participantes": {}}),
+    }
+
+
+if __name__ == "__main__":
+    compiled = compile_template(TEMPLATE, key=("bench", 1))
+    for doc_kb in (50, 100, 200):
+        ctx = make_context(doc_kb)
+        assert render_template_replace(TEMPLATE, ctx) == compiled.render(ctx)
+        n = 200
+        t_old = timeit.timeit(lambda: render_template_replace(TEMPLATE, ctx), number=n) / n
+        t_new = timeit.timeit(lambda: compiled.render(ctx), number=n) / n
+        print(
+            f"contenido={doc_kb:>3} KB | replace={t_old * 1e3:7.3f} ms "
+            f"| compilado={t_new * 1e3:7.3f} ms | x{t_old / t_new:5.1f}"
+        )
@@ -0,0 +1,41 @@
+# tests/prompt/test_template.py
+"""
+Unit tests para CompiledTemplate / compile_template / render_template.
+Ejecutar: python -m pytest tests/prompt/test_template.py -v
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.utils.template import CompiledTemplate, compile_template, render_template
+
+
+class TestCompiledTemplate:
+
+    def test_render_basico_con_llaves_json(self):
+        tpl = 'Servicio {{co_cnl}}: {"acto": {}}\n{{contenido}}'
+        out = render_template(tpl, {"co_cnl": "0101", "contenido": "TEXTO"})
+        assert out == 'Servicio 0101: {"acto": {}}\nTEXTO'
+
+    def test_placeholder_repetido_y_none(self):
+        tpl = "{{a}}-{{a}}-{{b}}"
+        assert render_template(tpl, {"a": 1, "b": None}) == "1-1-"
+
+    def test_placeholder_sin_valor_queda_intacto(self):
+        assert render_template("x {{falta}} y", {}) == "x {{falta}} y"
+
+    def test_una_sola_pasada(self):
+        """El contenido insertado no se vuelve a interpretar como plantilla."""
+        tpl = "{{contenido}} | {{co_cnl}}"
+        out = render_template(tpl, {"contenido": "literal {{co_cnl}}", "co_cnl": "0101"})
+        assert out == "literal {{co_cnl}} | 0101"
+
+    def test_placeholders(self):
+        assert CompiledTemplate("{{a}} {{b}} {{a}}").placeholders == {"a", "b"}
+
+    def test_compile_template_cachea_por_key(self):
+        t1 = compile_template("{{x}}", key=("test", 1, "v1"))
+        t2 = compile_template("IGNORADO", key=("test", 1, "v1"))
+        assert t1 is t2
+        assert compile_template("{{x}}", key=("test", 1, "v2")) is not t1
@@ -0,0 +1,103 @@
+# tests/services/test_llm_gateway.py
+"""
+Unit tests para LLMGateway (cliente async + tope de concurrencia).
+No llaman a OpenAI: usan un cliente falso con la misma forma que AsyncOpenAI.
+Ejecutar: python -m pytest tests/services/test_llm_gateway.py -v
+"""
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.services.llm_gateway import LLMGateway
+
+
+class FakeCompletions:
+    def __init__(self, content: str = '{"ok": true}', delay: float = 0.0):
+        self.content = content
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15),
+        )
+
+
+def make_gateway(completions: FakeCompletions, max_concurrency: int = 4) -> LLMGateway:
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return LLMGateway(client=client, max_concurrency=max_concurrency, model="test-model")
+
+
+MESSAGES = [{"role": "user", "content": "hola"}]
+
+
+class TestLLMGateway:
+
+    def test_retorna_data_y_telemetry(self):
+        completions = FakeCompletions(content='{"acto": {"nombre_servicio": "PODER"}}')
+        gw = make_gateway(completions)
+
+        data, telemetry = asyncio.run(gw.chat_json(MESSAGES, trace_id="t1"))
+
+        assert data == {"acto": {"nombre_servicio": "PODER"}}
+        assert telemetry["prompt_tokens"] == 10
+        assert telemetry["completion_tokens"] == 5
+        assert telemetry["total_tokens"] == 15
+        assert telemetry["model"] == "test-model"
+        assert telemetry["raw_text"].startswith("{")
+        assert completions.calls[0]["temperature"] == 0
+        assert completions.calls[0]["response_format"] == {"type": "json_object"}
+
+    def test_respeta_tope_de_concurrencia(self):
+        completions = FakeCompletions(delay=0.02)
+        gw = make_gateway(completions, max_concurrency=3)
+
+        async def run():
+            await asyncio.gather(*[gw.chat_json(MESSAGES) for _ in range(10)])
+
+        asyncio.run(run())
+
+        assert len(completions.calls) == 10
+        assert completions.max_active == 3
+        assert gw.stats()["in_flight"] == 0
+
+    def test_llamadas_concurrentes_no_se_serializan(self):
+        """Con tope suficiente, N llamadas lentas corren en paralelo en el mismo loop."""
+        completions = FakeCompletions(delay=0.05)
+        gw = make_gateway(completions, max_concurrency=20)
+
+        async def run():
+            await asyncio.gather(*[gw.chat_json(MESSAGES) for _ in range(20)])
+
+        asyncio.run(run())
+        assert completions.max_active == 20
+
+    def test_error_libera_el_semaforo(self):
+        class Boom(FakeCompletions):
+            async def create(self, **kwargs):
+                raise RuntimeError("timeout")
+
+        gw = make_gateway(Boom(), max_concurrency=1)
+
+        async def run():
+            for _ in range(2):
+                try:
+                    await gw.chat_json(MESSAGES)
+                except RuntimeError:
+                    pass
+
+        asyncio.run(run())
+        assert gw.stats()["in_flight"] == 0
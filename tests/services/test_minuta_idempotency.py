@@ -0,0 +1,153 @@
+# tests/services/test_minuta_idempotency.py
+"""
+Unit tests de envíos idempotentes de minutas: claves de idempotencia,
+coalescencia single-flight y respuestas guardadas (sin LLM ni BD).
+Ejecutar: python -m pytest tests/services/test_minuta_idempotency.py -v
+"""
+import sys
+import os
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.services.minuta_idempotency import (
+    ALMACENADA, EJECUTADA, EN_CURSO, SingleFlight, build_idempotency_key, has_id_consulta,
+)
+
+SHA = "ab" * 32
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Pipeline:
+    """Extracción falsa: cuenta ejecuciones y tarda lo suficiente para solaparse."""
+
+    def __init__(self, delay=0.05, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return {"co_cnl": "0101", "payload": {"id_consulta": 100 + self.calls}}
+
+
+class TestKey:
+    def test_derivada_de_archivo_y_co_cnl(self):
+        assert build_idempotency_key("tok", SHA, "0101") == build_idempotency_key("tok", SHA, "0101")
+        assert build_idempotency_key("tok", SHA, "0101") != build_idempotency_key("tok", SHA, "0202")
+        assert build_idempotency_key("tok", SHA, "0101") != build_idempotency_key("tok", "cd" * 32, "0101")
+
+    def test_acotada_al_token(self):
+        assert build_idempotency_key("a", SHA, "0101") != build_idempotency_key("b", SHA, "0101")
+        assert build_idempotency_key("a", SHA, "0101", "k1") != build_idempotency_key("b", SHA, "0101", "k1")
+
+    def test_explicita_ignora_el_contenido(self):
+        assert build_idempotency_key("tok", SHA, "0101", "k1") == build_idempotency_key("tok", "cd" * 32, "0202", "k1")
+        assert build_idempotency_key("tok", SHA, "0101", "  ") == build_idempotency_key("tok", SHA, "0101")
+
+
+class TestSingleFlight:
+    def test_peticiones_simultaneas_una_sola_ejecucion(self):
+        sf, pipeline = SingleFlight(), Pipeline()
+
+        async def scenario():
+            return await asyncio.gather(*(sf.run("k", pipeline) for _ in range(5)))
+
+        results = run(scenario())
+        assert pipeline.calls == 1
+        assert sorted(origen for _, origen in results) == [EJECUTADA] + [EN_CURSO] * 4
+        assert all(r == {"co_cnl": "0101", "payload": {"id_consulta": 101}} for r, _ in results)
+        # cada llamador recibe su copia
+        results[0][0]["payload"]["id_consulta"] = 0
+        assert results[1][0]["payload"]["id_consulta"] == 101
+        assert sf.stats()["coalesced"] == 4 and sf.stats()["in_flight"] == 0
+
+    def test_reintento_posterior_devuelve_respuesta_guardada(self):
+        sf, pipeline = SingleFlight(), Pipeline(delay=0)
+
+        async def scenario():
+            first = await sf.run("k", pipeline)
+            again = await sf.run("k", pipeline)
+            other = await sf.run("otra", pipeline)
+            return first, again, other
+
+        first, again, other = run(scenario())
+        assert first == ({"co_cnl": "0101", "payload": {"id_consulta": 101}}, EJECUTADA)
+        assert again == ({"co_cnl": "0101", "payload": {"id_consulta": 101}}, ALMACENADA)
+        assert other[1] == EJECUTADA and pipeline.calls == 2
+
+    def test_ventana_vencida_ejecuta_de_nuevo(self):
+        sf, pipeline = SingleFlight(ttl_s=0.01), Pipeline(delay=0)
+
+        async def scenario():
+            await sf.run("k", pipeline)
+            await asyncio.sleep(0.03)
+            return await sf.run("k", pipeline)
+
+        _, origen = run(scenario())
+        assert origen == EJECUTADA and pipeline.calls == 2
+
+    def test_errores_no_se_guardan(self):
+        sf = SingleFlight()
+        failing = Pipeline(error=HTTPException(status_code=502, detail="LLM caído"))
+
+        async def scenario():
+            results = await asyncio.gather(
+                *(sf.run("k", failing) for _ in range(3)), return_exceptions=True
+            )
+            retry = await sf.run("k", Pipeline(delay=0))
+            return results, retry
+
+        results, retry = run(scenario())
+        assert failing.calls == 1
+        assert all(isinstance(r, HTTPException) and r.status_code == 502 for r in results)
+        assert retry[1] == EJECUTADA
+
+    def test_sin_id_consulta_no_se_guarda(self):
+        # el histórico falló: la respuesta no trae id_consulta y el reintento debe ejecutar
+        sf = SingleFlight()
+
+        async def sin_consulta():
+            return {"co_cnl": "0101", "payload": {"acto": {}}}
+
+        async def scenario():
+            await sf.run("k", sin_consulta, store_if=has_id_consulta)
+            return await sf.run("k", Pipeline(delay=0), store_if=has_id_consulta)
+
+        result, origen = run(scenario())
+        assert origen == EJECUTADA and result["payload"]["id_consulta"] == 101
+        assert sf.stats()["replayed"] == 0
+
+    def test_clave_explicita_con_otro_contenido_422(self):
+        sf = SingleFlight()
+
+        async def scenario():
+            await sf.run("k", Pipeline(delay=0), fingerprint=f"{SHA}|0101")
+            await sf.run("k", Pipeline(delay=0), fingerprint=f"{SHA}|0202")
+
+        with pytest.raises(HTTPException) as exc:
+            run(scenario())
+        assert exc.value.status_code == 422
+
+    def test_forget_y_desactivado(self):
+        sf, pipeline = SingleFlight(), Pipeline(delay=0)
+
+        async def scenario():
+            await sf.run("k", pipeline)
+            sf.forget("k")
+            return await sf.run("k", pipeline)
+
+        assert run(scenario())[1] == EJECUTADA and pipeline.calls == 2
+
+        off, pipeline = SingleFlight(enabled=False), Pipeline(delay=0)
+        run(off.run("k", pipeline))
+        assert run(off.run("k", pipeline))[1] == EJECUTADA and pipeline.calls == 2
@@ -0,0 +1,283 @@
+# tests/services/test_minuta_jobs.py
+"""
+Unit tests del modo asíncrono de minutas (MinutaJobRunner): cola en memoria
+y en tabla (SQLite en archivo), contrapresión 503, aviso al orquestador y
+jobs re-encolados que ya guardaron su consulta.
+El extractor es falso: no llama al LLM.
+Ejecutar: python -m pytest tests/services/test_minuta_jobs.py -v
+"""
+import sys
+import os
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from tests.db.sqlite_schema import make_session
+from app.core.security import ResolvedCredential
+from app.models.minuta import MinutaBlob, MinutaJob
+from app.services import minuta_jobs, orchestrator_client
+from app.services.minuta_jobs import (
+    ERROR, EXITO, PENDIENTE, InMemoryJobBackend, MinutaJobRunner, SqlJobBackend,
+)
+from app.utils.ingestion import UploadedDocument
+
+CREDENCIAL = ResolvedCredential(co_credencial_seguridad=7, co_seguridad=3, no_notaria="NOTARIA X")
+
+
+def documento(text="texto de la minuta", raw=b"%PDF-1.4 minuta"):
+    return UploadedDocument(
+        text=text, sha256="ab" * 32, raw=raw, content_type="application/pdf", cache_hit=False
+    )
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def wait_done(runner, job_id, timeout=5.0):
+    async def poll():
+        while True:
+            job = await runner.get(job_id)
+            if job.estado in (EXITO, ERROR):
+                return job
+            await asyncio.sleep(0.01)
+    return await asyncio.wait_for(poll(), timeout)
+
+
+@pytest.fixture
+def avisos(monkeypatch):
+    avisados = []
+
+    async def fake_notify(id_consulta):
+        avisados.append(id_consulta)
+
+    monkeypatch.setattr(orchestrator_client, "notify_orchestrator", fake_notify)
+    return avisados
+
+
+class TestInMemory:
+    def test_job_exitoso_con_resultado_y_aviso(self, avisos):
+        recibidos = []
+
+        async def extractor(job):
+            recibidos.append((job.documento.text, job.co_cnl, job.credencial))
+            return {"co_cnl": job.co_cnl, "payload": {"id_consulta": 41}}
+
+        async def scenario():
+            runner = MinutaJobRunner(InMemoryJobBackend(), workers=2, poll_s=0.05, extractor=extractor)
+            job = await runner.submit(documento(), "0101", CREDENCIAL)
+            assert job.estado == PENDIENTE
+            done = await wait_done(runner, job.job_id)
+            await runner.stop()
+            return done, runner.stats()
+
+        done, stats = run(scenario())
+        assert done.estado == EXITO
+        assert done.resultado == {"co_cnl": "0101", "payload": {"id_consulta": 41}}
+        assert done.documento is None  # el binario no queda retenido
+        assert recibidos == [("texto de la minuta", "0101", CREDENCIAL)]
+        assert avisos == [41]
+        assert stats["completed"] == 1 and stats["failed"] == 0
+
+        status = done.to_status()
+        assert status["status"] == EXITO and status["finalizado"] is not None
+
+    def test_error_http_queda_en_el_job(self, avisos):
+        async def extractor(job):
+            raise HTTPException(status_code=422, detail="payload inválido")
+
+        async def scenario():
+            runner = MinutaJobRunner(InMemoryJobBackend(), workers=1, poll_s=0.05, extractor=extractor)
+            job = await runner.submit(documento(), "0101", CREDENCIAL)
+            done = await wait_done(runner, job.job_id)
+            await runner.stop()
+            return done
+
+        done = run(scenario())
+        assert done.estado == ERROR
+        assert done.error == {"status_code": 422, "detail": "payload inválido"}
+        assert avisos == []
+
+    def test_sin_callback_no_avisa(self, avisos):
+        async def extractor(job):
+            return {"co_cnl": job.co_cnl, "payload": {"id_consulta": 5}}
+
+        async def scenario():
+            runner = MinutaJobRunner(
+                InMemoryJobBackend(), workers=1, poll_s=0.05, callback=False, extractor=extractor
+            )
+            job = await runner.submit(documento(), "0101", CREDENCIAL)
+            await wait_done(runner, job.job_id)
+            await runner.stop()
+
+        run(scenario())
+        assert avisos == []
+
+    def test_cola_llena_503_con_retry_after(self):
+        async def scenario():
+            liberar = asyncio.Event()
+
+            async def extractor(job):
+                await liberar.wait()
+                return {"co_cnl": job.co_cnl, "payload": {}}
+
+            runner = MinutaJobRunner(
+                InMemoryJobBackend(), workers=1, max_pending=1, poll_s=0.05, extractor=extractor
+            )
+            primero = await runner.submit(documento(), "0101", CREDENCIAL)
+            while (await runner.get(primero.job_id)).estado == PENDIENTE:
+                await asyncio.sleep(0.01)
+            await runner.submit(documento(), "0101", CREDENCIAL)  # queda en cola
+            with pytest.raises(HTTPException) as exc:
+                await runner.submit(documento(), "0101", CREDENCIAL)
+            liberar.set()
+            await runner.stop()
+            return exc.value, runner.stats()
+
+        error, stats = run(scenario())
+        assert error.status_code == 503
+        assert error.headers["Retry-After"] == str(minuta_jobs.RETRY_AFTER_S)
+        assert stats["submitted"] == 2 and stats["rejected"] == 1
+
+    def test_purga_jobs_terminados_vencidos(self):
+        backend = InMemoryJobBackend(ttl_s=0)
+        job = minuta_jobs.JobRecord(
+            job_id="j1", co_cnl="0101", credencial=CREDENCIAL, fecha_minuta_hint=None,
+            estado=PENDIENTE, creado=minuta_jobs.datetime.now(), documento=documento(),
+        )
+        backend.create(job)
+        assert backend.purge() == 0  # pendiente: no se purga
+        backend.claim()
+        backend.complete("j1", {"payload": {}})
+        assert backend.purge() == 1
+        assert backend.get("j1") is None
+
+
+class TestSql:
+    @pytest.fixture
+    def factory(self, tmp_path):
+        db = make_session(MinutaJob, MinutaBlob, url=f"sqlite:///{tmp_path / 'jobs.db'}")
+        return sessionmaker(bind=db.get_bind(), autocommit=False, autoflush=False)
+
+    def test_job_viaja_por_la_tabla(self, factory, avisos):
+        recibidos = []
+
+        async def extractor(job):
+            recibidos.append(job)
+            return {"co_cnl": job.co_cnl, "payload": {"id_consulta": 9}}
+
+        async def scenario():
+            runner = MinutaJobRunner(
+                SqlJobBackend(session_factory=factory), workers=2, poll_s=0.05, extractor=extractor
+            )
+            job = await runner.submit(documento(), "0202", CREDENCIAL, fecha_minuta_hint="2025-01-02")
+            done = await wait_done(runner, job.job_id)
+            await runner.stop()
+            return done
+
+        done = run(scenario())
+        assert done.estado == EXITO
+        assert done.resultado == {"co_cnl": "0202", "payload": {"id_consulta": 9}}
+        assert avisos == [9]
+
+        tomado = recibidos[0]
+        assert tomado.documento.text == "texto de la minuta"
+        assert tomado.documento.raw == b"%PDF-1.4 minuta"  # desde el blob store
+        assert tomado.credencial == CREDENCIAL
+        assert tomado.fecha_minuta_hint == "2025-01-02"
+
+        db = factory()
+        row = db.get(MinutaJob, done.job_id)
+        assert row.contenido is None  # el texto se libera al terminar
+        db.close()
+
+    def test_un_job_lo_toma_un_solo_worker(self, factory):
+        backend = SqlJobBackend(session_factory=factory)
+        job = minuta_jobs.JobRecord(
+            job_id="j1", co_cnl="0101", credencial=CREDENCIAL, fecha_minuta_hint=None,
+            estado=PENDIENTE, creado=minuta_jobs.datetime.now(), documento=documento(),
+        )
+        backend.create(job)
+        assert backend.pending_count() == 1
+        assert backend.claim().job_id == "j1"
+        assert backend.claim() is None
+        assert backend.pending_count() == 0
+
+    def test_job_vencido_con_consulta_guardada_no_se_re_ejecuta(self, factory, avisos):
+        backend = SqlJobBackend(session_factory=factory)
+        backend.create(minuta_jobs.JobRecord(
+            job_id="j1", co_cnl="0101", credencial=CREDENCIAL, fecha_minuta_hint=None,
+            estado=PENDIENTE, creado=minuta_jobs.datetime.now(), documento=documento(),
+        ))
+        assert backend.claim().id_consulta is None
+        backend.mark_persisted("j1", 55)  # el nodo guardó la consulta y cayó antes de cerrar el job
+
+        db = factory()
+        db.get(MinutaJob, "j1").fe_inicio -= minuta_jobs.timedelta(seconds=minuta_jobs.STALE_S + 1)
+        db.commit()
+        db.close()
+
+        llamadas = []
+
+        async def extractor(job):
+            llamadas.append(job.job_id)
+            return {"co_cnl": job.co_cnl, "payload": {"id_consulta": 99}}
+
+        async def scenario():
+            runner = MinutaJobRunner(backend, workers=1, poll_s=0.05, extractor=extractor)
+            runner.start()
+            done = await wait_done(runner, "j1")
+            await runner.stop()
+            return done
+
+        done = run(scenario())
+        assert llamadas == []
+        assert done.estado == EXITO
+        assert done.resultado == {"co_cnl": "0101", "payload": {"id_consulta": 55}}
+        assert avisos == [55]
+
+    def test_job_desconocido(self, factory):
+        assert SqlJobBackend(session_factory=factory).get("no-existe") is None
+
+
+class TestConsultaDelJob:
+    """GET /api/v1/minutas/jobs/{id}: solo la credencial que envió el job ve su resultado."""
+
+    class FakeAuthenticator:
+        def authenticate(self, db, token, status_code=400, detail="token incorrecto"):
+            if token not in ("tok-7", "tok-8"):
+                raise HTTPException(status_code=status_code, detail=detail)
+            co = int(token.split("-")[1])
+            return ResolvedCredential(co_credencial_seguridad=co, co_seguridad=3, no_notaria="NOTARIA X")
+
+    @pytest.fixture
+    def consultar(self, monkeypatch):
+        from app.controllers import minuta_controller
+
+        backend = InMemoryJobBackend()
+        backend.create(minuta_jobs.JobRecord(
+            job_id="j1", co_cnl="0101", credencial=CREDENCIAL, fecha_minuta_hint=None,
+            estado=PENDIENTE, creado=minuta_jobs.datetime.now(), documento=documento(),
+        ))
+        runner = MinutaJobRunner(backend, extractor=lambda job: None)
+        monkeypatch.setattr(minuta_controller, "get_minuta_jobs", lambda: runner)
+        monkeypatch.setattr(minuta_controller, "get_token_authenticator", lambda: self.FakeAuthenticator())
+        return lambda job_id, token: run(minuta_controller.get_minuta_job(db=None, job_id=job_id, token=token))
+
+    def test_misma_credencial(self, consultar):
+        assert consultar("j1", "tok-7")["status"] == PENDIENTE
+
+    @pytest.mark.parametrize("job_id, token, status", [
+        ("j1", None, 400),       # sin token
+        ("j1", "malo", 400),     # token inválido
+        ("j1", "tok-8", 404),    # otra credencial: como si no existiera
+        ("j2", "tok-7", 404),
+    ])
+    def test_rechazos(self, consultar, job_id, token, status):
+        with pytest.raises(HTTPException) as exc:
+            consultar(job_id, token)
+        assert exc.value.status_code == status
@@ -0,0 +1,460 @@
+# tests/services/test_scan_medio_pago.py
+"""
+Unit tests del flujo ScanService.scan_medio_pago sobre SQLite en memoria,
+con un gateway LLM falso (no llama a OpenAI) y token ya resuelto.
+Ejecutar: python -m pytest tests/services/test_scan_medio_pago.py -v
+"""
+import sys
+import os
+import io
+import json
+import asyncio
+
+import pytest
+from PIL import Image
+from starlette.datastructures import UploadFile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from tests.db.sqlite_schema import make_session
+from app.core.security import ResolvedCredential
+from app.models.scan import AuditoriaEscaneo, EscaneoMedioPago, ParametroSistema, TipoDocumentoEscaneo
+from app.services import scan_service
+from app.services.scan_service import ScanService
+
+RESPUESTA = {
+    "medio_pago": "DEPOSITO EN CUENTA", "moneda": "SOLES", "valor_bien": "1,250.00",
+    "fecha_pago": "2025-03-04", "bancos": "BCP", "documento_pago": "123456",
+}
+
+
+class FakeGateway:
+    def __init__(self, response=None, error=None):
+        self.response = response or RESPUESTA
+        self.error = error
+        self.calls = []
+        self.db = None
+        self.in_transaction = []  # ¿la sesión tenía conexión tomada durante cada llamada?
+
+    async def chat_json(self, messages, trace_id=None, tag="OPENAI"):
+        self.calls.append(messages)
+        if self.db is not None:
+            self.in_transaction.append(self.db.in_transaction())
+        if self.error:
+            raise self.error
+        return dict(self.response), {"total_tokens": 1015, "prompt_tokens": 1000, "completion_tokens": 15}
+
+
+class FakeAuthenticator:
+    # token -> notaría
+    def authenticate(self, db, token, status_code=400, detail="token incorrecto"):
+        return ResolvedCredential(co_credencial_seguridad=1, co_seguridad=1, no_notaria=f"NOTARIA {token.upper()}")
+
+
+def photo(size=(3000, 4000)) -> bytes:
+    out = io.BytesIO()
+    Image.effect_noise(size, 64).convert("RGB").save(out, format="JPEG", quality=95)
+    return out.getvalue()
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    db = make_session(TipoDocumentoEscaneo, EscaneoMedioPago, AuditoriaEscaneo, ParametroSistema)
+    for i, de in enumerate(("VOUCHER", "CHEQUE DE GERENCIA", "TRANSFERENCIA DE FONDOS"), start=1):
+        db.add(TipoDocumentoEscaneo(co_tipo_doc=i, de_tipo_doc=de))
+    db.commit()
+    gateway = FakeGateway()
+    scan_service._precios_cache.clear()
+    monkeypatch.setattr(scan_service, "IMAGES_DIR", str(tmp_path))
+    monkeypatch.setattr(scan_service, "get_llm_gateway", lambda: gateway)
+    monkeypatch.setattr(scan_service, "get_token_authenticator", lambda: FakeAuthenticator())
+    return db, gateway
+
+
+def scan(db, content: bytes, filename="voucher.jpg", referencia="EXP-1", token="uno"):
+    upload = UploadFile(file=io.BytesIO(content), filename=filename)
+    return asyncio.run(ScanService.scan_medio_pago(token=token, file=upload, referencia=referencia, db=db))
+
+
+def voucher(seed: int, size=(1200, 900)) -> bytes:
+    import random
+
+    from PIL import ImageDraw
+
+    rnd = random.Random(seed)
+    img = Image.new("RGB", size, (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x0, y0 = rnd.randrange(size[0]), rnd.randrange(size[1])
+        draw.rectangle((x0, y0, x0 + rnd.randrange(100, 500), y0 + rnd.randrange(50, 300)),
+                       fill=tuple(rnd.randrange(256) for _ in range(3)))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+class TestPreprocesado:
+
+    def test_envia_imagen_reducida_y_audita_bytes_y_tokens(self, env):
+        db, gateway = env
+        raw = photo()
+        result = scan(db, raw)
+        assert result["status"] == "success"
+
+        image_part = gateway.calls[0][1]["content"][1]["image_url"]
+        assert image_part["detail"] == "high"
+        assert image_part["url"].startswith("data:image/jpeg;base64,")
+
+        audit = db.query(AuditoriaEscaneo).one()
+        assert audit.estado == "SUCCESS"
+        assert audit.bytes_original == len(raw)
+        assert audit.bytes_enviados < audit.bytes_original
+        # en "high" la API ya lleva el lado menor a 768px: el ahorro aquí es de bytes
+        assert audit.tokens_imagen_enviada <= audit.tokens_imagen_original
+        assert audit.detalle_imagen == "high"
+
+    def test_en_disco_queda_la_original(self, env, tmp_path):
+        db, _ = env
+        raw = photo(size=(2000, 1500))
+        scan(db, raw)
+        escaneo = db.query(EscaneoMedioPago).one()
+        with open(tmp_path / os.path.basename(escaneo.url_imagen), "rb") as f:
+            assert f.read() == raw
+
+    def test_error_de_ia_tambien_audita_la_imagen(self, env):
+        db, gateway = env
+        gateway.error = RuntimeError("timeout")
+        with pytest.raises(Exception):
+            scan(db, photo(size=(400, 300)))
+        audit = db.query(AuditoriaEscaneo).one()
+        assert audit.estado == "ERROR"
+        assert audit.detalle_imagen == "low" and audit.tokens_imagen_enviada == 85
+
+
+class TestSubida:
+
+    def test_subida_demasiado_grande_413(self, env, tmp_path, monkeypatch):
+        db, gateway = env
+        monkeypatch.setattr(scan_service.settings, "scan_max_upload_mb", 1)
+        with pytest.raises(Exception) as exc:
+            scan(db, os.urandom(2 * 1024 * 1024))
+        assert getattr(exc.value, "status_code", None) == 413
+        assert gateway.calls == []
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestDuplicados:
+
+    def test_copia_exacta_reutiliza_sin_ia(self, env):
+        db, gateway = env
+        raw = voucher(1)
+        first = scan(db, raw, referencia="EXP-1")
+        second = scan(db, raw, referencia="EXP-2")
+        assert len(gateway.calls) == 1
+        assert second["data"]["id_escaneo_origen"] == first["data"]["id_escaneo"]
+        assert second["data"]["valores"] == first["data"]["valores"]
+
+        copia = db.get(EscaneoMedioPago, second["data"]["id_escaneo"])
+        assert copia.referencia == "EXP-2" and copia.monto == 1250
+        audit = db.query(AuditoriaEscaneo).filter_by(id_escaneo=copia.id_escaneo).one()
+        assert audit.estado == "DUPLICADO" and audit.tokens_consumidos == 0
+
+    def test_busqueda_no_retiene_la_conexion_durante_la_ia(self, env):
+        db, gateway = env
+        gateway.db = db
+        scan(db, voucher(1))
+        assert gateway.in_transaction == [False]
+
+    def test_copia_recomprimida_se_lee_de_nuevo(self, env):
+        # solo copias exactas: una imagen parecida puede ser otro voucher de la misma plantilla
+        db, gateway = env
+        raw = voucher(1)
+        with Image.open(io.BytesIO(raw)) as img:
+            out = io.BytesIO()
+            img.resize((800, 600)).save(out, format="JPEG", quality=50)
+        scan(db, raw)
+        second = scan(db, out.getvalue())
+        assert len(gateway.calls) == 2
+        assert second["data"].get("id_escaneo_origen") is None
+
+    def test_otra_notaria_u_otra_imagen_llaman_a_la_ia(self, env):
+        db, gateway = env
+        scan(db, voucher(1), token="uno")
+        scan(db, voucher(1), token="dos")
+        scan(db, voucher(2), token="uno")
+        assert len(gateway.calls) == 3
+
+    def test_original_fallido_no_se_reutiliza(self, env):
+        db, gateway = env
+        gateway.error = RuntimeError("timeout")
+        with pytest.raises(Exception):
+            scan(db, voucher(1))
+        gateway.error = None
+        result = scan(db, voucher(1))
+        assert len(gateway.calls) == 2
+        assert "id_escaneo_origen" not in result["data"]
+
+    def test_desactivado(self, env, monkeypatch):
+        db, gateway = env
+        monkeypatch.setattr(scan_service.settings, "scan_dedup_enabled", False)
+        scan(db, voucher(1))
+        scan(db, voucher(1))
+        assert len(gateway.calls) == 2
+
+
+class MultiGateway(FakeGateway):
+    """Responde un resultado por imagen recibida; `omit` deja fuera esas posiciones (1..n)."""
+
+    def __init__(self, omit=()):
+        super().__init__()
+        self.omit = set(omit)
+
+    async def chat_json(self, messages, trace_id=None, tag="OPENAI"):
+        self.calls.append(messages)
+        if self.db is not None:
+            self.in_transaction.append(self.db.in_transaction())
+        n = sum(1 for c in messages[1]["content"] if c["type"] == "image_url")
+        resultados = [
+            {"imagen": k, **RESPUESTA, "documento_pago": f"OP-{len(self.calls)}-{k}"}
+            for k in range(1, n + 1) if k not in self.omit
+        ]
+        return {"resultados": resultados}, {"total_tokens": 1000 * n + 30, "prompt_tokens": 1000 * n, "completion_tokens": 30}
+
+
+def scan_multi(db, contents, token="uno"):
+    files = [UploadFile(file=io.BytesIO(c), filename=f"v{i}.jpg") for i, c in enumerate(contents)]
+    return asyncio.run(ScanService.scan_multi(token=token, files=files, referencia="EXP-9", db=db))
+
+
+class TestMulti:
+
+    def test_agrupa_imagenes_por_llamada_y_reparte_tokens(self, env, monkeypatch):
+        db, _ = env
+        gateway = MultiGateway()
+        monkeypatch.setattr(scan_service, "get_llm_gateway", lambda: gateway)
+        monkeypatch.setattr(scan_service.settings, "scan_multi_images_per_request", 3)
+
+        result = scan_multi(db, [voucher(i) for i in range(5)])
+        assert len(gateway.calls) == 2
+        assert result["meta"]["llamadas_ia"] == 2 and result["meta"]["imagenes"] == 5
+        assert [r["archivo"] for r in result["data"]] == [f"v{i}.jpg" for i in range(5)]
+        assert result["data"][4]["valores"]["documento_pago"] == "OP-2-2"
+
+        audits = db.query(AuditoriaEscaneo).order_by(AuditoriaEscaneo.id_escaneo).all()
+        assert len(audits) == 5 and {a.estado for a in audits} == {"SUCCESS"}
+        assert sum(a.prompt_tokens for a in audits) == 5000
+        assert sum(a.completion_tokens for a in audits) == 60
+        assert db.query(EscaneoMedioPago).filter_by(referencia="EXP-9").count() == 5
+
+    def test_imagen_sin_resultado_queda_como_error(self, env, monkeypatch):
+        db, _ = env
+        gateway = MultiGateway(omit={2})
+        monkeypatch.setattr(scan_service, "get_llm_gateway", lambda: gateway)
+
+        result = scan_multi(db, [voucher(1), voucher(2)])
+        assert "valores" in result["data"][0]
+        assert "error" in result["data"][1]
+        estados = {a.id_escaneo: a.estado for a in db.query(AuditoriaEscaneo)}
+        assert estados[result["data"][1]["id_escaneo"]] == "ERROR"
+
+    def test_repetidas_en_el_lote_una_sola_lectura(self, env, monkeypatch):
+        db, _ = env
+        gateway = MultiGateway()
+        monkeypatch.setattr(scan_service, "get_llm_gateway", lambda: gateway)
+
+        result = scan_multi(db, [voucher(1), voucher(1)])
+        content = gateway.calls[0][1]["content"]
+        assert sum(1 for c in content if c["type"] == "image_url") == 1
+        assert result["data"][1]["id_escaneo_origen"] == result["data"][0]["id_escaneo"]
+
+    def test_sin_conexion_durante_la_ia_y_un_solo_commit(self, env, monkeypatch):
+        from sqlalchemy import event
+
+        db, _ = env
+        previo = scan(db, voucher(7))["data"]["id_escaneo"]  # se reconoce como repetida
+        gateway = MultiGateway()
+        gateway.db = db
+        monkeypatch.setattr(scan_service, "get_llm_gateway", lambda: gateway)
+        monkeypatch.setattr(scan_service.settings, "scan_multi_images_per_request", 2)
+        commits = []
+        event.listen(db, "after_commit", lambda session: commits.append(1))
+
+        result = scan_multi(db, [voucher(1), voucher(2), voucher(3), voucher(7), voucher(1)])
+        assert gateway.in_transaction == [False, False]
+        assert len(commits) == 1
+        assert result["data"][3]["id_escaneo_origen"] == previo
+        assert result["data"][4]["id_escaneo_origen"] == result["data"][0]["id_escaneo"]
+        assert len({r["id_escaneo"] for r in result["data"]}) == 5
+
+    def test_limite_de_archivos(self, env, monkeypatch):
+        db, _ = env
+        monkeypatch.setattr(scan_service.settings, "scan_multi_max_files", 2)
+        with pytest.raises(Exception) as exc:
+            scan_multi(db, [voucher(i) for i in range(3)])
+        assert exc.value.status_code == 400
+
+
+class SlowGateway(FakeGateway):
+    """Demora `slow_s` las imágenes pequeñas (detail "low") y `fast_s` el resto; mide concurrencia."""
+
+    def __init__(self, slow_s=0.3, fast_s=0.02):
+        super().__init__()
+        self.slow_s = slow_s
+        self.fast_s = fast_s
+        self.active = 0
+        self.max_active = 0
+
+    async def chat_json(self, messages, trace_id=None, tag="OPENAI"):
+        n = len(self.calls)
+        self.calls.append(messages)
+        detail = messages[1]["content"][1]["image_url"]["detail"]
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.slow_s if detail == "low" else self.fast_s)
+        finally:
+            self.active -= 1
+        return {**RESPUESTA, "documento_pago": f"OP-{n}"}, {"total_tokens": 115, "prompt_tokens": 100, "completion_tokens": 15}
+
+
+def scan_batch(db, contents, token="uno"):
+    from sqlalchemy import event
+    from sqlalchemy.orm import sessionmaker
+
+    marcas = []
+    factory = sessionmaker(bind=db.get_bind())
+    event.listen(factory, "after_commit", lambda session: marcas.append(len(db.statements)))
+
+    async def run():
+        files = [UploadFile(file=io.BytesIO(c), filename=f"v{i}.jpg") for i, c in enumerate(contents)]
+        lines = await ScanService.scan_batch(token=token, files=files, referencia="LOTE", db=db, session_factory=factory)
+        return [json.loads(line) async for line in lines]
+
+    lines = asyncio.run(run())
+    # por commit: el SQL ejecutado después de él hasta terminar el stream
+    return lines, [db.statements[m:] for m in marcas]
+
+
+class TestBatch:
+
+    def test_concurrencia_acotada_y_resultados_a_medida_que_llegan(self, env, monkeypatch):
+        db, _ = env
+        gateway = SlowGateway()
+        monkeypatch.setattr(scan_service, "get_llm_gateway", lambda: gateway)
+        monkeypatch.setattr(scan_service.settings, "scan_batch_concurrency", 2)
+
+        # la primera es pequeña (detail "low"): el gateway falso la demora más
+        lines, commits = scan_batch(db, [voucher(0, size=(400, 300))] + [voucher(i) for i in range(1, 4)])
+        assert gateway.max_active == 2
+        items, resumen = lines[:-1], lines[-1]["resumen"]
+        assert len(items) == 4
+        # la primera imagen es la más lenta: no bloquea a las demás
+        assert items[-1]["indice"] == 0
+        assert all(item["status"] == "success" for item in items)
+
+        assert len(commits) == 1
+        # los ids del resumen se leen antes del commit: ningún SELECT de refresco por fila
+        assert not any(stmt.lstrip().upper().startswith("SELECT") for stmt in commits[0])
+        assert resumen["imagenes"] == 4 and resumen["errores"] == 0
+        assert resumen["tokens_consumidos"] == 4 * 115
+        ids = resumen["id_escaneos"]
+        assert [db.get(EscaneoMedioPago, x).documento_pago for x in ids] == [
+            next(it["valores"]["documento_pago"] for it in items if it["indice"] == k) for k in range(4)
+        ]
+        assert db.query(AuditoriaEscaneo).filter(AuditoriaEscaneo.id_escaneo.in_(ids)).count() == 4
+
+    def test_errores_y_repetidas(self, env, monkeypatch):
+        db, gateway = env
+        scan(db, voucher(7))  # escaneo previo de la notaría
+        gateway.error = RuntimeError("timeout")
+
+        lines, commits = scan_batch(db, [voucher(7), voucher(8), voucher(8)])
+        por_indice = {line["indice"]: line for line in lines[:-1]}
+        assert por_indice[0]["id_escaneo_origen"] == 1
+        assert por_indice[1]["status"] == "error"
+        assert por_indice[2]["status"] == "error" and por_indice[2]["duplicado_de_indice"] == 1
+        assert len(gateway.calls) == 2  # escaneo previo + una sola llamada para las repetidas del lote
+
+        resumen = lines[-1]["resumen"]
+        assert resumen["errores"] == 2 and len(commits) == 1
+        estados = [db.query(AuditoriaEscaneo).filter_by(id_escaneo=x).one().estado for x in resumen["id_escaneos"]]
+        assert estados == ["DUPLICADO", "ERROR", "ERROR"]
+
+
+class TestPersistencia:
+
+    def test_exito_un_commit_y_precios_cacheados(self, env):
+        from sqlalchemy import event
+
+        db, _ = env
+        db.add(ParametroSistema(co_parametro="PRECIO_GPT4O_MINI_INPUT", valor="0.000001"))
+        db.commit()
+        commits = []
+        event.listen(db, "after_commit", lambda session: commits.append(1))
+
+        scan(db, voucher(1))
+        assert len(commits) == 1
+        audit = db.query(AuditoriaEscaneo).one()
+        assert float(audit.costo_usd) == pytest.approx(1000 * 0.000001 + 15 * 0.00000060)
+
+        db.statements.clear()
+        scan(db, voucher(2))
+        assert not any("p_parametro_sistema" in sql for sql in db.statements)
+
+    def test_cambio_de_precio_invalida_el_cache(self, env):
+        db, _ = env
+        assert scan_service._precios_tokens(db) == (0.00000015, 0.00000060)
+        db.add(ParametroSistema(co_parametro="PRECIO_GPT4O_MINI_OUTPUT", valor="0.000002"))
+        db.commit()
+        assert scan_service._precios_tokens(db) == (0.00000015, 0.000002)
+
+    def test_write_behind(self, env, tmp_path, monkeypatch):
+        from sqlalchemy.orm import sessionmaker
+        from app.services.scan_writer import ScanWriteBehind
+
+        # el hilo escritor necesita ver la misma BD: SQLite en archivo
+        db = make_session(
+            EscaneoMedioPago, AuditoriaEscaneo, ParametroSistema, url=f"sqlite:///{tmp_path / 'scan.db'}"
+        )
+        writer = ScanWriteBehind(session_factory=sessionmaker(bind=db.get_bind()))
+        monkeypatch.setattr(scan_service, "get_scan_writer", lambda: writer)
+        monkeypatch.setattr(scan_service.settings, "scan_write_behind", True)
+
+        result = scan(db, voucher(1))
+        assert result["data"]["id_escaneo"] is None
+        assert result["data"]["valores"]["bancos"] == "BCP"
+        writer.flush(timeout=5)
+
+        escaneo = db.query(EscaneoMedioPago).one()
+        assert escaneo.auditorias[0].estado == "SUCCESS"
+        assert writer.stats()["written"] == 1 and writer.stats()["pending"] == 0
+
+    def test_write_behind_saturado_no_escribe_en_el_event_loop(self, tmp_path):
+        import threading
+        from sqlalchemy.orm import sessionmaker
+        from app.services.scan_writer import ScanWriteBehind
+
+        db = make_session(EscaneoMedioPago, AuditoriaEscaneo, url=f"sqlite:///{tmp_path / 'scan.db'}")
+        factory = sessionmaker(bind=db.get_bind())
+        liberar, hilos = threading.Event(), []
+
+        def session_factory():
+            hilos.append(threading.get_ident())
+            if len(hilos) == 1:
+                liberar.wait(5)  # la primera escritura ocupa la cola
+            return factory()
+
+        writer = ScanWriteBehind(session_factory=session_factory, max_pending=1)
+
+        async def scenario():
+            primera = await writer.submit(EscaneoMedioPago(notaria="N", co_tipo_doc=1, url_imagen="/a.jpg"))
+            segunda = await writer.submit(EscaneoMedioPago(notaria="N", co_tipo_doc=1, url_imagen="/b.jpg"))
+            liberar.set()
+            return threading.get_ident(), primera, segunda
+
+        loop_thread, primera, segunda = asyncio.run(scenario())
+        writer.flush(timeout=5)
+        assert segunda.done() and segunda.exception() is None
+        assert primera.result(timeout=5) is None
+        assert loop_thread not in hilos
+        assert writer.stats()["inline"] == 1 and db.query(EscaneoMedioPago).count() == 2
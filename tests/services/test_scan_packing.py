@@ -0,0 +1,61 @@
+# tests/services/test_scan_packing.py
+"""
+Unit tests para el empaquetado de varios vouchers por llamada de visión:
+armado de mensajes, lectura del arreglo de resultados y reparto de tokens.
+Ejecutar: python -m pytest tests/services/test_scan_packing.py -v
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.services.scan_packing import build_multi_messages, chunked, parse_multi_results, split_tokens
+from app.utils.vision_image import PreparedImage
+
+
+def image(tokens=765):
+    return PreparedImage(
+        data=b"x", mime="image/jpeg", detail="high", width=10, height=10,
+        bytes_original=1, tokens_original=tokens, tokens_enviados=tokens,
+    )
+
+
+class TestMensajes:
+
+    def test_prompt_una_vez_e_imagenes_numeradas(self):
+        messages = build_multi_messages("REGLAS", [image(), image(), image()])
+        content = messages[1]["content"]
+        assert sum(1 for c in content if c["type"] == "text" and "REGLAS" in c["text"]) == 1
+        assert [c["text"] for c in content if c["type"] == "text"][1:] == ["Imagen 1:", "Imagen 2:", "Imagen 3:"]
+        assert sum(1 for c in content if c["type"] == "image_url") == 3
+        assert "Recibirás 3 imágenes" in content[0]["text"]
+
+    def test_chunked(self):
+        assert chunked([1, 2, 3, 4, 5], 2) == [[1, 2], [3, 4], [5]]
+
+
+class TestResultados:
+
+    def test_por_numero_de_imagen(self):
+        data = {"resultados": [{"imagen": 2, "bancos": "BBVA"}, {"imagen": 1, "bancos": "BCP"}]}
+        assert parse_multi_results(data, 2) == [{"bancos": "BCP"}, {"bancos": "BBVA"}]
+
+    def test_sin_numero_por_posicion_y_faltantes_none(self):
+        data = {"resultados": [{"bancos": "BCP"}]}
+        assert parse_multi_results(data, 3) == [{"bancos": "BCP"}, None, None]
+
+    def test_respuesta_invalida(self):
+        assert parse_multi_results({"medio_pago": "x"}, 2) == [None, None]
+        assert parse_multi_results({"resultados": [{"imagen": 9}, "x"]}, 1) == [None]
+
+
+class TestReparto:
+
+    def test_suma_exacta(self):
+        parts = split_tokens(1001, [765, 765, 85])
+        assert sum(parts) == 1001
+        assert parts[0] == parts[1] > parts[2]
+
+    def test_pesos_cero_reparte_igual(self):
+        assert split_tokens(10, [0, 0]) == [5, 5]
+        assert split_tokens(0, [1, 2]) == [0, 0]
@@ -0,0 +1,110 @@
+# tests/services/test_security.py
+"""
+Unit tests para la autenticación por token (hash generado e indexado + cache TTL).
+Usan SQLite en memoria con las tablas p_seguridad / h_credencial_seguridad.
+Ejecutar: python -m pytest tests/services/test_security.py -v
+"""
+import sys
+import os
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from tests.db.sqlite_schema import make_session
+import app.core.security as security
+from app.core.security import TokenAuthenticator, hash_token
+from app.models.minuta import HCredencialSeguridad, PSeguridad
+
+
+@pytest.fixture
+def db():
+    session = make_session(PSeguridad, HCredencialSeguridad)
+    session.add(PSeguridad(co_seguridad=1, co_notaria=10, name="NOTARIA UNO"))
+    session.add(HCredencialSeguridad(co_seguridad=1, no_token_api="tok-activo", in_estado=1))
+    session.commit()
+    del session.statements[:]
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def auth(monkeypatch):
+    a = TokenAuthenticator(ttl_s=60)
+    monkeypatch.setattr(security, "_authenticator", a)
+    return a
+
+
+class TestTokenAuthenticator:
+
+    def test_hash_lo_genera_la_bd(self, db):
+        cred = db.query(HCredencialSeguridad).first()
+        assert cred.no_token_hash == hash_token("tok-activo")
+
+    def test_resuelve_y_cachea(self, db, auth):
+        cred = auth.resolve(db, "tok-activo")
+        assert cred.co_seguridad == 1 and cred.no_notaria == "NOTARIA UNO"
+
+        n = len(db.statements)
+        assert auth.resolve(db, "tok-activo") == cred
+        assert len(db.statements) == n          # cache hit: cero round trips
+        assert auth.stats()["db_lookups"] == 1
+
+    def test_token_invalido(self, db, auth):
+        assert auth.resolve(db, "otro") is None
+        assert auth.resolve(db, "") is None
+        with pytest.raises(HTTPException) as exc:
+            auth.authenticate(db, "otro", status_code=401, detail="Token incorrecto o inactivo")
+        assert exc.value.status_code == 401
+
+    def test_token_invalido_se_cachea_brevemente(self, db, auth):
+        assert auth.resolve(db, "otro") is None
+        n = len(db.statements)
+        assert auth.resolve(db, "otro") is None
+        assert len(db.statements) == n          # sin volver a la BD
+        assert auth.stats()["db_lookups"] == 1
+
+    def test_alta_posterior_invalida_el_negativo(self, db, auth):
+        assert auth.resolve(db, "tok-nuevo") is None
+        db.add(HCredencialSeguridad(co_seguridad=1, no_token_api="tok-nuevo", in_estado=1))
+        db.commit()
+        assert auth.resolve(db, "tok-nuevo").co_seguridad == 1
+
+    def test_sin_cache_negativo(self, db):
+        a = TokenAuthenticator(ttl_s=60, negative_ttl_s=0)
+        a.resolve(db, "otro")
+        a.resolve(db, "otro")
+        assert a.stats()["db_lookups"] == 2
+
+    def test_alta_y_rotacion_fuera_del_orm(self, db, auth):
+        # las credenciales se administran por SQL directo: el hash no depende del ORM
+        tabla = HCredencialSeguridad.__table__
+        db.execute(tabla.insert().values(co_seguridad=1, no_token_api="tok-sql", in_estado=1))
+        db.commit()
+        assert auth.resolve(db, "tok-sql").co_seguridad == 1
+
+        db.execute(tabla.update().where(tabla.c.no_token_api == "tok-sql").values(no_token_api="tok-rotado"))
+        db.commit()
+        auth.invalidate()                       # lo que haría el vencimiento del TTL
+        assert auth.resolve(db, "tok-sql") is None
+        assert auth.resolve(db, "tok-rotado").co_seguridad == 1
+
+    def test_desactivar_invalida_el_cache(self, db, auth):
+        assert auth.resolve(db, "tok-activo") is not None
+
+        cred = db.query(HCredencialSeguridad).first()
+        cred.in_estado = 0
+        db.commit()
+
+        assert auth.resolve(db, "tok-activo") is None
+
+    def test_rotar_token_invalida_el_anterior(self, db, auth):
+        assert auth.resolve(db, "tok-activo") is not None
+
+        cred = db.query(HCredencialSeguridad).first()
+        cred.no_token_api = "tok-nuevo"
+        db.commit()
+
+        assert auth.resolve(db, "tok-activo") is None
+        assert auth.resolve(db, "tok-nuevo").co_seguridad == 1
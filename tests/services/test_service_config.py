@@ -0,0 +1,99 @@
+# tests/services/test_service_config.py
+"""
+Unit tests para el cache de configuración por co_cnl.
+No requieren BD: la Session se simula con MagicMock.
+Ejecutar: python -m pytest tests/services/test_service_config.py -v
+"""
+import sys
+import os
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.models.prompt import Prompt
+from app.models.servicio_cnl import ServicioCnl
+from app.services.service_config import ServiceConfigCache, load_service_config
+
+
+TEMPLATE = "Servicio {{co_cnl}}\n{{reglas_servicio}}\n{{ciiu_catalogo}}\n{{contenido}}"
+
+
+def make_db(template: str = TEMPLATE, activo: bool = True, con_prompt: bool = True):
+    servicio = ServicioCnl(
+        co_servicio_cnl=7, co_cnl="0101", de_servicio=" COMPRA VENTA ", in_estado=1,
+        no_otorgante="VENDEDOR", min_otorgante=1, in_tipo_otorgante=0,
+        no_beneficiario="COMPRADOR", min_beneficiario=1, in_tipo_beneficiario=0,
+        no_otro=None, min_otro=2, in_tipo_otro=0,
+        in_medio_pago=1, in_oportunidad_pago=0, in_bienes=1, in_aporte_bienes=0,
+    )
+    prompt = Prompt(co_prompt=3, de_promp=template, in_estado=1)
+
+    db = MagicMock()
+    db.query.return_value.filter.return_value.first.return_value = servicio if activo else None
+    db.execute.return_value.first.return_value = (prompt, servicio) if con_prompt else None
+    return db
+
+
+class TestLoadServiceConfig:
+
+    def test_arma_configuracion_completa(self):
+        config = load_service_config(make_db(), "0101")
+        assert config.de_servicio == "COMPRA VENTA"
+        assert config.co_prompt == 3
+        assert config.min_otro == 2
+        assert config.uses_ciiu is True
+        assert config.servicio.no_otorgante == "VENDEDOR"
+        assert len(config.prompt_version) == 16
+        assert "{{" not in config.compiled_template.render({
+            "co_cnl": "0101", "reglas_servicio": "", "ciiu_catalogo": "", "contenido": "x",
+        })
+
+    def test_sin_ciiu_en_plantilla(self):
+        config = load_service_config(make_db(template="{{contenido}}"), "0101")
+        assert config.uses_ciiu is False
+
+    def test_servicio_inactivo_400(self):
+        with pytest.raises(HTTPException) as exc:
+            load_service_config(make_db(activo=False), "0101")
+        assert exc.value.status_code == 400
+
+    def test_sin_prompt_activo_400(self):
+        with pytest.raises(HTTPException) as exc:
+            load_service_config(make_db(con_prompt=False), "0101")
+        assert exc.value.status_code == 400
+
+    def test_prompt_vacio_404(self):
+        with pytest.raises(HTTPException) as exc:
+            load_service_config(make_db(template="   "), "0101")
+        assert exc.value.status_code == 404
+
+
+class TestServiceConfigCache:
+
+    def test_segunda_llamada_no_toca_bd(self):
+        cache = ServiceConfigCache(ttl_s=60)
+        db = make_db()
+        a = cache.get(db, "0101")
+        calls = db.execute.call_count
+        b = cache.get(db, "0101")
+        assert a is b
+        assert db.execute.call_count == calls
+        assert cache.stats()["loads"] == 1
+
+    def test_invalidate_recarga(self):
+        cache = ServiceConfigCache(ttl_s=60)
+        db = make_db()
+        a = cache.get(db, "0101")
+        cache.invalidate("0101")
+        b = cache.get(db, "0101")
+        assert a is not b
+        assert cache.stats()["loads"] == 2
+
+    def test_errores_no_se_cachean(self):
+        cache = ServiceConfigCache(ttl_s=60)
+        with pytest.raises(HTTPException):
+            cache.get(make_db(activo=False), "0101")
+        assert cache.get(make_db(), "0101").co_cnl == "0101"
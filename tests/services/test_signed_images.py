@@ -0,0 +1,107 @@
+# tests/services/test_signed_images.py
+"""
+Unit tests para las URLs firmadas de imágenes de escaneos y sus
+cabeceras de cache (ETag, Last-Modified, 304, Range). No requieren BD.
+Ejecutar: python -m pytest tests/services/test_signed_images.py -v
+"""
+import sys
+import os
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import main
+from app.core.config import settings
+from app.core.security import build_signed_image_url, image_url_expiry, sign_image, verify_image_signature
+from app.services import scan_service
+
+IMG = bytes(range(256)) * 8
+
+
+@pytest.fixture(autouse=True)
+def secreto(monkeypatch):
+    monkeypatch.setattr(settings, "image_url_secret", "secreto-de-prueba")
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    (tmp_path / "voucher.jpg").write_bytes(IMG)
+    monkeypatch.setattr(scan_service, "IMAGES_DIR", str(tmp_path))
+    return TestClient(main.app)
+
+
+def split(url: str):
+    parsed = urlparse(url)
+    qs = parse_qs(parsed.query)
+    return parsed.path, int(qs["exp"][0]), qs["sig"][0]
+
+
+class TestFirma:
+
+    def test_firma_valida(self):
+        path, exp, sig = split(build_signed_image_url("voucher.jpg"))
+        assert path == "/api/v1/scan/image/voucher.jpg"
+        assert verify_image_signature("voucher.jpg", exp, sig)
+
+    def test_otro_archivo_o_exp_no_valida(self):
+        _, exp, sig = split(build_signed_image_url("voucher.jpg"))
+        assert not verify_image_signature("otro.jpg", exp, sig)
+        assert not verify_image_signature("voucher.jpg", exp + 1, sig)
+        assert not verify_image_signature("voucher.jpg", None, sig)
+
+    def test_expirada(self):
+        exp = int(time.time()) - 1
+        assert not verify_image_signature("voucher.jpg", exp, sign_image("voucher.jpg", exp))
+
+    def test_sin_secreto_desactivadas(self, monkeypatch):
+        _, exp, sig = split(build_signed_image_url("voucher.jpg"))
+        monkeypatch.setattr(settings, "image_url_secret", None)
+        assert build_signed_image_url("voucher.jpg") is None
+        assert not verify_image_signature("voucher.jpg", exp, sig)
+
+    def test_firma_depende_del_secreto(self, monkeypatch):
+        _, exp, sig = split(build_signed_image_url("voucher.jpg"))
+        monkeypatch.setattr(settings, "image_url_secret", "otro-secreto")
+        assert not verify_image_signature("voucher.jpg", exp, sig)
+
+    def test_url_estable_dentro_de_la_ventana(self):
+        t0 = 1_700_000_000 - (1_700_000_000 % 3600)
+        assert image_url_expiry(t0 + 10, 3600) == image_url_expiry(t0 + 3500, 3600)
+        assert image_url_expiry(t0 + 10, 3600) - (t0 + 10) >= 3600
+
+
+class TestEndpoint:
+
+    def test_sirve_con_cabeceras_de_cache(self, client):
+        r = client.get(build_signed_image_url("voucher.jpg"))
+        assert r.status_code == 200 and r.content == IMG
+        assert r.headers["etag"].startswith('"')
+        assert "last-modified" in r.headers
+        assert r.headers["cache-control"].startswith("private, max-age=")
+
+    def test_304_por_etag_y_por_fecha(self, client):
+        url = build_signed_image_url("voucher.jpg")
+        r = client.get(url)
+        assert client.get(url, headers={"If-None-Match": r.headers["etag"]}).status_code == 304
+        assert client.get(url, headers={"If-Modified-Since": r.headers["last-modified"]}).status_code == 304
+        assert client.get(url, headers={"If-None-Match": '"otro"'}).status_code == 200
+
+    def test_range(self, client):
+        r = client.get(build_signed_image_url("voucher.jpg"), headers={"Range": "bytes=0-99"})
+        assert r.status_code == 206
+        assert r.content == IMG[:100]
+
+    def test_firma_invalida_403(self, client):
+        _, exp, _ = split(build_signed_image_url("voucher.jpg"))
+        r = client.get(f"/api/v1/scan/image/voucher.jpg?exp={exp}&sig=falsa")
+        assert r.status_code == 403
+
+    def test_sin_token_ni_firma_401(self, client):
+        assert client.get("/api/v1/scan/image/voucher.jpg").status_code == 401
+
+    def test_archivo_inexistente_404(self, client):
+        assert client.get(build_signed_image_url("no-existe.jpg")).status_code == 404
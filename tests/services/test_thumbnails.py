@@ -0,0 +1,106 @@
+# tests/services/test_thumbnails.py
+"""
+Unit tests para las miniaturas WebP de imágenes de escaneos: generación
+perezosa con cache en disco, orientación EXIF y el endpoint /scan/thumb.
+Ejecutar: python -m pytest tests/services/test_thumbnails.py -v
+"""
+import sys
+import os
+import io
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import main
+from app.core.config import settings
+from app.core.security import THUMB_URL_PREFIX, build_signed_image_url
+from app.services import scan_service
+from app.utils.thumbnails import THUMB_SIZES, ensure_thumbnail, thumbnail_path
+
+
+def write_jpeg(path, size=(1200, 800), orientation=None):
+    img = Image.new("RGB", size, (200, 30, 30))
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    img.save(path, format="JPEG", exif=exif.tobytes())
+
+
+@pytest.fixture(autouse=True)
+def secreto(monkeypatch):
+    monkeypatch.setattr(settings, "image_url_secret", "secreto-de-prueba")
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    write_jpeg(tmp_path / "voucher.jpg")
+    (tmp_path / "roto.jpg").write_bytes(b"no es una imagen")
+    monkeypatch.setattr(scan_service, "IMAGES_DIR", str(tmp_path))
+    return TestClient(main.app)
+
+
+class TestEnsureThumbnail:
+
+    def test_genera_webp_del_tamano_pedido(self, tmp_path):
+        src = tmp_path / "a.jpg"
+        write_jpeg(src)
+        path = ensure_thumbnail(str(src), "sm")
+        assert path == thumbnail_path(str(src), "sm")
+        with Image.open(path) as img:
+            assert img.format == "WEBP"
+            assert max(img.size) == THUMB_SIZES["sm"]
+        assert os.path.getsize(path) < os.path.getsize(src)
+
+    def test_reutiliza_la_miniatura_en_disco(self, tmp_path, monkeypatch):
+        src = tmp_path / "a.jpg"
+        write_jpeg(src)
+        ensure_thumbnail(str(src), "md")
+
+        from app.utils import thumbnails
+        monkeypatch.setattr(thumbnails, "render_thumbnail", lambda *a: pytest.fail("no debía regenerar"))
+        ensure_thumbnail(str(src), "md")
+
+    def test_respeta_orientacion_exif(self, tmp_path):
+        src = tmp_path / "rotada.jpg"
+        write_jpeg(src, size=(1200, 800), orientation=6)  # 90° horario
+        with Image.open(ensure_thumbnail(str(src), "sm")) as img:
+            assert img.size[1] > img.size[0]
+
+    def test_tamano_desconocido(self, tmp_path):
+        with pytest.raises(ValueError):
+            ensure_thumbnail(str(tmp_path / "a.jpg"), "xl")
+
+
+class TestEndpoint:
+
+    def test_url_firmada_de_la_imagen_sirve_la_miniatura(self, client):
+        url = build_signed_image_url("voucher.jpg", prefix=f"{THUMB_URL_PREFIX}sm/")
+        assert urlparse(url).path == "/api/v1/scan/thumb/sm/voucher.jpg"
+        r = client.get(url)
+        assert r.status_code == 200
+        assert r.headers["content-type"] == "image/webp"
+        assert r.headers["cache-control"].startswith("private, max-age=")
+        with Image.open(io.BytesIO(r.content)) as img:
+            assert max(img.size) == THUMB_SIZES["sm"]
+
+    def test_304(self, client):
+        url = build_signed_image_url("voucher.jpg", prefix=f"{THUMB_URL_PREFIX}md/")
+        etag = client.get(url).headers["etag"]
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    def test_tamano_invalido_404(self, client):
+        url = build_signed_image_url("voucher.jpg", prefix=f"{THUMB_URL_PREFIX}xl/")
+        assert client.get(url).status_code == 404
+
+    def test_firma_invalida_403_y_sin_auth_401(self, client):
+        qs = parse_qs(urlparse(build_signed_image_url("voucher.jpg")).query)
+        assert client.get(f"/api/v1/scan/thumb/sm/voucher.jpg?exp={qs['exp'][0]}&sig=x").status_code == 403
+        assert client.get("/api/v1/scan/thumb/sm/voucher.jpg").status_code == 401
+
+    def test_archivo_que_no_es_imagen_415(self, client):
+        url = build_signed_image_url("roto.jpg", prefix=f"{THUMB_URL_PREFIX}sm/")
+        assert client.get(url).status_code == 415
@@ -0,0 +1,79 @@
+# tests/utils/test_fuzzy_matcher.py
+"""
+Unit tests para NgramMatcher (n-gramas + TF-IDF en NumPy).
+Ejecutar: python -m pytest tests/utils/test_fuzzy_matcher.py -v
+"""
+import sys
+import os
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.utils.fuzzy_matcher import NgramMatcher, char_ngrams
+from app.repositories.catalog_snapshot import CatalogSnapshot, SnapshotOcupacionRepository, SnapshotCiiuRepository
+
+OCUPACIONES = [
+    "COMERCIANTE", "COMERCIANTE MAYORISTA", "INGENIERO CIVIL", "INGENIERO DE SISTEMAS",
+    "ABOGADO", "MEDICO CIRUJANO", "CONTADOR PUBLICO", "AMA DE CASA", "EMPRESARIO",
+]
+
+
+def make_matcher(threshold: float = 0.45) -> NgramMatcher:
+    rows = [SimpleNamespace(co=i, de=d) for i, d in enumerate(OCUPACIONES)]
+    return NgramMatcher(rows, "de", threshold=threshold)
+
+
+class TestNgramMatcher:
+
+    def test_ngrams_plegados(self):
+        assert char_ngrams("sól") == char_ngrams("SOL")
+        assert " SO" in char_ngrams("sol")
+
+    def test_exacto_score_uno(self):
+        row, score = make_matcher().best("ama de casa")
+        assert row.de == "AMA DE CASA"
+        assert score > 0.99
+
+    def test_mejor_match_no_el_primero(self):
+        """LIKE '%INGENIERO%' devolvía el primero; el matcher elige el más parecido."""
+        row, _ = make_matcher().best("ingeniera de sistemas")
+        assert row.de == "INGENIERO DE SISTEMAS"
+
+    def test_variantes_de_genero_y_tildes(self):
+        m = make_matcher()
+        assert m.best("ABOGADA")[0].de == "ABOGADO"
+        assert m.best("empresaria")[0].de == "EMPRESARIO"
+        assert m.best("médico")[0].de == "MEDICO CIRUJANO"
+
+    def test_umbral_de_confianza(self):
+        row, score = make_matcher().best("astronauta")
+        assert row is None
+        assert score < 0.45
+
+    def test_catalogo_vacio(self):
+        assert NgramMatcher([], "de").best("X") == (None, 0.0)
+
+
+class TestSnapshotConMatcher:
+
+    def _snapshot(self):
+        R = SimpleNamespace
+        return CatalogSnapshot(
+            paises=[], tipos_documento=[], estados_civiles=[], monedas=[], zonas=[],
+            ocupaciones=[R(co_ocupacion=i, de_ocupacion=d) for i, d in enumerate(OCUPACIONES)]
+            + [R(co_ocupacion=116, de_ocupacion="OTROS (ESPECIFICAR)")],
+            ciius=[
+                R(co_ciiu=6, de_actividad="CONSTRUCCION"),
+                R(co_ciiu=9, de_actividad="COMERCIO AL POR MAYOR Y AL POR MENOR"),
+            ],
+        )
+
+    def test_ocupacion_fallback_otros(self):
+        repo = SnapshotOcupacionRepository(self._snapshot())
+        assert repo.find_by_desc("comerciante / vendedor").de_ocupacion == "COMERCIANTE"
+        assert repo.find_by_desc("astronauta").co_ocupacion == 116
+
+    def test_ciiu_difuso(self):
+        repo = SnapshotCiiuRepository(self._snapshot())
+        assert repo.find_best_match("comercio por menor").co_ciiu == 9
+        assert repo.find_best_match("zzzz qqqq") is None
@@ -0,0 +1,94 @@
+# tests/utils/test_llm_response_cache.py
+"""
+Unit tests para LLMResponseCache (SQLite local, TTL + LRU + invalidación por versión).
+Ejecutar: python -m pytest tests/utils/test_llm_response_cache.py -v
+"""
+import sys
+import os
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.utils.cache import LLMResponseCache
+from app.utils.prompt import build_prompt_version
+
+
+VALUE = {"raw_text": '{"acto": {}}', "prompt_tokens": 1200, "completion_tokens": 300, "model": "gpt-4o-mini"}
+
+
+def make_cache(tmp_path, **kwargs) -> LLMResponseCache:
+    return LLMResponseCache(path=str(tmp_path / "llm.sqlite3"), **kwargs)
+
+
+class TestLLMResponseCache:
+
+    def test_clave_depende_de_modelo_system_prompt_y_version(self):
+        k = LLMResponseCache.make_key("m", "sys", "prompt", "v1")
+        assert k == LLMResponseCache.make_key("m", "sys", "prompt", "v1")
+        assert k != LLMResponseCache.make_key("m2", "sys", "prompt", "v1")
+        assert k != LLMResponseCache.make_key("m", "sys2", "prompt", "v1")
+        assert k != LLMResponseCache.make_key("m", "sys", "prompt!", "v1")
+        assert k != LLMResponseCache.make_key("m", "sys", "prompt", "v2")
+
+    def test_hit_despues_de_set(self, tmp_path):
+        cache = make_cache(tmp_path)
+        key = cache.make_key("m", "s", "p")
+        assert cache.get(key) is None
+        cache.set(key, VALUE, scope="0101", version="v1")
+        assert cache.get(key) == VALUE
+        assert cache.stats()["hits"] == 1
+
+    def test_persiste_entre_instancias(self, tmp_path):
+        key = LLMResponseCache.make_key("m", "s", "p")
+        make_cache(tmp_path).set(key, VALUE)
+        assert make_cache(tmp_path).get(key) == VALUE
+
+    def test_ttl_expira(self, tmp_path):
+        cache = make_cache(tmp_path, ttl_s=0.05)
+        cache.set("k", VALUE)
+        time.sleep(0.1)
+        assert cache.get("k") is None
+        assert cache.stats()["expired"] == 1
+
+    def test_lru_descarta_el_menos_usado(self, tmp_path):
+        cache = make_cache(tmp_path, max_entries=2)
+        cache.set("a", VALUE)
+        time.sleep(0.01)
+        cache.set("b", VALUE)
+        time.sleep(0.01)
+        cache.get("a")
+        time.sleep(0.01)
+        cache.set("c", VALUE)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == VALUE
+        assert cache.get("c") == VALUE
+
+    def test_invalidate_scope_borra_versiones_viejas(self, tmp_path):
+        cache = make_cache(tmp_path)
+        cache.set("old", VALUE, scope="0101", version="v1")
+        cache.set("otro", VALUE, scope="0604", version="v1")
+
+        assert cache.invalidate_scope("0101", "v2") == 1
+        assert cache.get("old") is None
+        assert cache.get("otro") == VALUE
+        # misma versión: no vuelve a tocar la BD
+        assert cache.invalidate_scope("0101", "v2") == 0
+
+
+class TestPromptVersion:
+
+    def test_cambia_con_el_prompt_y_con_la_parametrizacion(self):
+        prompt = SimpleNamespace(co_prompt=1, de_promp="EXTRAE {{contenido}}")
+        servicio = SimpleNamespace(de_servicio="COMPRA VENTA", min_otorgante=1, min_otro=0)
+
+        v1 = build_prompt_version(prompt, servicio)
+        assert v1 == build_prompt_version(prompt, servicio)
+
+        prompt.de_promp = "EXTRAE MEJOR {{contenido}}"
+        v2 = build_prompt_version(prompt, servicio)
+        assert v2 != v1
+
+        servicio.min_otro = 1
+        assert build_prompt_version(prompt, servicio) != v2
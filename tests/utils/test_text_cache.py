@@ -0,0 +1,113 @@
+# tests/utils/test_text_cache.py
+"""
+Unit tests para DocumentTextCache (memoria + disco) y read_document.
+No requieren BD ni OpenAI.
+Ejecutar: python -m pytest tests/utils/test_text_cache.py -v
+"""
+import sys
+import os
+import asyncio
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.utils.cache import DocumentTextCache, sha256_hex
+from app.utils import ingestion
+
+
+class FakeUpload:
+    """Simula el UploadFile de FastAPI (solo lo que usa read_document)."""
+    def __init__(self, data: bytes, content_type: str = "application/pdf"):
+        self.data = data
+        self.content_type = content_type
+
+    async def read(self):
+        return self.data
+
+
+class TestDocumentTextCache:
+
+    def test_miss_y_luego_hit_en_memoria(self):
+        cache = DocumentTextCache(max_items=4)
+        key = sha256_hex(b"minuta")
+
+        assert cache.get(key) is None
+        cache.set(key, "TEXTO")
+        assert cache.get(key) == "TEXTO"
+
+        stats = cache.stats()
+        assert stats["misses"] == 1
+        assert stats["memory_hits"] == 1
+        assert stats["disk_enabled"] is False
+
+    def test_lru_en_memoria_descarta_el_menos_usado(self):
+        cache = DocumentTextCache(max_items=2)
+        cache.set("a", "A")
+        cache.set("b", "B")
+        cache.get("a")
+        cache.set("c", "C")
+
+        assert cache.memory.get("b") is None
+        assert cache.memory.get("a") == "A"
+
+    def test_nivel_disco_sobrevive_a_otro_proceso(self, tmp_path):
+        key = sha256_hex(b"docx")
+        DocumentTextCache(max_items=2, disk_dir=str(tmp_path)).set(key, "DESDE DISCO")
+
+        otro = DocumentTextCache(max_items=2, disk_dir=str(tmp_path))
+        assert otro.get(key) == "DESDE DISCO"
+        assert otro.stats()["disk_hits"] == 1
+        # promovido a memoria
+        assert otro.get(key) == "DESDE DISCO"
+        assert otro.stats()["memory_hits"] == 1
+
+    def test_evicccion_por_tamano_en_disco(self, tmp_path):
+        cache = DocumentTextCache(max_items=1, disk_dir=str(tmp_path), max_disk_bytes=250)
+        for i in range(5):
+            cache.set(sha256_hex(str(i).encode()), "X" * 100)
+
+        stats = cache.stats()
+        assert stats["disk_bytes"] <= 250
+        assert stats["disk_evictions"] >= 1
+
+    def test_reescribir_no_duplica_el_tamano_en_disco(self, tmp_path):
+        cache = DocumentTextCache(max_items=1, disk_dir=str(tmp_path))
+        key = sha256_hex(b"a")
+        cache.set(key, "X" * 100)
+        cache.set(key, "X" * 100)
+        cache.set(key, "X" * 40)
+        assert cache.stats()["disk_bytes"] == 40
+
+    def test_aget_aset_usan_el_disco_desde_un_hilo(self, tmp_path):
+        import threading
+
+        hilos = []
+        cache = DocumentTextCache(max_items=1, disk_dir=str(tmp_path))
+        original = cache._disk_set
+        cache._disk_set = lambda *a: (hilos.append(threading.current_thread()), original(*a))
+        key = sha256_hex(b"docx")
+
+        async def scenario():
+            await cache.aset(key, "TEXTO")
+            cache.memory.clear()
+            return await cache.aget(key), threading.current_thread()
+
+        text, loop_thread = asyncio.run(scenario())
+        assert text == "TEXTO" and cache.stats()["disk_hits"] == 1
+        assert hilos and hilos[0] is not loop_thread
+
+
+class TestReadDocument:
+
+    def test_no_reparsea_el_mismo_archivo(self):
+        cache = DocumentTextCache(max_items=4)
+        with patch.object(ingestion, "text_cache", cache), \
+             patch.object(ingestion, "extract_text_from_bytes", return_value="TEXTO PDF") as parser:
+            d1 = asyncio.run(ingestion.read_document(FakeUpload(b"%PDF-1")))
+            d2 = asyncio.run(ingestion.read_document(FakeUpload(b"%PDF-1")))
+
+        assert parser.call_count == 1
+        assert d1.cache_hit is False and d2.cache_hit is True
+        assert d1.sha256 == d2.sha256 == sha256_hex(b"%PDF-1")
+        assert d2.text == "TEXTO PDF"
+        assert d2.raw == b"%PDF-1"
@@ -0,0 +1,60 @@
+# tests/utils/test_uploads.py
+"""
+Unit tests para store_upload: una sola lectura de la subida, hash y
+escritura por bloques, límite de tamaño sin dejar archivos a medias.
+Ejecutar: python -m pytest tests/utils/test_uploads.py -v
+"""
+import sys
+import os
+import io
+import asyncio
+import hashlib
+
+import pytest
+from fastapi import HTTPException
+from starlette.datastructures import UploadFile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.utils.uploads import store_upload
+
+DATA = os.urandom(300_000)
+
+
+class CountingIO(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def upload(data=DATA):
+    raw = CountingIO(data)
+    return UploadFile(file=raw, filename="v.jpg"), raw
+
+
+class TestStoreUpload:
+
+    def test_escribe_hashea_y_devuelve_el_mismo_buffer(self, tmp_path):
+        file, raw = upload()
+        dest = tmp_path / "sub" / "v.jpg"
+        stored = asyncio.run(store_upload(file, str(dest), max_bytes=10**6, chunk_size=64 * 1024))
+        assert dest.read_bytes() == DATA
+        assert stored.content == DATA and stored.size == len(DATA)
+        assert stored.sha256 == hashlib.sha256(DATA).hexdigest()
+        # la subida se recorre una sola vez
+        assert raw.bytes_read == len(DATA)
+
+    def test_supera_el_maximo_413_sin_archivos(self, tmp_path):
+        file, raw = upload()
+        dest = tmp_path / "v.jpg"
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(store_upload(file, str(dest), max_bytes=100_000, chunk_size=64 * 1024))
+        assert exc.value.status_code == 413
+        assert list(tmp_path.iterdir()) == []
+        # corta la lectura al pasar el límite, no lee todo
+        assert raw.bytes_read < len(DATA)
@@ -0,0 +1,89 @@
+# tests/utils/test_vision_image.py
+"""
+Unit tests para el preprocesado de imágenes antes de la llamada de visión
+(orientación EXIF, reducción, recompresión, detail adaptativo).
+Ejecutar: python -m pytest tests/utils/test_vision_image.py -v
+"""
+import sys
+import os
+import io
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.utils.vision_image import estimate_image_tokens, prepare_for_vision
+
+
+def photo(size=(4000, 3000), fmt="JPEG", orientation=None, mode="RGB") -> bytes:
+    # ruido: se comprime como una foto real, no como un color plano
+    img = Image.effect_noise(size, 64).convert(mode)
+    out = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    img.save(out, format=fmt, quality=95, exif=exif.tobytes())
+    return out.getvalue()
+
+
+def size_of(data: bytes):
+    with Image.open(io.BytesIO(data)) as img:
+        return img.size
+
+
+class TestEstimacion:
+
+    def test_low_es_fijo(self):
+        assert estimate_image_tokens(4000, 3000, "low") == 85
+
+    def test_high_por_tiles(self):
+        # 4000x3000 -> 2048x1536 -> 1024x768 -> 2x2 tiles
+        assert estimate_image_tokens(4000, 3000) == 170 * 4 + 85
+        assert estimate_image_tokens(512, 512) == 170 + 85
+
+
+class TestPrepare:
+
+    def test_reduce_y_recomprime(self):
+        raw = photo()
+        img = prepare_for_vision(raw, max_side=1600)
+        assert max(size_of(img.data)) == 1600
+        assert img.bytes_enviados < img.bytes_original == len(raw)
+        assert img.mime == "image/jpeg"
+        assert img.data_url().startswith("data:image/jpeg;base64,")
+
+    def test_orientacion_exif(self):
+        img = prepare_for_vision(photo(size=(1200, 800), orientation=6), max_side=1600)
+        w, h = size_of(img.data)
+        assert h > w
+
+    def test_detail_adaptativo(self):
+        assert prepare_for_vision(photo(size=(400, 300)), detail="auto").detail == "low"
+        grande = prepare_for_vision(photo(), detail="auto")
+        assert grande.detail == "high"
+        assert grande.tokens_enviados <= grande.tokens_original
+        assert prepare_for_vision(photo(), detail="low").tokens_enviados == 85
+
+    def test_png_con_alfa_a_webp(self):
+        img = prepare_for_vision(photo(size=(800, 600), fmt="PNG", mode="RGBA"), fmt="WEBP")
+        assert img.mime == "image/webp"
+        with Image.open(io.BytesIO(img.data)) as out:
+            assert out.format == "WEBP"
+
+    def test_imagen_pequena_ya_comprimida_no_se_toca(self):
+        small = io.BytesIO()
+        Image.effect_noise((300, 200), 64).convert("RGB").save(small, format="JPEG", quality=30)
+        raw = small.getvalue()
+        assert prepare_for_vision(raw, quality=95).data == raw
+
+    def test_no_imagen_se_envia_igual(self):
+        img = prepare_for_vision(b"%PDF-1.4 ...", fallback_mime="image/pdf")
+        assert img.data == b"%PDF-1.4 ..." and img.mime == "image/pdf"
+        assert img.tokens_original is None
+
+    def test_parametros_invalidos(self):
+        with pytest.raises(ValueError):
+            prepare_for_vision(photo(size=(10, 10)), fmt="GIF")
+        with pytest.raises(ValueError):
+            prepare_for_vision(photo(size=(10, 10)), detail="ultra")